@@ -0,0 +1,86 @@
+"""
+Benchmark of the startup time of the `xn` command.
+
+Usage:
+    python -m benchmarks.bench_cli
+"""
+
+
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+from tempfile import mkdtemp
+import time
+
+
+# common commands and their startup time budgets in seconds
+COMMANDS = [
+    (['--help'], 0.15),
+    (['status'], 0.3),
+    (['log'], 0.3),
+]
+NUM_TRIALS = 5
+
+# modules which must not be loaded by the common commands
+HEAVY_MODULES = ('matplotlib', 'PIL', 'numpy')
+
+
+def measure_startup(args: list, work_dir: str) -> float:
+    """Measure the wall time of the command."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'expnote.cli.main'] + args,
+                   cwd=work_dir, env=_make_env(), check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def find_heavy_modules(args: list, work_dir: str) -> list:
+    """List heavy modules loaded by the command."""
+    code = '\n'.join([
+        'import sys',
+        'from expnote.cli.main import COMMANDS, SubcommandExecutor',
+        'try:',
+        '    SubcommandExecutor(COMMANDS)({})'.format(args),
+        'except SystemExit:',
+        '    pass',
+        'print(" ".join(sys.modules), file=sys.stderr)',
+    ])
+    proc = subprocess.run([sys.executable, '-c', code], cwd=work_dir,
+                          env=_make_env(), capture_output=True, text=True,
+                          check=True)
+    loaded = proc.stderr.split()
+    return [name for name in HEAVY_MODULES
+            if any(m == name or m.startswith(name + '.') for m in loaded)]
+
+
+def _make_env() -> dict:
+    package_root = Path(__file__).resolve().parents[1]
+    return dict(os.environ, PYTHONPATH=str(package_root))
+
+
+def main() -> int:
+    work_dir = mkdtemp()
+    try:
+        subprocess.run([sys.executable, '-m', 'expnote.cli.main', 'init'],
+                       cwd=work_dir, env=_make_env(), check=True,
+                       stdout=subprocess.DEVNULL)
+        ok = True
+        for args, budget in COMMANDS:
+            elapsed = min(measure_startup(args, work_dir)
+                          for _ in range(NUM_TRIALS))
+            heavy_modules = find_heavy_modules(args, work_dir)
+            print('xn {:<8}: {:8.1f} ms (budget: {:.1f} ms)'.format(
+                ' '.join(args), elapsed * 1e3, budget * 1e3))
+            if heavy_modules:
+                print('  heavy modules loaded: {}'.format(
+                    ', '.join(heavy_modules)))
+            ok = ok and elapsed < budget and not heavy_modules
+    finally:
+        shutil.rmtree(work_dir)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
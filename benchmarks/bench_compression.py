@@ -0,0 +1,80 @@
+"""
+Benchmark of the read/write throughput of compressed objects.
+
+Usage:
+    python -m benchmarks.bench_compression
+"""
+
+
+import json
+import os
+import shutil
+import sys
+from tempfile import mkdtemp
+import time
+
+from expnote.repository.compression import CODECS
+from expnote.repository.compression import get_codec
+from expnote.repository.file_storage import FileStorage
+from expnote.step_metrics import StepMetrics
+
+
+NUM_STEPS = 10000
+NUM_OBJECTS = 20
+
+
+def make_content() -> str:
+    """Make a step log content of a typical run."""
+    step_metrics = StepMetrics(
+        {'epoch': i // 100, 'iteration': i, 'loss': 1. / (i + 1),
+         'acc': i / NUM_STEPS, 'lr': 0.1 * 0.99 ** (i // 100)}
+        for i in range(NUM_STEPS))
+    return json.dumps(step_metrics.to_dict()) + '\n'
+
+
+def measure(storage: FileStorage, content: str) -> tuple:
+    """Measure write/read throughput (MB/s of plain data) and the size."""
+    size = len(content.encode())
+    start = time.perf_counter()
+    for i in range(NUM_OBJECTS):
+        storage.save(content, 'runs/{}'.format(i))
+    write = size * NUM_OBJECTS / (time.perf_counter() - start) / 1e6
+
+    start = time.perf_counter()
+    for i in range(NUM_OBJECTS):
+        assert len(storage.get('runs/{}'.format(i))) == len(content)
+    read = size * NUM_OBJECTS / (time.perf_counter() - start) / 1e6
+
+    stored = (storage.root / 'runs' / '0').stat().st_size
+    return write, read, size / stored
+
+
+def main() -> int:
+    content = make_content()
+    org_dir = os.getcwd()
+    work_dir = mkdtemp()
+    ratios = {}
+    try:
+        os.chdir(work_dir)
+        storage = FileStorage.initialize()
+        for codec in (None,) + CODECS:
+            if codec is not None:
+                try:
+                    get_codec(codec)
+                except ValueError as e:
+                    print('{:<5}: skipped ({})'.format(codec, e))
+                    continue
+            storage.save_config(dict(storage.config, compression=codec))
+            write, read, ratio = measure(storage, content)
+            ratios[codec] = ratio
+            print('{:<5}: write {:8.1f} MB/s, read {:8.1f} MB/s, '
+                  'ratio {:5.1f}x'.format(str(codec), write, read, ratio))
+    finally:
+        os.chdir(org_dir)
+        shutil.rmtree(work_dir)
+    # step logs should be compressed well
+    return 0 if ratios['zlib'] > 3 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Benchmark of the import time of the recording API.
+
+Usage:
+    python -m benchmarks.bench_import
+"""
+
+
+import subprocess
+import sys
+
+
+STATEMENT = 'from expnote.recording import Recorder'
+TARGET_MODULE = 'expnote.recording'
+BUDGET_SEC = 0.15
+NUM_TRIALS = 5
+
+# modules which must not be loaded by the recording API
+HEAVY_MODULES = ('PIL', 'filelock', 'matplotlib', 'numpy', 'asyncio')
+
+
+def measure_import_time() -> float:
+    """Measure the cumulative import time of the target module."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STATEMENT],
+        capture_output=True, text=True, check=True)
+
+    # line format: "import time: <self us> | <cumulative us> | <name>"
+    for line in proc.stderr.splitlines():
+        elems = [e.strip() for e in line.split('|')]
+        if len(elems) == 3 and elems[2] == TARGET_MODULE:
+            return int(elems[1]) * 1e-6
+    raise RuntimeError('Import time of {} not found'.format(TARGET_MODULE))
+
+
+def find_heavy_modules() -> list:
+    """List heavy modules loaded by the import statement."""
+    code = '{}; import sys; print(" ".join(sys.modules))'.format(STATEMENT)
+    proc = subprocess.run([sys.executable, '-c', code],
+                          capture_output=True, text=True, check=True)
+    loaded = proc.stdout.split()
+    return [name for name in HEAVY_MODULES
+            if any(m == name or m.startswith(name + '.') for m in loaded)]
+
+
+def main() -> int:
+    elapsed = min(measure_import_time() for _ in range(NUM_TRIALS))
+    print('{}: {:8.1f} ms (budget: {:.1f} ms)'.format(
+        STATEMENT, elapsed * 1e3, BUDGET_SEC * 1e3))
+
+    heavy_modules = find_heavy_modules()
+    if heavy_modules:
+        print('heavy modules loaded: {}'.format(', '.join(heavy_modules)))
+
+    return 0 if elapsed < BUDGET_SEC and not heavy_modules else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
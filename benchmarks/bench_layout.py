@@ -0,0 +1,106 @@
+"""
+Benchmark of run creation and lookup in repositories with many runs.
+
+Usage:
+    python -m benchmarks.bench_layout [max runs (default: 100000)]
+
+e.g. `python -m benchmarks.bench_layout 1000000` to scale to 1M runs.
+"""
+
+
+import json
+import os
+import random
+import shutil
+import sys
+from tempfile import mkdtemp
+import time
+
+from expnote.run import Run
+from expnote.repository import Repository
+
+
+SIZES = (1000, 10000, 100000, 1000000)
+SAMPLE_CALLS = 200
+LAYOUTS = ('flat', 'fanout')
+
+
+def _run_id(i: int) -> str:
+    return '{:032x}'.format(random.Random(i).getrandbits(128))
+
+
+def populate(repo: Repository, start: int, stop: int) -> None:
+    """Add run files directly (the run index is not updated)."""
+    content = json.dumps({'id': '', 'params': {'lr': 0.1},
+                          'metrics': {'acc': 0.9}})
+    for i in range(start, stop):
+        run_id = _run_id(i)
+        file_path = repo._storage.root / repo._run_path(run_id)
+        try:
+            file_path.write_text(content)
+        except FileNotFoundError:
+            file_path.parent.mkdir(parents=True)
+            file_path.write_text(content)
+
+
+def measure(repo: Repository, num_runs: int) -> tuple:
+    """Measure the per-call cost of save_run and get_run."""
+    start = time.perf_counter()
+    for i in range(SAMPLE_CALLS):
+        repo.save_run(Run('new{}-{}'.format(num_runs, i), params={},
+                          metrics={}))
+    create = (time.perf_counter() - start) / SAMPLE_CALLS
+
+    run_ids = [_run_id(random.randrange(num_runs))
+               for _ in range(SAMPLE_CALLS)]
+    start = time.perf_counter()
+    for run_id in run_ids:
+        repo.get_run(run_id)
+    lookup = (time.perf_counter() - start) / SAMPLE_CALLS
+    return create, lookup
+
+
+def run_layout(layout: str, sizes: list) -> list:
+    """Measure the costs in a repository of the layout."""
+    org_dir = os.getcwd()
+    work_dir = mkdtemp()
+    results = []
+    try:
+        os.chdir(work_dir)
+        repo = Repository.initialize()
+        repo._storage.save_config({'layout': layout})
+        repo = Repository()
+        num_runs = 0
+        for size in sizes:
+            populate(repo, num_runs, size)
+            num_runs = size
+            create, lookup = measure(repo, num_runs)
+            results.append((create, lookup))
+            print('{:<6} {:>8} runs: create {:8.1f} us, lookup {:8.1f} us'
+                  .format(layout, num_runs, create * 1e6, lookup * 1e6))
+    finally:
+        os.chdir(org_dir)
+        shutil.rmtree(work_dir)
+    return results
+
+
+def main() -> int:
+    max_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    sizes = [size for size in SIZES if size <= max_runs]
+
+    ok = True
+    for layout in LAYOUTS:
+        results = run_layout(layout, sizes)
+        create_ratio = results[-1][0] / results[0][0]
+        lookup_ratio = results[-1][1] / results[0][1]
+        print('{:<6} cost ratio ({} / {} runs): create {:.2f}, lookup {:.2f}'
+              .format(layout, sizes[-1], sizes[0], create_ratio,
+                      lookup_ratio))
+        if layout == 'fanout':
+            # costs should stay flat (allow noise of the file system cache)
+            ok = create_ratio < 3 and lookup_ratio < 3
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Benchmark of step metrics recording in Memory.
+
+Usage:
+    python -m benchmarks.bench_memory
+"""
+
+
+import sys
+import time
+
+from expnote.recording.memory import Memory
+
+
+SIZES = (1000, 10000, 100000, 1000000)
+SAMPLE_CALLS = 1000
+
+
+def measure_per_call(num_steps: int) -> float:
+    """Measure the per-call cost of set_metrics after num_steps steps."""
+    mem = Memory(run_id='bench')
+    for i in range(num_steps):
+        mem.set_metrics({'loss': 1.0, 'acc': 0.5}, step=(i, 'iteration'))
+
+    # update old steps and add new steps
+    start = time.perf_counter()
+    for i in range(SAMPLE_CALLS):
+        mem.set_metrics({'val_loss': 1.0}, step=(i * 7, 'iteration'))
+        mem.set_metrics({'loss': 1.0}, step=(num_steps + i, 'iteration'))
+    elapsed = time.perf_counter() - start
+    return elapsed / (SAMPLE_CALLS * 2)
+
+
+def measure_batch(num_steps: int) -> float:
+    """Measure the per-step cost of set_metrics_batch."""
+    mem = Memory(run_id='bench')
+    steps = list(range(num_steps))
+    values = [1.0] * num_steps
+    start = time.perf_counter()
+    mem.set_metrics_batch({'loss': values, 'acc': values},
+                          steps=(steps, 'iteration'))
+    elapsed = time.perf_counter() - start
+    return elapsed / num_steps
+
+
+def main() -> int:
+    results = []
+    for num_steps in SIZES:
+        per_call = measure_per_call(num_steps)
+        results.append(per_call)
+        print('{:>8} steps: {:8.3f} us/call'.format(num_steps, per_call * 1e6))
+
+    per_step = measure_batch(SIZES[-1])
+    print('batch of {} steps: {:8.3f} us/step'.format(
+        SIZES[-1], per_step * 1e6))
+
+    ratio = results[-1] / results[0]
+    print('cost ratio ({} / {} steps): {:.2f}'.format(
+        SIZES[-1], SIZES[0], ratio))
+    # per-call cost should stay flat (allow noise of memory allocation)
+    return 0 if ratio < 5 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,7 @@ import json
 import os
 import sys
 from typing import Optional
+from typing import Tuple
 
 from expnote.run import Run
 from expnote.note import Note
@@ -53,22 +54,33 @@ def _get_repo() -> Repository:
     return repo
 
 
-def _get_run(repo: Repository, run_id: str) -> Optional[Run]:
-    """Get run from id."""
-    found = repo.find_runs(run_id)
+def _resolve_run_id(repo: Repository, run_id: str) -> Optional[str]:
+    """Get the full run id from a prefix of the id."""
+    found = repo.find_run_ids(run_id)
     if not found:
         print('No run record found for the id: {}'.format(run_id))
         return
 
     elif len(found) > 1:
         print('Multiple runs are found for the id: {}'.format(run_id))
-        for i, run in enumerate(found):
-            print('{}: {}'.format(i + 1, run))
+        for i, full_run_id in enumerate(found):
+            print('{}: {}'.format(i + 1, full_run_id))
         return
 
     return found[0]
 
 
+def _get_run(repo: Repository, run_id: str) -> Optional[Run]:
+    """Get run from id."""
+    full_run_id = _resolve_run_id(repo, run_id)
+    if full_run_id is None:
+        return
+    try:
+        return repo.get_run(full_run_id)
+    except KeyError:
+        print('No run record found for the id: {}'.format(run_id))
+
+
 def _get_uncommitted_experiment_id(workspace: Workspace,
                                    exp_id: Optional[str] = None,
                                    option: str = '--id',
@@ -131,10 +143,10 @@ class AddCmd:
         repo = _get_repo()
         full_run_ids = []
         for run_id in args.run_ids:
-            run_or_none = _get_run(repo, run_id)
-            if run_or_none is None:
+            full_run_id = _resolve_run_id(repo, run_id)
+            if full_run_id is None:
                 return
-            full_run_ids.append(run_or_none.id)
+            full_run_ids.append(full_run_id)
 
         with repo.open_workspace() as workspace:
             # determine target experiment
@@ -155,12 +167,16 @@ class StatusCmd:
     def __call__(self, args: Namespace) -> None:
         repo = _get_repo()
 
+        for run_id in repo.recover_runs():
+            print('Recovered an interrupted run (id={})'.format(run_id))
+
         with repo.open_workspace() as ws:
             untracked_run_ids = ws.untracked_runs
             uncommitted_experiment_ids = ws.uncommitted_experiments
             assigned_runs = ws.assigned_runs
 
-        untracked_runs = [repo.get_run(run_id)
+        # step metrics are not needed to show the tables
+        untracked_runs = [repo.get_run(run_id, include_step_metrics=False)
                           for run_id in untracked_run_ids]
         experiments = [repo.get_experiment(exp_id)
                        for exp_id in uncommitted_experiment_ids]
@@ -169,7 +185,8 @@ class StatusCmd:
             print(f'- purpose: {exp.purpose}')
             print(f'- conclusion: {exp.conclusion}\n')
             run_ids = assigned_runs[exp.id]
-            runs = [repo.get_run(run_id) for run_id in run_ids]
+            runs = [repo.get_run(run_id, include_step_metrics=False)
+                    for run_id in run_ids]
             print(str(compare_runs(runs, grouping=False)) + '\n')
             notes = [note for note in exp.notes if type(note) == Note]
             if notes:
@@ -203,10 +220,10 @@ class RmCmd:
         repo = _get_repo()
         full_run_ids = []
         for run_id in args.run_ids:
-            run_or_none = _get_run(repo, run_id)
-            if run_or_none is None:
+            full_run_id = _resolve_run_id(repo, run_id)
+            if full_run_id is None:
                 return
-            full_run_ids.append(run_or_none.id)
+            full_run_ids.append(full_run_id)
 
         with repo.open_workspace() as workspace:
             for run_id in full_run_ids:
@@ -226,7 +243,11 @@ class ShowCmd:
         repo = _get_repo()
         run_or_none = _get_run(repo, args.run_id)
         if run_or_none is not None:
-            print(json.dumps(asdict(run_or_none), indent=2))
+            data = asdict(run_or_none)
+            for key in ('step_metrics', 'system_metrics'):
+                if data[key] is not None:
+                    data[key] = data[key].tolist()
+            print(json.dumps(data, indent=2))
 
 
 
@@ -335,3 +356,246 @@ class EditCmd:
             exp.conclusion = args.conclusion
 
         repo.save_experiment(exp)
+
+
+def _load_function(target: str) -> callable:
+    """Load a function from "path/to/script.py:func" or "module:func"."""
+    import importlib
+    import importlib.util
+
+    module_name, func_name = target.rsplit(':', 1)
+    if module_name.endswith('.py'):
+        path = os.path.abspath(module_name)
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        # registered to be picklable in worker processes
+        sys.modules[module_name] = module
+        sys.path.insert(0, os.path.dirname(path))
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def _parse_param(spec: str) -> Tuple[str, list]:
+    """Parse "name=value1,value2,..." (values are parsed as JSON if possible).
+    """
+    name, values = spec.split('=', 1)
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except json.JSONDecodeError:
+            parsed.append(value)
+    return name, parsed
+
+
+class SweepCmd:
+    """Record runs of a function over a parameter grid."""
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        parser.add_argument('target', type=str,
+                            help=('A function to be called '
+                                  '(e.g. train.py:main, package.module:main). '
+                                  'Parameters are given as keyword arguments.'))
+        parser.add_argument('--param', '-p', type=str, action='append',
+                            default=[],
+                            help='Parameter values (e.g. lr=0.1,0.01).')
+        parser.add_argument('--random', type=int, default=None,
+                            help=('The number of parameter sets sampled '
+                                  'randomly instead of the grid search.'))
+        parser.add_argument('--seed', type=int, default=None,
+                            help='A random seed for the random search.')
+        parser.add_argument('--workers', '-j', type=int, default=1,
+                            help='The number of worker processes.')
+        parser.add_argument('--experiment', '-e', type=str, default=None,
+                            help=('Title of a new experiment to which all '
+                                  'the runs are assigned.'))
+        parser.add_argument('--skip-existing', action='store_true',
+                            help=('Skip parameter sets of completed runs '
+                                  '(the runs are assigned to the experiment).'))
+
+    def __call__(self, args: Namespace) -> None:
+        from expnote.recording import Recorder
+        from expnote.recording.sweep import grid
+        from expnote.recording.sweep import random_search
+
+        repo = _get_repo()
+        func = _load_function(args.target)
+        space = dict(_parse_param(spec) for spec in args.param)
+        if args.random is None:
+            params_list = grid(space)
+        else:
+            params_list = random_search(space, args.random, seed=args.seed)
+
+        experiment = None
+        if args.experiment is not None:
+            experiment = Experiment(title=args.experiment)
+
+        recorder = Recorder(repo=repo)
+        results = recorder.sweep(func, params_list, workers=args.workers,
+                                 experiment=experiment,
+                                 skip_if_exists=args.skip_existing)
+
+        for result in results:
+            if result.skipped:
+                status = 'skipped'
+            elif result.error is None:
+                status = 'complete'
+            else:
+                status = 'failed ({})'.format(result.error)
+            print('{} {}: {}'.format(result.run_id, result.params, status))
+        num_failed = sum(result.error is not None for result in results)
+        num_skipped = sum(result.skipped for result in results)
+        print('Recorded {} runs ({} failed)'.format(
+            len(results) - num_skipped, num_failed))
+        if num_skipped:
+            print('Skipped {} runs recorded already'.format(num_skipped))
+        if experiment is not None:
+            print('Add a new experiment (id={}, title="{}")'.format(
+                experiment.id, experiment.title))
+
+
+def _format_location(entry: dict) -> str:
+    """Format a location in a profile like `pstats`."""
+    location = '{}:{}'.format(os.path.basename(entry['file']), entry['line'])
+    if 'function' in entry:
+        location += '({})'.format(entry['function'])
+    return location
+
+
+class ProfileCmd:
+    """Display the hottest functions in the profile of a run."""
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        parser.add_argument('run_id', type=str, help='Run ID.')
+        parser.add_argument('--name', type=str, default='profile',
+                            help='Artifact name of the profile.')
+        parser.add_argument('--num', '-n', type=int, default=20,
+                            help='The number of functions to be displayed.')
+        parser.add_argument('--sort', type=str, default='self',
+                            choices=('self', 'total'),
+                            help='Sort functions by self or total time.')
+
+    def __call__(self, args: Namespace) -> None:
+        repo = _get_repo()
+        run_or_none = _get_run(repo, args.run_id)
+        if run_or_none is None:
+            return
+        artifacts = run_or_none.artifacts or {}
+        if args.name not in artifacts:
+            print('No profile named {} in the run {}.'.format(
+                args.name, run_or_none.id))
+            if artifacts:
+                print('Artifacts: {}'.format(', '.join(sorted(artifacts))))
+            return
+        profile = json.loads(repo.get_blob(artifacts[args.name]['digest']))
+
+        functions = sorted(profile['functions'],
+                           key=lambda f: f[args.sort + '_time'],
+                           reverse=True)[:args.num]
+        print(Table(
+            columns=['function', 'calls', 'self_time', 'total_time'],
+            rows=[[_format_location(f), f['calls'],
+                   '{:.4f}'.format(f['self_time']),
+                   '{:.4f}'.format(f['total_time'])] for f in functions],
+            title='CPU ({}, {:.3f} sec)'.format(profile['mode'],
+                                                profile['duration']),
+        ))
+        if profile.get('allocations'):
+            print()
+            print(Table(
+                columns=['location', 'size', 'count'],
+                rows=[[_format_location(a), a['size'], a['count']]
+                      for a in profile['allocations']],
+                title='Memory',
+            ))
+
+
+class DaemonCmd:
+    """Run a daemon to record runs streamed from recorders."""
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        parser.add_argument('--flush-interval', type=float, default=1.,
+                            help='Interval in seconds to flush updated runs.')
+
+    def __call__(self, args: Namespace) -> None:
+        from expnote.recording.daemon import RecordingDaemon
+
+        repo = _get_repo()
+        daemon = RecordingDaemon(repo, flush_interval=args.flush_interval)
+        try:
+            daemon.start()
+        except RuntimeError as e:
+            print(e)
+            return
+
+        print('Listening on {} (press Ctrl+C to stop)'.format(
+            daemon.socket_path))
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.close()
+
+
+class MigrateCmd:
+    """Migrate the repository to a directory layout of run files."""
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        parser.add_argument('--layout', choices=['fanout', 'flat'],
+                            default='fanout',
+                            help='Directory layout of run files.')
+
+    def __call__(self, args: Namespace) -> None:
+        repo = _get_repo()
+        num_moved = repo.migrate_layout(args.layout)
+        print('Moved {} files to the {} layout'.format(num_moved,
+                                                      args.layout))
+
+
+class PackCmd:
+    """Pack the runs of committed experiments into a pack file."""
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        pass
+
+    def __call__(self, args: Namespace) -> None:
+        repo = _get_repo()
+        with repo.open_workspace() as workspace:
+            uncommitted_ids = workspace.uncommitted_experiments
+
+        run_ids = []
+        for exp in repo.find_experiments():
+            if exp.id not in uncommitted_ids and exp.run_ids:
+                run_ids += exp.run_ids
+        num_packed = repo.pack_runs(run_ids)
+        if num_packed == 0:
+            print('No runs to be packed.')
+        else:
+            print('Packed {} files of committed runs'.format(num_packed))
+
+
+class CompressCmd:
+    """Set the compression codec of the repository and convert objects.
+
+    Recording processes and the daemon should be stopped while objects are
+    converted.
+    """
+
+    def __init__(self, parser: ArgumentParser) -> None:
+        from expnote.repository.compression import CODECS
+        parser.add_argument('codec', choices=CODECS + ('none',),
+                            help='Compression codec of stored objects.')
+
+    def __call__(self, args: Namespace) -> None:
+        repo = _get_repo()
+        codec = None if args.codec == 'none' else args.codec
+        try:
+            num_converted = repo.migrate_compression(codec)
+        except ValueError as e:
+            print(e)
+            return
+        print('Converted {} objects ({})'.format(num_converted, args.codec))
@@ -5,34 +5,33 @@ Entry point for CLI.
 
 from argparse import ArgumentParser
 from argparse import Namespace
+import importlib
+import sys
 from typing import List
 from typing import Optional
 from typing import Tuple
 from typing import Type
-
-from expnote.cli.commands import InitCmd
-from expnote.cli.commands import NewCmd
-from expnote.cli.commands import AddCmd
-from expnote.cli.commands import StatusCmd
-from expnote.cli.commands import ResetCmd
-from expnote.cli.commands import RmCmd
-from expnote.cli.commands import ShowCmd
-from expnote.cli.commands import CommitCmd
-from expnote.cli.commands import LogCmd
-from expnote.cli.commands import EditCmd
+from typing import Union
 
 
+# command classes are given as "module:class" to import them on demand
 COMMANDS = [
-    ('init', InitCmd),
-    ('new', NewCmd),
-    ('add', AddCmd),
-    ('status', StatusCmd),
-    ('reset', ResetCmd),
-    ('rm', RmCmd),
-    ('show', ShowCmd),
-    ('commit', CommitCmd),
-    ('log', LogCmd),
-    ('edit', EditCmd),
+    ('init', 'expnote.cli.commands:InitCmd'),
+    ('new', 'expnote.cli.commands:NewCmd'),
+    ('add', 'expnote.cli.commands:AddCmd'),
+    ('status', 'expnote.cli.commands:StatusCmd'),
+    ('reset', 'expnote.cli.commands:ResetCmd'),
+    ('rm', 'expnote.cli.commands:RmCmd'),
+    ('show', 'expnote.cli.commands:ShowCmd'),
+    ('commit', 'expnote.cli.commands:CommitCmd'),
+    ('log', 'expnote.cli.commands:LogCmd'),
+    ('edit', 'expnote.cli.commands:EditCmd'),
+    ('sweep', 'expnote.cli.commands:SweepCmd'),
+    ('daemon', 'expnote.cli.commands:DaemonCmd'),
+    ('profile', 'expnote.cli.commands:ProfileCmd'),
+    ('migrate', 'expnote.cli.commands:MigrateCmd'),
+    ('pack', 'expnote.cli.commands:PackCmd'),
+    ('compress', 'expnote.cli.commands:CompressCmd'),
 ]
 
 
@@ -48,23 +47,57 @@ class Command:
         raise NotImplementedError()
 
 
+CommandSpec = Union[Type[Command], str]
+
+
+def _load_command_class(spec: CommandSpec) -> Type[Command]:
+    """Get the command class (imported if given as "module:class")."""
+    if isinstance(spec, str):
+        module_name, class_name = spec.split(':')
+        return getattr(importlib.import_module(module_name), class_name)
+    return spec
+
+
 class SubcommandExecutor:
-    """Subcommand executor."""
+    """Subcommand executor.
 
-    def __init__(self, commands: List[Tuple[str, Type[Command]]]) -> None:
+    Commands are instantiated lazily, so that only the dependencies of the
+    executed subcommand are imported.
+    """
+
+    def __init__(self, commands: List[Tuple[str, CommandSpec]]) -> None:
         self.parser = ArgumentParser()
         self.commands = {}
 
+        self._command_specs = {}
         subparsers = self.parser.add_subparsers(dest='subcommand')
-        for cmd_name, cmd_class in commands:
+        for cmd_name, cmd_spec in commands:
             subparser = subparsers.add_parser(cmd_name)
+            self._command_specs[cmd_name] = (subparser, cmd_spec)
+
+    def _get_command(self, cmd_name: str) -> Command:
+        """Get the command instance (created at the first call)."""
+        if cmd_name not in self.commands:
+            subparser, cmd_spec = self._command_specs[cmd_name]
+            cmd_class = _load_command_class(cmd_spec)
             self.commands[cmd_name] = cmd_class(subparser)
+        return self.commands[cmd_name]
 
-    def __call__(self, args: Optional[str] = None) -> None:
+    def __call__(self, args: Optional[List[str]] = None) -> None:
         """Execute subcommands."""
+        if args is None:
+            args = sys.argv[1:]
+
+        # define arguments of the subcommand before parsing
+        # (the main parser has no positional arguments and no options
+        # with values, so the first positional one is the subcommand)
+        positionals = [arg for arg in args if not arg.startswith('-')]
+        if positionals and positionals[0] in self._command_specs:
+            self._get_command(positionals[0])
+
         args = self.parser.parse_args(args=args)
         if args.subcommand is not None:
-            self.commands[args.subcommand](args)
+            self._get_command(args.subcommand)(args)
         else:
             self.parser.print_help()
 
@@ -6,25 +6,33 @@ Implement functions to compare runs.
 import copy
 from functools import reduce
 from typing import Any
+from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
+from typing import Union
 
 from expnote.run import Run
 from expnote.run import RunGroup
+from expnote.step_metrics import StepMetrics
+from expnote.step_metrics import as_step_metrics
+from expnote.step_times import steps_per_sec
 from expnote.note import Table
 
 
+StepMetricsLike = Union[StepMetrics, List[dict]]
 DEFAULT_STEP_KEYS = ('epoch', 'epochs',
                      'step', 'steps',
                      'iteration', 'iterations', 'iter')
 
 
-def _determine_step_key(step_metrics_list: List[List[dict]]
+def _determine_step_key(step_metrics_list: List[StepMetricsLike]
                        ) -> Optional[str]:
     """Determine appropriate step name from step metrics data."""
 
-    keyset_list = [set(sm[0].keys()) for sm in step_metrics_list]
+    keyset_list = [set(as_step_metrics(sm).keys())
+                   for sm in step_metrics_list]
     common_keys = reduce(lambda s1, s2: s1 & s2, keyset_list)
 
     # find an available step key
@@ -36,6 +44,71 @@ def _determine_step_key(step_metrics_list: List[List[dict]]
     return None
 
 
+def _get_summaries(run: Union[Run, RunGroup]) -> Dict[str, dict]:
+    """Get step metric summaries of the run.
+
+    Summaries recorded with the run are used, and they are computed from
+    the step metrics only for runs recorded without summaries.
+    """
+    if run.summaries is not None:
+        return run.summaries
+    if run.step_metrics is None:
+        return {}
+    step_metrics = as_step_metrics(run.step_metrics)
+    return step_metrics.summarize(_determine_step_key([step_metrics]))
+
+
+def _average_summaries(summaries_list: List[Dict[str, dict]]
+                      ) -> Optional[Dict[str, dict]]:
+    """Average summaries of metrics recorded in all the runs."""
+    common_keys = reduce(lambda s1, s2: s1 & s2,
+                         [set(summaries) for summaries in summaries_list])
+    averaged = {}
+    for key in summaries_list[0]:
+        if not key in common_keys:
+            continue
+        averaged[key] = {}
+        for stat, value in summaries_list[0][key].items():
+            values = [summaries[key][stat] for summaries in summaries_list]
+            if len(values) > 1 and all(type(v) in (int, float)
+                                       for v in values):
+                averaged[key][stat] = sum(values) / len(values)
+            else:
+                averaged[key][stat] = value
+    return averaged or None
+
+
+def _get_timing(run: Union[Run, RunGroup]) -> dict:
+    """Get throughput and timing sections of the run.
+
+    Throughput is computed from the step timestamps for runs recorded
+    without timing.
+    """
+    if run.timing is not None:
+        return run.timing
+    throughput = steps_per_sec(getattr(run, 'step_times', None) or [])
+    if throughput is None:
+        return {}
+    return {'steps_per_sec': throughput}
+
+
+def _average_timings(timings: List[dict]) -> Optional[dict]:
+    """Average throughput and timing sections recorded in all the runs."""
+    averaged = {}
+    throughputs = [t.get('steps_per_sec') for t in timings]
+    if not None in throughputs:
+        averaged['steps_per_sec'] = sum(throughputs) / len(throughputs)
+    sections = [t.get('sections', {}) for t in timings]
+    common_names = reduce(lambda s1, s2: s1 & s2, [set(s) for s in sections])
+    if common_names:
+        averaged['sections'] = {
+            name: {stat: sum(s[name][stat] for s in sections) / len(sections)
+                   for stat in ('total', 'count')}
+            for name in sections[0] if name in common_names
+        }
+    return averaged or None
+
+
 def make_run_groups(runs: List[Run]) -> List[RunGroup]:
     """Compare run params and organize them into multiple run groups."""
 
@@ -74,27 +147,28 @@ def make_run_groups(runs: List[Run]) -> List[RunGroup]:
                              if run.step_metrics is not None]
         if step_metrics_list:
             step_key = _determine_step_key(step_metrics_list)
-            key_sets = [set(sm[0].keys()) for sm in step_metrics_list]
-            step_metrics_keys = reduce(lambda s1, s2: s1 & s2, key_sets)
             steps = {}
             for step_metrics in step_metrics_list:
-                for data in step_metrics:
-                    step = data[step_key]
-                    if not step in steps:
-                        steps[step] = {}
-                    for key, value in data.items():
+                step_metrics = as_step_metrics(step_metrics)
+                for key in step_metrics.keys():
+                    if key == step_key:
+                        continue
+                    for step, value in zip(*step_metrics.series(step_key, key)):
+                        if not step in steps:
+                            steps[step] = {}
                         if not key in steps[step]:
                             steps[step][key] = []
                         steps[step][key].append(value)
 
-            averaged_step_metrics = []
+            averaged_step_metrics = StepMetrics()
             for step, data in sorted(steps.items()):
-                averaged_step_metrics.append({step_key: step})
+                averaged_data = {} if step_key is None else {step_key: step}
                 for key, values in data.items():
                     if len(values) > 1:
-                        averaged_step_metrics[-1][key] = sum(values) / len(values)
+                        averaged_data[key] = sum(values) / len(values)
                     else:
-                        averaged_step_metrics[-1][key] = values[0]
+                        averaged_data[key] = values[0]
+                averaged_step_metrics.append(averaged_data)
         else:
             averaged_step_metrics = None
 
@@ -104,6 +178,9 @@ def make_run_groups(runs: List[Run]) -> List[RunGroup]:
             params=copy.deepcopy(group[0].params),
             metrics=averaged_metrics,
             step_metrics=averaged_step_metrics,
+            summaries=_average_summaries(
+                [_get_summaries(run) for run in group]),
+            timing=_average_timings([_get_timing(run) for run in group]),
         ))
 
     return ret
@@ -135,9 +212,25 @@ def _get_value(data: dict, key_path: Tuple[str, ...]) -> Any:
 
 def compare_runs(runs: List[Run],
                  grouping: bool = True,
-                 diff_only: bool = True
+                 diff_only: bool = True,
+                 summaries: Optional[Sequence[str]] = None,
+                 timing: bool = False,
                 ) -> Table:
-    """Compare runs and return as a table data."""
+    """Compare runs and return as a table data.
+
+    Args:
+        runs (list of Run): Runs to be compared.
+        grouping (bool, optional): If True, runs with the same params are
+            grouped and their metrics are averaged.
+        diff_only (bool, optional): If True, only params which differ
+            between runs are shown.
+        summaries (sequence of str, optional): Summary statistics of step
+            metrics shown as columns (e.g. `('min', 'last')`). Available
+            statistics are last, min, argmin, max, argmax, mean and count.
+        timing (bool, optional): If True, the throughput ('steps/sec') and
+            the total time of each timing section (e.g. 'time(data)') are
+            shown as columns.
+    """
     if grouping:
         runs = make_run_groups(runs)
 
@@ -160,16 +253,41 @@ def compare_runs(runs: List[Run],
     param_keys = tuple(param_variations.keys())
     metric_keys = tuple(metric_values.keys())
 
+    summary_keys = []
+    summaries_list = [_get_summaries(run) if summaries else {}
+                      for run in runs]
+    for run_summaries in summaries_list:
+        summary_keys += [k for k in run_summaries if not k in summary_keys]
+
+    timing_list = [_get_timing(run) if timing else {} for run in runs]
+    section_names = []
+    for run_timing in timing_list:
+        section_names += [k for k in run_timing.get('sections', {})
+                          if not k in section_names]
+
     columns = ['id']
     columns += ['.'.join(kp) for kp in param_keys]
     columns += ['.'.join(kp) for kp in metric_keys]
+    columns += ['{}({})'.format(stat, key) for key in summary_keys
+                for stat in summaries or []]
+    if timing:
+        columns += ['steps/sec']
+        columns += ['time({})'.format(name) for name in section_names]
     columns += ['comment']
 
     rows = []
-    for run in runs:
+    for run, run_summaries, run_timing in zip(runs, summaries_list,
+                                              timing_list):
         row = [str(run.id)]
         row += [_get_value(run.params, kp) for kp in param_keys]
         row += [_get_value(run.metrics, kp) for kp in metric_keys]
+        row += [run_summaries.get(key, {}).get(stat) for key in summary_keys
+                for stat in summaries or []]
+        if timing:
+            sections = run_timing.get('sections', {})
+            row += [run_timing.get('steps_per_sec')]
+            row += [sections.get(name, {}).get('total')
+                    for name in section_names]
         row += [None]
         rows.append(row)
 
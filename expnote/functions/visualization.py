@@ -5,19 +5,21 @@ Utility functions for visualization.
 
 from functools import reduce
 import io
+from typing import Any
 from typing import List
 from typing import Optional
 from typing import Tuple
 from typing import Union
 
-import matplotlib.pyplot as plt
-from PIL import Image
-
 from expnote.run import Run
 from expnote.run import RunGroup
+from expnote.step_metrics import StepMetrics
+from expnote.step_metrics import as_step_metrics
+from expnote.step_times import throughput_series
 from expnote.note import Figure
 
 
+StepMetricsLike = Union[StepMetrics, List[dict]]
 DEFAULT_STEP_KEYS = ('epoch', 'epochs',
                      'step', 'steps',
                      'iteration', 'iterations', 'iter')
@@ -28,13 +30,15 @@ DEFAULT_SUBSETS = {
     'eval': ('eval', 'evaluation'),
 }
 DEFAULT_SUBSET_SEPARATOR = ('/', '_', '-', ':')
+THROUGHPUT_KEY = 'steps/sec'
 
 
-def _determine_step_key(step_metrics_list: List[List[dict]]
+def _determine_step_key(step_metrics_list: List[StepMetricsLike]
                        ) -> Optional[str]:
     """Determine appropriate step name from step metrics data."""
 
-    keyset_list = [set(sm[0].keys()) for sm in step_metrics_list]
+    keyset_list = [set(as_step_metrics(sm).keys())
+                   for sm in step_metrics_list]
     common_keys = reduce(lambda s1, s2: s1 & s2, keyset_list)
 
     # find an available step key
@@ -66,7 +70,7 @@ def _split_subset_name(metric_name: str) -> Tuple[Optional[str], str]:
     return (None, metric_name)
 
 
-def _list_step_metrics(step_metrics_list: List[List[dict]],
+def _list_step_metrics(step_metrics_list: List[StepMetricsLike],
                        compare_subsets: bool = False,
                       ) -> List[Union[str, dict]]:
     """List all step metrics.
@@ -75,7 +79,7 @@ def _list_step_metrics(step_metrics_list: List[List[dict]],
     """
     metric_name_to_subsets = {}
     for step_metrics in step_metrics_list:
-        for metric_name in step_metrics[0].keys():
+        for metric_name in as_step_metrics(step_metrics).keys():
             if metric_name in DEFAULT_STEP_KEYS:
                 continue
             if compare_subsets:
@@ -97,18 +101,51 @@ def _list_step_metrics(step_metrics_list: List[List[dict]],
     return ret
 
 
+def _throughput_series(run: Union[Run, RunGroup],
+                       step_metrics: StepMetrics,
+                       step_key: Optional[str],
+                      ) -> Tuple[List[Any], List[float]]:
+    """Get (step, throughput) values from the step timestamps."""
+    times = getattr(run, 'step_times', None)
+    if not times:
+        return [], []
+    if step_key is None:
+        steps = list(range(len(step_metrics)))
+    else:
+        steps = step_metrics.column(step_key)
+    xs = []
+    ys = []
+    for step, value in zip(steps, throughput_series(times)):
+        if step is not None and value is not None:
+            xs.append(step)
+            ys.append(value)
+    return xs, ys
+
+
 def visualize_step_metrics(runs: List[Union[Run, RunGroup]],
                            compare_subsets: bool = True,
-                           ncols: int = 2
+                           ncols: int = 2,
+                           throughput: bool = False,
                           ) -> Figure:
-    """Visualize step metrics."""
+    """Visualize step metrics.
+
+    If `throughput` is True, steps/sec computed from the step timestamps
+    is also plotted.
+    """
+    # plotting libraries are imported on demand since they are slow to load
+    import matplotlib.pyplot as plt
+    from PIL import Image
+
     runs = [run for run in runs if run.step_metrics is not None]
     if not runs:
         raise ValueError('No run data with step metrics data.')
 
-    step_key = _determine_step_key([run.step_metrics for run in runs])
-    metric_keys = _list_step_metrics([run.step_metrics for run in runs],
+    step_metrics_list = [as_step_metrics(run.step_metrics) for run in runs]
+    step_key = _determine_step_key(step_metrics_list)
+    metric_keys = _list_step_metrics(step_metrics_list,
                                      compare_subsets=compare_subsets)
+    if throughput and any(getattr(run, 'step_times', None) for run in runs):
+        metric_keys.append(THROUGHPUT_KEY)
 
     nrows = len(metric_keys) // ncols
     if len(metric_keys) % ncols != 0:
@@ -122,8 +159,8 @@ def visualize_step_metrics(runs: List[Union[Run, RunGroup]],
     color_map = plt.get_cmap('tab10')
     line_styles = {'train': '--', 'val': '-', 'test': '-.', 'eval': '-.'}
 
-    for run_idx, run in enumerate(runs):
-        steps = [d[step_key] for d in run.step_metrics]
+    for run_idx, (run, step_metrics) in enumerate(zip(runs,
+                                                      step_metrics_list)):
         color = color_map(run_idx)
 
         for i in range(nrows):
@@ -142,9 +179,10 @@ def visualize_step_metrics(runs: List[Union[Run, RunGroup]],
                             _, common_name = _split_subset_name(metric_name)
                             axes[i, j].set_title(common_name)
 
-                        if not metric_name in run.step_metrics[0]:
+                        if not metric_name in step_metrics.keys():
                             continue
-                        values = [d[metric_name] for d in run.step_metrics]
+                        steps, values = step_metrics.series(step_key,
+                                                            metric_name)
                         axes[i, j].plot(steps,
                                         values,
                                         line_styles[subset],
@@ -154,7 +192,12 @@ def visualize_step_metrics(runs: List[Union[Run, RunGroup]],
                 else:
                     if run_idx == 0:
                         axes[i, j].set_title(metric_key)
-                    values = [d[metric_key] for d in run.step_metrics]
+                    if throughput and metric_key == THROUGHPUT_KEY:
+                        steps, values = _throughput_series(run, step_metrics,
+                                                           step_key)
+                    else:
+                        steps, values = step_metrics.series(step_key,
+                                                            metric_key)
                     axes[i, j].plot(steps,
                                     values,
                                     '-',
@@ -7,8 +7,10 @@ from dataclasses import dataclass
 from typing import List
 from typing import Any
 from typing import Optional
+from typing import TYPE_CHECKING
 
-from PIL import Image
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 @dataclass
@@ -46,7 +48,7 @@ class Table:
 @dataclass
 class Figure:
     """A figure data."""
-    image: Image.Image
+    image: 'Image.Image'
     note: Optional[str] = None
     title: Optional[str] = None
 
@@ -4,7 +4,19 @@ Helper objects to collect run metadata.
 
 
 import datetime
+import os
+import threading
+import time
+from typing import Dict
+from typing import Optional
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from expnote.recording.memory import add_time
+from expnote.recording.memory import get_current_memory
 from expnote.recording.memory import set_info
 
 
@@ -31,3 +43,120 @@ class RunInfoCollector:
             status = 'failed'
         set_info({'end_time': now.strftime(TIMESTAMP_FORMAT),
                   'status': status})
+
+
+def _read_rss() -> Optional[int]:
+    """Read the resident set size (bytes) of the current process."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _read_peak_rss() -> Optional[int]:
+    """Read the peak resident set size (bytes) of the current process."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+
+def _read_io_counters() -> Dict[str, int]:
+    """Read I/O counters (bytes) of the current process."""
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                if key in ('read_bytes', 'write_bytes'):
+                    counters[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+class ResourceCollector:
+    """System resource usage collector.
+
+    Resource usage of the process is sampled in a background thread every
+    `interval` seconds and stored as a time series in `system_metrics`
+    of the run. Each sample has the elapsed time (sec), CPU utilization
+    (%), RSS and peak RSS (bytes), I/O counters (bytes, if available) and
+    the wall time per step (sec) since the previous sample.
+    """
+
+    def __init__(self, interval: float = 10.) -> None:
+        self.interval = interval
+        self._memory = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def __enter__(self) -> 'ResourceCollector':
+        self._memory = get_current_memory()
+        self._start_time = time.monotonic()
+        self._last = (self._start_time, time.process_time(), self._steps())
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self._sample()
+
+    def _steps(self) -> int:
+        step_metrics = self._memory.step_metrics
+        return 0 if step_metrics is None else len(step_metrics)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        wall_time = time.monotonic()
+        cpu_time = time.process_time()
+        steps = self._steps()
+        last_wall_time, last_cpu_time, last_steps = self._last
+        self._last = (wall_time, cpu_time, steps)
+
+        elapsed = wall_time - last_wall_time
+        sample = {'time': wall_time - self._start_time}
+        if elapsed > 0:
+            sample['cpu_percent'] = 100. * (cpu_time - last_cpu_time) / elapsed
+        rss = _read_rss()
+        if rss is not None:
+            sample['rss'] = rss
+        peak_rss = _read_peak_rss()
+        if peak_rss is not None:
+            sample['peak_rss'] = peak_rss
+        sample.update(_read_io_counters())
+        sample['steps'] = steps
+        if steps > last_steps:
+            sample['sec_per_step'] = elapsed / (steps - last_steps)
+
+        self._memory.add_system_metrics(sample)
+
+
+class Timer:
+    """Timing section collector.
+
+    The elapsed time of the section is added to `timing` of the run, in
+    which the total time and the number of calls are kept for each section
+    name. A timer can be entered repeatedly (e.g. in a training loop).
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._start = None
+
+    def __enter__(self) -> 'Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        add_time(self.name, time.perf_counter() - self._start)
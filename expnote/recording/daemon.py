@@ -0,0 +1,353 @@
+"""
+A recording daemon to collect run data from many processes over a socket.
+
+Clients stream recording operations as framed messages (a 4-byte length
+followed by a JSON object) on a Unix domain socket. The daemon is the only
+writer to the repository: it batches the writes of all the runs and
+registers new runs to the workspace in one transaction.
+"""
+
+
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from typing import Iterator
+from typing import List
+from typing import Optional
+import warnings
+
+from expnote.repository import Repository
+from expnote.repository.wal import _to_json
+from expnote.recording.memory import Memory
+
+
+_HEADER = struct.Struct('>I')
+
+
+def encode_message(message: dict) -> bytes:
+    """Encode a message into a frame."""
+    payload = json.dumps(message, default=_to_json).encode()
+    return _HEADER.pack(len(payload)) + payload
+
+
+def decode_messages(buffer: bytearray) -> Iterator[dict]:
+    """Decode complete frames in the buffer (decoded bytes are removed)."""
+    offset = 0
+    while len(buffer) - offset >= _HEADER.size:
+        size, = _HEADER.unpack_from(buffer, offset)
+        end = offset + _HEADER.size + size
+        if len(buffer) < end:
+            break
+        yield json.loads(buffer[offset + _HEADER.size:end])
+        offset = end
+    del buffer[:offset]
+
+
+class DaemonClient:
+    """A connection to the daemon to stream operations of a run.
+
+    Operations are buffered and sent every `send_interval` seconds (or when
+    the buffer is large), so that the number of system calls is small. The
+    client is used as the operation log of a memory (see `Memory.wal`).
+    """
+
+    def __init__(self,
+                 sock: socket.socket,
+                 run_id: str,
+                 rank: Optional[int] = None,
+                 send_interval: float = 0.1,
+                 buffer_size: int = 1 << 16,
+                ) -> None:
+        self._sock = sock
+        self.send_interval = send_interval
+        self.buffer_size = buffer_size
+
+        # True after the connection is lost
+        self.broken = False
+
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._last_send = time.monotonic()
+        self.write({'op': 'start', 'run_id': run_id, 'rank': rank})
+
+    def write(self, entry: dict) -> None:
+        """Write an operation."""
+        frame = encode_message(entry)
+        with self._lock:
+            self._buffer += frame
+            if (len(self._buffer) >= self.buffer_size or
+                    time.monotonic() - self._last_send >= self.send_interval):
+                self._send()
+
+    def _send(self) -> None:
+        if not self.broken:
+            try:
+                self._sock.sendall(self._buffer)
+            except OSError:
+                self.broken = True
+        self._buffer.clear()
+        self._last_send = time.monotonic()
+
+    def close(self, timeout: float = 30.) -> bool:
+        """End the run and wait until the daemon saves it.
+
+        Returns:
+            bool: True if the run is saved by the daemon.
+        """
+        with self._lock:
+            self._buffer += encode_message({'op': 'end'})
+            self._send()
+
+        saved = False
+        if not self.broken:
+            try:
+                self._sock.settimeout(timeout)
+                buffer = bytearray()
+                while not saved:
+                    data = self._sock.recv(4096)
+                    if not data:
+                        break
+                    buffer += data
+                    for message in decode_messages(buffer):
+                        saved = saved or message.get('op') == 'ack'
+            except OSError:
+                pass
+        self._sock.close()
+        return saved
+
+
+def connect_daemon(repo: Repository,
+                   run_id: str,
+                   rank: Optional[int] = None,
+                  ) -> Optional[DaemonClient]:
+    """Connect to the daemon of the repository if it is running."""
+    socket_path = repo.daemon_socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        # e.g. a socket file left by a killed daemon
+        sock.close()
+        return None
+    return DaemonClient(sock, run_id, rank=rank)
+
+
+class _Session:
+    """State of a client connection."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buffer = bytearray()
+        self.memory = None
+        self.ended = False
+        self.closed = False
+
+
+class RecordingDaemon:
+    """A daemon to record runs streamed from clients.
+
+    Args:
+        repo (Repository): A repository to save runs.
+        flush_interval (float, optional): Updated runs are flushed every
+            `flush_interval` seconds.
+    """
+
+    def __init__(self,
+                 repo: Repository,
+                 flush_interval: float = 1.,
+                ) -> None:
+        self.repo = repo
+        self.flush_interval = flush_interval
+        self.socket_path = repo.daemon_socket_path()
+
+        self._selector = None
+        self._listener = None
+        self._stop_sender, self._stop_receiver = socket.socketpair()
+        self._stopping = False
+
+        self._started: List[_Session] = []
+        self._ended: List[_Session] = []
+        self._updated = set()
+
+    def __enter__(self) -> 'RecordingDaemon':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start listening on the socket."""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # left by a killed daemon
+                os.remove(self.socket_path)
+            else:
+                raise RuntimeError('Daemon is already running ({})'.format(
+                    self.socket_path))
+            finally:
+                probe.close()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(128)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._selector.register(self._stop_receiver, selectors.EVENT_READ)
+
+    def serve_forever(self) -> None:
+        """Process messages until `shutdown` is called."""
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stopping:
+            timeout = max(0., next_flush - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._listener:
+                    self._accept()
+                elif key.fileobj is self._stop_receiver:
+                    self._stopping = True
+                else:
+                    self._receive(key.data)
+
+            flush_all = time.monotonic() >= next_flush
+            if flush_all:
+                next_flush = time.monotonic() + self.flush_interval
+            try:
+                self._write(flush_all)
+            except Exception as e:
+                warnings.warn('Failed to write run data ({}: {})'.format(
+                    type(e).__name__, e))
+
+        # save the runs of the remaining clients
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.data, _Session):
+                self._disconnect(key.data)
+        self._write(True)
+
+    def shutdown(self) -> None:
+        """Stop `serve_forever` (can be called from another thread)."""
+        self._stop_sender.send(b'\0')
+
+    def close(self) -> None:
+        """Stop listening and remove the socket file."""
+        if self._listener is not None:
+            self._selector.close()
+            self._listener.close()
+            self._listener = None
+            os.remove(self.socket_path)
+        self._stop_sender.close()
+        self._stop_receiver.close()
+
+    def _accept(self) -> None:
+        sock, _ = self._listener.accept()
+        session = _Session(sock)
+        self._selector.register(sock, selectors.EVENT_READ, data=session)
+
+    def _receive(self, session: _Session) -> None:
+        try:
+            data = session.sock.recv(1 << 16)
+        except OSError:
+            data = b''
+        if not data:
+            self._disconnect(session)
+            return
+
+        session.buffer += data
+        try:
+            for message in decode_messages(session.buffer):
+                self._handle(session, message)
+        except Exception as e:
+            # a broken client must not stop the daemon
+            warnings.warn('Failed to handle a message ({}: {})'.format(
+                type(e).__name__, e))
+            self._disconnect(session)
+
+    def _handle(self, session: _Session, message: dict) -> None:
+        op = message['op']
+        if op == 'start':
+            session.memory = Memory(message['run_id'], repo=self.repo,
+                                    rank=message.get('rank'))
+            self._started.append(session)
+            return
+        if op == 'end':
+            session.ended = True
+            if session.memory is not None:
+                self._ended.append(session)
+            else:
+                self._close(session)
+            return
+
+        memory = session.memory
+        if op == 'params':
+            memory.params = message['data']
+        elif op == 'metrics':
+            step = message.get('step')
+            memory.set_metrics(message['data'],
+                               step=None if step is None else tuple(step),
+                               timestamp=message.get('time'))
+        elif op == 'metrics_batch':
+            memory.set_metrics_batch(message['data'],
+                                     steps=tuple(message['steps']),
+                                     timestamp=message.get('time'))
+        elif op == 'info':
+            memory.set_info(message['data'])
+        elif op == 'system_metrics':
+            memory.add_system_metrics(message['data'])
+        elif op == 'timer':
+            memory.add_time(message['name'], message['seconds'])
+        elif op == 'artifact':
+            memory.add_artifact(message['name'], message['ref'])
+        self._updated.add(session)
+
+    def _disconnect(self, session: _Session) -> None:
+        """Handle a connection closed by the client."""
+        if session.ended:
+            # closed after the ack is sent
+            return
+        self._close(session)
+        if session.memory is not None and session not in self._ended:
+            # the client was killed before the run ended
+            info = session.memory.info or {}
+            if info.get('status', 'running') == 'running':
+                session.memory.set_info({'status': 'interrupted'})
+            self._ended.append(session)
+
+    def _close(self, session: _Session) -> None:
+        if not session.closed:
+            session.closed = True
+            self._selector.unregister(session.sock)
+            session.sock.close()
+
+    def _write(self, flush_all: bool) -> None:
+        """Write started, ended and (if `flush_all`) updated runs."""
+        if self._started:
+            for session in self._started:
+                session.memory.flush()
+            with self.repo.open_workspace() as workspace:
+                for session in self._started:
+                    workspace.add_untracked_run(session.memory.run_id)
+            self._started = []
+
+        for session in self._ended:
+            self._updated.discard(session)
+            session.memory.flush()
+            if session.ended and not session.closed:
+                try:
+                    session.sock.sendall(encode_message({'op': 'ack'}))
+                except OSError:
+                    pass
+            self._close(session)
+        self._ended = []
+
+        if flush_all:
+            for session in self._updated:
+                session.memory.flush(incremental=True)
+            self._updated = set()
@@ -0,0 +1,94 @@
+"""
+A background writer to flush run data periodically.
+"""
+
+
+import queue
+import threading
+from typing import Optional
+import warnings
+
+from expnote.recording.memory import Memory
+
+
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+
+class BackgroundFlusher:
+    """Flush the memory incrementally in a background thread.
+
+    The memory is flushed every `interval` seconds and every `steps` new
+    steps. The recording thread only puts a request into a bounded queue
+    without waiting, so that it is never blocked by storage I/O.
+    """
+
+    def __init__(self,
+                 memory: Memory,
+                 interval: Optional[float] = None,
+                 steps: Optional[int] = None,
+                ) -> None:
+        if interval is None and steps is None:
+            raise ValueError('Specify interval or steps.')
+        self.memory = memory
+        self.interval = interval
+        self.steps = steps
+
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+        self._num_new_steps = 0
+
+    def __enter__(self) -> 'BackgroundFlusher':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start the background thread."""
+        if self.steps is not None:
+            self.memory.step_hooks.append(self.on_step)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after the pending flush is done."""
+        if self.on_step in self.memory.step_hooks:
+            self.memory.step_hooks.remove(self.on_step)
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def on_step(self, num_steps: int = 1) -> None:
+        """Count new steps and request a flush every `steps` steps."""
+        self._num_new_steps += num_steps
+        if self._num_new_steps >= self.steps:
+            self._num_new_steps = 0
+            self.request()
+
+    def request(self) -> None:
+        """Request a flush without blocking.
+
+        The request is dropped if another request is still pending.
+        """
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            try:
+                request = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                request = _FLUSH
+            if request == _STOP:
+                return
+
+            try:
+                self.memory.flush(incremental=True)
+            except Exception as e:
+                # the rows are flushed again next time
+                warnings.warn('Failed to flush run data ({}: {})'.format(
+                    type(e).__name__, e))
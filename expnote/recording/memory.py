@@ -3,14 +3,27 @@ A memory object to gather and organize run data.
 """
 
 
+from array import array
+from collections import deque
+from contextvars import ContextVar
+import threading
+import time
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
 
 from expnote.run import Run
+from expnote.step_metrics import MetricSummary
+from expnote.step_metrics import StepMetrics
+from expnote.step_times import steps_per_sec
 from expnote.repository import Repository
 
 
-_memories = []
+# memory stack of the current context (thread or asyncio task)
+_memories: ContextVar[tuple] = ContextVar('expnote_memories', default=())
+
+# memories in use in the whole process
+_active_memories = []
 
 
 def merge_dicts(dict1: dict, dict2: dict) -> dict:
@@ -30,81 +43,357 @@ class Memory:
 
     def __init__(self,
                  run_id: str,
-                 repo: Optional[Repository] = None
+                 repo: Optional[Repository] = None,
+                 rank: Optional[int] = None,
                 ) -> None:
         self.run_id = run_id
         self.repo = repo
+        # the rank of the process recording a shard of the run (optional)
+        self.rank = rank
         self.params = {}
         self.metrics = {}
         self.step_metrics = None
+        # keys of step numbers used to set step metrics (e.g. 'epoch')
+        self.step_keys = []
         self.info = None
+        self.system_metrics = None
+
+        # running summaries of step metrics
+        self.summaries = {}
+        # metric name -> step key of the summaries to be recomputed, since
+        # a running summary cannot remove an overwritten value
+        self._stale_summaries = {}
+        # held while step metrics and summaries are updated, since stale
+        # summaries are recomputed in a flushing thread
+        self._summaries_lock = threading.Lock()
+
+        # wall-clock timestamps of the rows of step metrics
+        self.step_times = array('d')
+        # section name -> {'total': seconds, 'count': number of calls}
+        self.timers = {}
+        # artifact name -> blob reference
+        self.artifacts = {}
+
+        # a log to which every operation is written (optional), e.g. a
+        # write-ahead log to recover the run data or a daemon connection
+        self.wal = None
+
+        # rows before `_flushed_rows` are already flushed, and the rows
+        # updated after that are queued in `_dirty_rows`.
+        self._flushed_rows = 0
+        self._dirty_rows = deque()
+        self._flushed_times = 0
+
+        # functions called with the number of steps newly added
+        self.step_hooks = []
+        # functions called with the params updated
+        self.params_hooks = []
+
+        self._tokens = []
 
     def __enter__(self) -> 'Memory':
-        global _memories
-        _memories.append(self)
+        token = _memories.set(_memories.get() + (self,))
+        self._tokens.append(token)
+        _active_memories.append(self)
         return self
 
     def __exit__(self, *args) -> None:
-        global _memories
-        _memories.pop()
+        _memories.reset(self._tokens.pop())
+        _active_memories.remove(self)
 
     def set_params(self,
                    data: dict
                   ) -> None:
         """Set the params data."""
         self.params = merge_dicts(self.params, data)
+        if self.wal is not None:
+            self.wal.write({'op': 'params', 'data': self.params})
+        for hook in self.params_hooks:
+            hook(self.params)
 
     def set_metrics(self,
                     data: dict,
-                    step: Optional[Tuple[int, str]] = None
+                    step: Optional[Tuple[int, str]] = None,
+                    timestamp: Optional[float] = None,
                    ) -> None:
-        """Set the metrics data."""
+        """Set the metrics data.
 
+        The wall-clock time (or `timestamp` if specified) is recorded for
+        a new step.
+        """
         if step is None:
+            if self.wal is not None:
+                self.wal.write({'op': 'metrics', 'data': data, 'step': step})
             for k, v in data.items():
                 self.metrics[k] = v
             return
 
+        if timestamp is None:
+            timestamp = time.time()
+        if self.wal is not None:
+            self.wal.write({'op': 'metrics', 'data': data, 'step': step,
+                            'time': timestamp})
+
         if self.step_metrics is None:
-            self.step_metrics = []
+            self.step_metrics = StepMetrics()
 
         step_num, step_key = step
-        for step_data in self.step_metrics:
-            if step_data.get(step_key, None) == step_num:
-                for k, v in data.items():
-                    step_data[k] = v
-                    return
+        if step_key not in self.step_keys:
+            self.step_keys.append(step_key)
+        step_metrics = self.step_metrics
+        num_rows = len(step_metrics)
+        with self._summaries_lock:
+            index = step_metrics.find(step_key, step_num)
+            if index is not None:
+                for k in data:
+                    if step_metrics.has_value(index, k):
+                        self._stale_summaries[k] = step_key
+            index = step_metrics.set(step_key, step_num, data)
+            summaries = self.summaries
+            for k, v in data.items():
+                summary = summaries.get(k)
+                if summary is None:
+                    summary = summaries[k] = MetricSummary()
+                summary.update(v, step_num)
+        if index < self._flushed_rows:
+            self._dirty_rows.append(index)
+        if index == num_rows:
+            self.step_times.append(timestamp)
+            for hook in self.step_hooks:
+                hook(1)
 
-        step_data = {step_key: step_num}
-        for k, v in data.items():
-            step_data[k] = v
-        self.step_metrics.append(step_data)
+    def set_metrics_batch(self,
+                          data: dict,
+                          steps: Tuple[Sequence[int], str],
+                          timestamp: Optional[float] = None,
+                         ) -> None:
+        """Set step metrics of multiple steps at once.
+
+        Args:
+            data (dict): Metric name -> a sequence of values for the steps.
+            steps (tuple): A pair of a step number sequence and a step key
+                (e.g. `([0, 1, 2], 'epoch')`).
+            timestamp (float, optional): The wall-clock time recorded for
+                the new steps (the current time by default).
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.wal is not None:
+            self.wal.write({'op': 'metrics_batch', 'data': data,
+                            'steps': steps, 'time': timestamp})
+
+        if self.step_metrics is None:
+            self.step_metrics = StepMetrics()
+
+        step_nums, step_key = steps
+        if step_key not in self.step_keys:
+            self.step_keys.append(step_key)
+        num_rows = len(self.step_metrics)
+        with self._summaries_lock:
+            if num_rows > 0:
+                self._mark_overwritten(data, steps)
+            indices = self.step_metrics.set_batch(step_key, step_nums, data)
+            if len(set(indices)) < len(indices):
+                # a step is repeated in the batch
+                for k in data:
+                    self._stale_summaries[k] = step_key
+            for k, values in data.items():
+                if k not in self.summaries:
+                    self.summaries[k] = MetricSummary()
+                self.summaries[k].update_batch(values, step_nums)
+        flushed_rows = self._flushed_rows
+        self._dirty_rows.extend(i for i in indices if i < flushed_rows)
+
+        num_new_steps = len(self.step_metrics) - num_rows
+        if num_new_steps > 0:
+            self.step_times.extend([timestamp] * num_new_steps)
+            for hook in self.step_hooks:
+                hook(num_new_steps)
+
+    def _mark_overwritten(self,
+                          data: dict,
+                          steps: Tuple[Sequence[int], str]
+                         ) -> None:
+        """Mark the summaries of metrics overwritten by a batch as stale."""
+        step_metrics = self.step_metrics
+        step_key = steps[1]
+        indices = [step_metrics.find(step_key, step_num)
+                   for step_num in steps[0]]
+        indices = [index for index in indices if index is not None]
+        if not indices:
+            return
+        for k in data:
+            if any(step_metrics.has_value(index, k) for index in indices):
+                self._stale_summaries[k] = step_key
 
     def set_info(self,
                  data: dict
                 ) -> None:
         """Set the info data."""
+        if self.wal is not None:
+            self.wal.write({'op': 'info', 'data': data})
         if self.info is None:
             self.info = {}
         for k, v in data.items():
             self.info[k] = v
 
-    def flush(self) -> None:
-        """Flush run data."""
-        if self.repo is not None:
+    def add_system_metrics(self,
+                           data: dict
+                          ) -> None:
+        """Add a sample of system metrics (e.g. CPU and memory usage)."""
+        if self.wal is not None:
+            self.wal.write({'op': 'system_metrics', 'data': data})
+        if self.system_metrics is None:
+            self.system_metrics = StepMetrics()
+        self.system_metrics.append(data)
+
+    def add_time(self,
+                 name: str,
+                 seconds: float
+                ) -> None:
+        """Add elapsed time of a timing section."""
+        if self.wal is not None:
+            self.wal.write({'op': 'timer', 'name': name, 'seconds': seconds})
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = {'total': 0., 'count': 0}
+        timer['total'] += seconds
+        timer['count'] += 1
+
+    def add_artifact(self,
+                     name: str,
+                     ref: dict
+                    ) -> None:
+        """Add a reference to a blob stored as an artifact."""
+        if self.wal is not None:
+            self.wal.write({'op': 'artifact', 'name': name, 'ref': ref})
+        self.artifacts[name] = ref
+
+    def flush(self, incremental: bool = False) -> None:
+        """Flush run data.
+
+        In the incremental mode, only step metrics updated after the
+        previous flush are appended to the step log of the run, so that
+        the cost does not grow with the number of recorded steps.
+        """
+        if self.repo is None:
+            return
+
+        # mark the rows as flushed before reading them, so that a row
+        # updated while flushing is marked as dirty again.
+        start = self._flushed_rows
+        num_rows = 0 if self.step_metrics is None else len(self.step_metrics)
+        self._flushed_rows = num_rows
+        dirty_rows = set()
+        while self._dirty_rows:
+            dirty_rows.add(self._dirty_rows.popleft())
+
+        if not incremental:
+            run = self.to_run()
+            self._flushed_times = len(run.step_times)
+            self.repo.save_run(run, rank=self.rank)
+            return
+
+        # shallow copies are serialized (see `to_run`)
+        params = dict(self.params)
+        metrics = dict(self.metrics)
+        info = None if self.info is None else dict(self.info)
+
+        # timestamps are appended separately since they are recorded after
+        # the rows in another thread
+        times_start = self._flushed_times
+        times = self.step_times[times_start:].tolist()
+        self._flushed_times = times_start + len(times)
+
+        indices = sorted(i for i in dirty_rows if i < start)
+        indices += range(start, num_rows)
+        try:
+            rows = [(i, dict(self.step_metrics[i])) for i in indices]
+            if rows or times:
+                self.repo.append_step_metrics(self.run_id, rows,
+                                              rank=self.rank,
+                                              times=(times_start, times))
+
             run = Run(
                 id=self.run_id,
-                params=self.params,
-                metrics=self.metrics,
-                step_metrics=self.step_metrics,
-                info=self.info,
+                params=params,
+                metrics=metrics,
+                info=info,
+                system_metrics=self.system_metrics,
+                summaries=self._summaries_dict(),
+                timing=self._timing_dict(),
+                artifacts=dict(self.artifacts) or None,
+                step_keys=list(self.step_keys) or None,
             )
-            self.repo.save_run(run)
+            self.repo.save_run(run, include_step_metrics=False,
+                               rank=self.rank)
+        except BaseException:
+            # flush the rows again next time
+            self._dirty_rows.extend(indices)
+            self._flushed_times = times_start
+            raise
+
+    def to_run(self) -> Run:
+        """Make a run of the data in the memory.
+
+        Shallow copies of the data are used, since the data can be updated
+        by the recording thread while it is flushed in a background thread.
+        """
+        return Run(
+            id=self.run_id,
+            params=dict(self.params),
+            metrics=dict(self.metrics),
+            step_metrics=self.step_metrics,
+            info=None if self.info is None else dict(self.info),
+            system_metrics=self.system_metrics,
+            summaries=self._summaries_dict(),
+            step_times=self.step_times.tolist(),
+            timing=self._timing_dict(),
+            artifacts=dict(self.artifacts) or None,
+            step_keys=list(self.step_keys) or None,
+        )
+
+    def _summaries_dict(self) -> Optional[dict]:
+        with self._summaries_lock:
+            for k, step_key in self._stale_summaries.items():
+                summary = MetricSummary()
+                summary.update_batch(
+                    *reversed(self.step_metrics.series(step_key, k)))
+                self.summaries[k] = summary
+            self._stale_summaries.clear()
+            summaries = {k: s.to_dict() for k, s in self.summaries.items()
+                         if s.count > 0}
+        return summaries or None
+
+    def _timing_dict(self) -> Optional[dict]:
+        timing = {}
+        throughput = steps_per_sec(self.step_times)
+        if throughput is not None:
+            timing['steps_per_sec'] = throughput
+        if self.timers:
+            timing['sections'] = {k: dict(v) for k, v
+                                  in list(self.timers.items())}
+        return timing or None
 
 
 def get_current_memory() -> Memory:
-    global _memories
-    return _memories[-1]
+    """Get the memory of the current context.
+
+    Each thread and asyncio task has its own memory stack, so that runs can
+    be recorded concurrently. In a context without memory (e.g. a thread
+    started in a scope), the memory is used if only one is in use in the
+    process.
+    """
+    memories = _memories.get()
+    if memories:
+        return memories[-1]
+    active_memories = _active_memories.copy()
+    if len(active_memories) == 1:
+        return active_memories[0]
+    if not active_memories:
+        raise IndexError('No memory is in use.')
+    raise IndexError('Cannot determine the memory for the current context '
+                     'from multiple memories in use.')
 
 
 def set_params(data: dict) -> None:
@@ -121,7 +410,27 @@ def set_metrics(data: dict,
     mem.set_metrics(data, step=step)
 
 
+def set_metrics_batch(data: dict,
+                      steps: Tuple[Sequence[int], str]
+                     ) -> None:
+    """Write step metrics of multiple steps to the current memory."""
+    mem = get_current_memory()
+    mem.set_metrics_batch(data, steps)
+
+
 def set_info(data: dict) -> None:
     """Write info to the current memory."""
     mem = get_current_memory()
     mem.set_info(data)
+
+
+def add_time(name: str, seconds: float) -> None:
+    """Add elapsed time of a timing section to the current memory."""
+    mem = get_current_memory()
+    mem.add_time(name, seconds)
+
+
+def add_artifact(name: str, ref: dict) -> None:
+    """Add an artifact reference to the current memory."""
+    mem = get_current_memory()
+    mem.add_artifact(name, ref)
@@ -0,0 +1,199 @@
+"""
+A profile collector to attach CPU and memory profiles to runs.
+"""
+
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from expnote.repository import Repository
+from expnote.recording.memory import get_current_memory
+
+
+PROFILE_MODES = ('deterministic', 'sampling')
+
+# (file name, first line number, function name)
+FunctionKey = Tuple[str, int, str]
+
+
+class _Sampler:
+    """Sample call stacks of a thread periodically."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.num_samples = 0
+        self.self_samples: Dict[FunctionKey, int] = {}
+        self.total_samples: Dict[FunctionKey, int] = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.num_samples += 1
+            keys = set()
+            is_top = True
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if is_top:
+                    self.self_samples[key] = self.self_samples.get(key, 0) + 1
+                    is_top = False
+                # recursive calls are counted once
+                keys.add(key)
+                frame = frame.f_back
+            for key in keys:
+                self.total_samples[key] = self.total_samples.get(key, 0) + 1
+
+
+def _function_entry(key: FunctionKey,
+                    calls: Optional[int],
+                    self_time: float,
+                    total_time: float
+                   ) -> dict:
+    file_name, line, name = key
+    return {'file': file_name, 'line': line, 'function': name,
+            'calls': calls, 'self_time': self_time, 'total_time': total_time}
+
+
+class Profiler:
+    """CPU and memory profile collector.
+
+    A CPU profile and the top allocations traced by `tracemalloc` are
+    collected in the context, and saved as a JSON artifact (see
+    `Run.artifacts`) of the run of the current memory when the context
+    exits.
+
+    Args:
+        repo (Repository): A repository to save the profile.
+        name (str, optional): The artifact name of the profile.
+        mode (str, optional): 'deterministic' to trace all function calls
+            by `cProfile`, or 'sampling' to sample the call stack of the
+            thread every `interval` seconds (lower overhead, and the number
+            of calls is not available).
+        memory (bool, optional): If True, allocations are also traced.
+        top (int, optional): The number of allocation sites to be saved.
+        interval (float, optional): The sampling interval in seconds.
+    """
+
+    def __init__(self,
+                 repo: Repository,
+                 name: str = 'profile',
+                 mode: str = 'deterministic',
+                 memory: bool = True,
+                 top: int = 20,
+                 interval: float = 0.005,
+                ) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError('Unknown profile mode ({})'.format(mode))
+        self.repo = repo
+        self.name = name
+        self.mode = mode
+        self.memory = memory
+        self.top = top
+        self.interval = interval
+
+        self._memory = None
+        self._profile = None
+        self._sampler = None
+        self._tracing = False
+        self._start_time = None
+
+    def __enter__(self) -> 'Profiler':
+        self._memory = get_current_memory()
+        if self.memory:
+            import tracemalloc
+            # tracing started by the user is left as it is
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+
+        self._start_time = time.perf_counter()
+        if self.mode == 'deterministic':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        duration = time.perf_counter() - self._start_time
+
+        data = {
+            'mode': self.mode,
+            'duration': duration,
+            'functions': self._functions(duration),
+        }
+        if self.memory:
+            data['allocations'] = self._allocations()
+
+        name = self.name
+        if self._memory.rank is not None:
+            name += '.rank{}'.format(self._memory.rank)
+        ref = self.repo.save_blob_data(json.dumps(data).encode())
+        self._memory.add_artifact(name, ref)
+        self._profile = None
+        self._sampler = None
+
+    def _functions(self, duration: float) -> List[dict]:
+        """List functions in the descending order of the self time."""
+        functions = []
+        if self._profile is not None:
+            import pstats
+            stats = pstats.Stats(self._profile).stats
+            for key, (_, calls, self_time, total_time, _) in stats.items():
+                functions.append(
+                    _function_entry(key, calls, self_time, total_time))
+        else:
+            sampler = self._sampler
+            sec_per_sample = duration / max(sampler.num_samples, 1)
+            for key, total_samples in sampler.total_samples.items():
+                functions.append(_function_entry(
+                    key, None,
+                    sampler.self_samples.get(key, 0) * sec_per_sample,
+                    total_samples * sec_per_sample))
+        functions.sort(key=lambda f: f['self_time'], reverse=True)
+        return functions
+
+    def _allocations(self) -> List[dict]:
+        """List the allocation sites using the most memory."""
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        if self._tracing:
+            tracemalloc.stop()
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, os.path.abspath(__file__)),
+        ])
+        allocations = []
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            frame = stat.traceback[0]
+            allocations.append({'file': frame.filename,
+                                'line': frame.lineno,
+                                'size': stat.size,
+                                'count': stat.count})
+        return allocations
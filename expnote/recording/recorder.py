@@ -3,58 +3,399 @@ A helper class to record run data.
 """
 
 
+from contextlib import AsyncExitStack
 from contextlib import ExitStack
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from functools import partial
 from functools import wraps
+import inspect
+import os
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
 import uuid
 
 from expnote.run import Run
+from expnote.experiment import Experiment
 from expnote.repository import Repository
+from expnote.repository.wal import WriteAheadLog
 from expnote.recording.memory import Memory
 from expnote.recording.memory import set_params
 from expnote.recording.memory import set_metrics
+from expnote.recording.memory import set_metrics_batch
 from expnote.recording.memory import set_info
+from expnote.recording.memory import add_artifact
 from expnote.recording.collectors import RunInfoCollector
+from expnote.recording.collectors import ResourceCollector
+from expnote.recording.collectors import Timer
+from expnote.recording.flusher import BackgroundFlusher
+from expnote.recording.sweep import SweepResult
+from expnote.recording.sweep import run_sweep
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from expnote.recording.daemon import DaemonClient
+    from expnote.recording.profiler import Profiler
+
+
+class _RunExists(BaseException):
+    """Raised to skip a run whose params are already recorded.
+
+    This is not an `Exception` not to be caught by `except Exception` in
+    the recorded function.
+    """
+
+    def __init__(self, run: Run) -> None:
+        super().__init__(run.id)
+        self.run = run
 
 
 class Recorder:
-    """A helper class to record run data."""
+    """A helper class to record run data.
+
+    Args:
+        repo (Repository, optional): A repository to save runs.
+        flush_interval (float, optional): If specified, run data is flushed
+            in background every `flush_interval` seconds.
+        flush_steps (int, optional): If specified, run data is flushed in
+            background every `flush_steps` new steps.
+        resource_interval (float, optional): If specified, system resource
+            usage is sampled every `resource_interval` seconds.
+        wal (bool, optional): If True, every recording operation is
+            appended to a write-ahead log, from which the run is recovered
+            if the process is killed (see `LocalRepository.recover_runs`).
+        daemon (bool, optional): If True, run data is sent to the recording
+            daemon (see `xn daemon`) while it is running. Otherwise, or if
+            the daemon is not running, run data is written directly.
+        run_id (str, optional): A run id shared by processes, e.g. ranks of
+            distributed training. If not specified, a new run id is
+            generated for each scope.
+        rank (int, optional): The rank of the process. If specified, run
+            data of the process is saved to its own shard of the run, and
+            the shards are merged by `LocalRepository.get_run`.
+    """
 
     def __init__(self,
                  repo: Optional[Repository] = None,
+                 flush_interval: Optional[float] = None,
+                 flush_steps: Optional[int] = None,
+                 resource_interval: Optional[float] = None,
+                 wal: bool = False,
+                 daemon: bool = True,
+                 run_id: Optional[str] = None,
+                 rank: Optional[int] = None,
                 ) -> None:
         if repo is None:
             repo = Repository()
         self.repo = repo
+        self.flush_interval = flush_interval
+        self.flush_steps = flush_steps
+        self.resource_interval = resource_interval
+        self.wal = wal
+        self.daemon = daemon
+        self.run_id = run_id
+        self.rank = rank
 
-    def scope(self, func: callable) -> callable:
-        """Function decorator to add recording functionality."""
+    def scope(self,
+              func: Optional[callable] = None,
+              profile: Union[bool, str, None] = None,
+              skip_if_exists: bool = False,
+             ) -> callable:
+        """Function decorator to add recording functionality.
+
+        Coroutine functions are also supported. In that case, the run is
+        recorded until the coroutine finishes, and storage I/O is executed
+        in the default executor not to block the event loop.
+
+        Args:
+            func (callable): A function to be recorded.
+            profile (bool or str, optional): If specified, the function is
+                profiled (see `profile`). True or 'deterministic' for
+                `cProfile`, and 'sampling' for a sampling profiler. Nothing
+                is done for profiling by default.
+            skip_if_exists (bool, optional): If True, the function stops
+                when params given by `params` are the same as a completed
+                run, and the new run is discarded. In that case, the wrapped
+                function returns the completed run (a `Run` object) instead
+                of the return value. Params should be given at once before
+                the computation, since the check is done on every call of
+                `params`.
+
+        Example:
+            >>> @recorder.scope(profile='sampling')
+            ... def main():
+            ...     ...
+        """
+        if func is None:
+            return partial(self.scope, profile=profile,
+                           skip_if_exists=skip_if_exists)
+        if profile is True:
+            profile = 'deterministic'
+
+        if inspect.iscoroutinefunction(func):
+            return self._async_scope(func, profile, skip_if_exists)
 
         @wraps(func)
         def wrapped_func(*args, **kwargs):
 
-            run_id = uuid.uuid4().hex
-            memory = Memory(
-                run_id=run_id,
-                repo=self.repo,
-            )
-            with memory:
-                with ExitStack() as stack:
-                    stack.enter_context(RunInfoCollector())
-                    memory.flush()
-                    with self.repo.open_workspace() as ws:
-                        ws.add_untracked_run(run_id)
+            memory = self._create_memory()
+            if skip_if_exists:
+                memory.params_hooks.append(self._check_params)
+            existing_run = None
+            with self._open_log(memory):
+                try:
+                    with memory:
+                        with ExitStack() as stack:
+                            stack.enter_context(RunInfoCollector())
+                            if self.resource_interval is not None:
+                                stack.enter_context(
+                                    ResourceCollector(self.resource_interval))
+                            self._start_run(memory)
+                            flusher = self._create_flusher(memory)
+                            if flusher is not None:
+                                stack.enter_context(flusher)
+                            if profile:
+                                stack.enter_context(self.profile(mode=profile))
 
-                    # execute the function
-                    ret = func(*args, **kwargs)
+                            # execute the function
+                            ret = func(*args, **kwargs)
+                except _RunExists as e:
+                    existing_run = e.run
+                finally:
+                    # save the final status also for a failed run
+                    if existing_run is None:
+                        memory.flush()
+                        self._mark_saved(memory)
 
-            memory.flush()
+            if existing_run is not None:
+                self.repo.discard_run(memory.run_id)
+                return existing_run
+            return ret
 
+        return wrapped_func
+
+    def _async_scope(self,
+                     func: callable,
+                     profile: Optional[str] = None,
+                     skip_if_exists: bool = False,
+                    ) -> callable:
+        """Decorator for coroutine functions (see `scope`)."""
+
+        @wraps(func)
+        async def wrapped_func(*args, **kwargs):
+            import asyncio  # imported here to keep the recording API light
+
+            loop = asyncio.get_running_loop()
+            memory = self._create_memory()
+            if skip_if_exists:
+                memory.params_hooks.append(self._check_params)
+            existing_run = None
+            async with self._open_log_async(memory, loop):
+                try:
+                    with memory:
+                        async with AsyncExitStack() as stack:
+                            stack.enter_context(RunInfoCollector())
+                            if self.resource_interval is not None:
+                                stack.enter_context(
+                                    ResourceCollector(self.resource_interval))
+                            await loop.run_in_executor(
+                                None, self._start_run, memory)
+                            flusher = self._create_flusher(memory)
+                            if flusher is not None:
+                                flusher.start()
+                                stack.push_async_callback(
+                                    loop.run_in_executor, None, flusher.stop)
+                            if profile:
+                                # other tasks in the event loop are also
+                                # profiled while the coroutine is awaiting
+                                stack.enter_context(self.profile(mode=profile))
+
+                            # execute the coroutine
+                            ret = await func(*args, **kwargs)
+                except _RunExists as e:
+                    existing_run = e.run
+                finally:
+                    # save the final status also for a failed run
+                    if existing_run is None:
+                        await loop.run_in_executor(None, memory.flush)
+                        self._mark_saved(memory)
+
+            if existing_run is not None:
+                await loop.run_in_executor(None, self.repo.discard_run,
+                                           memory.run_id)
+                return existing_run
             return ret
 
         return wrapped_func
 
+    def sweep(self,
+              func: Callable[..., Any],
+              params_list: Iterable[dict],
+              workers: int = 1,
+              experiment: Optional[Experiment] = None,
+              skip_if_exists: bool = False,
+             ) -> List[SweepResult]:
+        """Record runs of the function over parameter sets in parallel.
+
+        The function is called as `func(**params)` in a process pool of
+        `workers` processes, and each call is recorded as a run with the
+        parameters. A failure of a call (including a crash of the worker
+        process) does not affect the other calls (see `run_sweep`). The
+        function must be picklable (i.e. defined at the top level of a
+        module) and must not be decorated by `scope`.
+
+        Args:
+            func (callable): A function to be called.
+            params_list (iterable of dict): Parameter sets (see `grid` and
+                `random_search` in `expnote.recording.sweep`).
+            workers (int, optional): The number of worker processes.
+            experiment (Experiment, optional): If specified, the experiment
+                is saved and all the runs are assigned to it in one
+                workspace transaction.
+            skip_if_exists (bool, optional): If True, parameter sets of
+                completed runs are skipped (see `scope`), and the completed
+                runs are used as the results.
+
+        Returns:
+            list of SweepResult: Results in the order of the parameter sets.
+
+        Example:
+            >>> recorder.sweep(train, grid({'lr': [0.1, 0.01]}), workers=2)
+        """
+        return run_sweep(self, func, params_list, workers=workers,
+                         experiment=experiment, skip_if_exists=skip_if_exists)
+
+    def _create_memory(self) -> Memory:
+        return Memory(
+            run_id=self.run_id or uuid.uuid4().hex,
+            repo=self.repo,
+            rank=self.rank,
+        )
+
+    @contextmanager
+    def _open_log(self, memory: Memory) -> Iterator[None]:
+        """Attach a daemon connection or a write-ahead log to the memory.
+
+        If the daemon is running, run data is sent to the daemon instead of
+        being written directly (a write-ahead log is not used in that case).
+        """
+        client = self._connect_daemon(memory)
+        if client is not None:
+            memory.repo = None
+            memory.wal = client
+            try:
+                yield
+            finally:
+                memory.wal = None
+                memory.repo = self.repo
+                if not client.close():
+                    self._save_without_daemon(memory)
+            return
+
+        if not self.wal:
+            yield
+            return
+        with self.repo.open_wal(memory.run_id, rank=memory.rank) as wal:
+            memory.wal = wal
+            try:
+                yield
+            finally:
+                memory.wal = None
+
+    @asynccontextmanager
+    async def _open_log_async(self,
+                              memory: Memory,
+                              loop: 'asyncio.AbstractEventLoop'
+                             ) -> AsyncIterator[None]:
+        """Attach a log to the memory in an event loop (see `_open_log`).
+
+        Connecting to the daemon and waiting for it to save the run are
+        executed in the default executor not to block the event loop.
+        """
+        client = await loop.run_in_executor(None, self._connect_daemon,
+                                            memory)
+        if client is not None:
+            memory.repo = None
+            memory.wal = client
+            try:
+                yield
+            finally:
+                memory.wal = None
+                memory.repo = self.repo
+                if not await loop.run_in_executor(None, client.close):
+                    await loop.run_in_executor(
+                        None, self._save_without_daemon, memory)
+            return
+
+        if not self.wal:
+            yield
+            return
+        # the write-ahead log is opened in the event loop since its lock is
+        # dedicated to the run and never contended
+        with self.repo.open_wal(memory.run_id, rank=memory.rank) as wal:
+            memory.wal = wal
+            try:
+                yield
+            finally:
+                memory.wal = None
+
+    def _save_without_daemon(self, memory: Memory) -> None:
+        """Save the run directly when the daemon stopped while recording."""
+        memory.flush()
+        self.repo.register_run(memory.run_id)
+
+    @staticmethod
+    def _mark_saved(memory: Memory) -> None:
+        """Mark the write-ahead log as no longer needed.
+
+        This is called after the final run data is saved, so that the log
+        of a run failed with an exception is removed.
+        """
+        if isinstance(memory.wal, WriteAheadLog):
+            memory.wal.mark_saved()
+
+    def _connect_daemon(self, memory: Memory) -> Optional['DaemonClient']:
+        if not self.daemon:
+            return None
+        if not os.path.exists(self.repo.daemon_socket_path()):
+            return None
+        # imported here since it is only needed when the daemon is running
+        from expnote.recording.daemon import connect_daemon
+        return connect_daemon(self.repo, memory.run_id, rank=memory.rank)
+
+    def _check_params(self, params: dict) -> None:
+        """Stop the run if a completed run has the same params."""
+        runs = self.repo.find_runs_by_params(params)
+        if runs:
+            raise _RunExists(runs[0])
+
+    def _start_run(self, memory: Memory) -> None:
+        """Save the initial run data and register it to the workspace."""
+        if memory.repo is None:
+            # the run is saved and registered by the daemon
+            return
+        memory.flush()
+        self.repo.register_run(memory.run_id)
+
+    def _create_flusher(self, memory: Memory) -> Optional[BackgroundFlusher]:
+        if self.flush_interval is None and self.flush_steps is None:
+            return None
+        return BackgroundFlusher(
+            memory,
+            interval=self.flush_interval,
+            steps=self.flush_steps,
+        )
+
     def params(self, data: dict) -> None:
         set_params(data)
 
@@ -64,5 +405,80 @@ class Recorder:
                ) -> None:
         set_metrics(data, step=step)
 
+    def metrics_batch(self,
+                      data: dict,
+                      steps: Tuple[Sequence[int], str]
+                     ) -> None:
+        """Record step metrics of multiple steps at once.
+
+        Example:
+            >>> recorder.metrics_batch({'val_loss': losses},
+            ...                        steps=(range(len(losses)), 'epoch'))
+        """
+        set_metrics_batch(data, steps)
+
     def info(self, data: dict) -> None:
         set_info(data)
+
+    def profile(self,
+                name: str = 'profile',
+                mode: str = 'deterministic',
+                memory: bool = True,
+                top: int = 20,
+               ) -> 'Profiler':
+        """Profile a section and save the profile as an artifact of the run.
+
+        A CPU profile and the `top` allocation sites traced by tracemalloc
+        are saved as the artifact `name` of the current run (see
+        `artifact`), and they can be displayed by `xn profile <run id>`.
+
+        Args:
+            name (str, optional): The artifact name of the profile.
+            mode (str, optional): 'deterministic' (`cProfile`) or
+                'sampling' (call stacks are sampled periodically).
+            memory (bool, optional): If True, allocations are also traced.
+            top (int, optional): The number of allocation sites saved.
+
+        Example:
+            >>> with recorder.profile(name='train_profile'):
+            ...     train()
+        """
+        # imported here to add no overhead when profiling is not used
+        from expnote.recording.profiler import Profiler
+        return Profiler(self.repo, name=name, mode=mode, memory=memory,
+                        top=top)
+
+    def artifact(self,
+                 path: Union[str, os.PathLike],
+                 name: Optional[str] = None,
+                 link: bool = False,
+                ) -> dict:
+        """Store a file (e.g. a checkpoint) as an artifact of the run.
+
+        The file is stored in the content-addressed blob store of the
+        repository, so that files with the same content are stored only
+        once, and the run keeps a reference to the blob.
+
+        Args:
+            path (str or PathLike): A file to be stored.
+            name (str, optional): The artifact name (the file name by
+                default). An artifact with the same name is replaced.
+            link (bool, optional): If True, the blob is hard-linked to the
+                file when possible instead of being copied. The file must
+                not be modified in place after that.
+
+        Returns:
+            dict: The blob reference ({'digest': ..., 'size': ...}).
+        """
+        ref = self.repo.save_blob(path, link=link)
+        add_artifact(name or os.path.basename(path), ref)
+        return ref
+
+    def timer(self, name: str) -> Timer:
+        """Measure the time of a section (see `Run.timing`).
+
+        Example:
+            >>> with recorder.timer('data_loading'):
+            ...     batch = next(loader)
+        """
+        return Timer(name)
@@ -0,0 +1,215 @@
+"""
+Run a function over many parameter sets in parallel processes.
+"""
+
+
+from dataclasses import dataclass
+import itertools
+import random
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import TYPE_CHECKING
+import uuid
+
+from expnote.run import Run
+from expnote.experiment import Experiment
+
+if TYPE_CHECKING:
+    from expnote.recording.recorder import Recorder
+
+
+def grid(space: Dict[str, Iterable[Any]]) -> Iterator[dict]:
+    """Generate all combinations of the parameter values.
+
+    Example:
+        >>> list(grid({'lr': [0.1, 0.01], 'batch_size': [32]}))
+        [{'lr': 0.1, 'batch_size': 32}, {'lr': 0.01, 'batch_size': 32}]
+    """
+    names = list(space.keys())
+    for values in itertools.product(*[list(v) for v in space.values()]):
+        yield dict(zip(names, values))
+
+
+def random_search(space: Dict[str, Any],
+                  num_samples: int,
+                  seed: Optional[int] = None,
+                 ) -> Iterator[dict]:
+    """Generate parameter sets sampled randomly.
+
+    Args:
+        space (dict): Parameter name -> a sequence of candidate values or
+            a function to sample a value from a `random.Random` object.
+        num_samples (int): The number of parameter sets.
+        seed (int, optional): A random seed.
+
+    Example:
+        >>> space = {'lr': lambda rng: 10 ** rng.uniform(-4, -1),
+        ...          'batch_size': [32, 64]}
+        >>> params_list = list(random_search(space, num_samples=10))
+    """
+    rng = random.Random(seed)
+    for _ in range(num_samples):
+        params = {}
+        for name, values in space.items():
+            if callable(values):
+                params[name] = values(rng)
+            else:
+                params[name] = rng.choice(list(values))
+        yield params
+
+
+@dataclass
+class SweepResult:
+    """A result of a function call in a sweep."""
+    params: dict
+    run_id: Optional[str] = None
+    value: Any = None
+    error: Optional[str] = None
+    # True if a completed run with the params exists (see `run_id`)
+    skipped: bool = False
+
+
+def _run_trial(recorder: 'Recorder',
+               func: Callable[..., Any],
+               params: dict,
+               run_id: str,
+               skip_if_exists: bool = False,
+              ) -> SweepResult:
+    """Record a run of the function in a worker process."""
+    result = SweepResult(params=params, run_id=run_id)
+    # the recorder is a copy sent to the worker process for this call
+    recorder.run_id = run_id
+
+    def trial():
+        recorder.params(params)
+        return func(**params)
+
+    try:
+        value = recorder.scope(trial, skip_if_exists=skip_if_exists)()
+        if (skip_if_exists and isinstance(value, Run) and
+                value.id != result.run_id):
+            result.run_id = value.id
+            result.skipped = True
+        else:
+            result.value = value
+    except Exception as e:
+        result.error = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def _mark_interrupted(recorder: 'Recorder', run_id: str) -> None:
+    """Mark a run left by a terminated worker process as interrupted."""
+    try:
+        run = recorder.repo.get_run(run_id, include_step_metrics=False)
+    except KeyError:
+        # terminated before the run was saved
+        return
+    if (run.info or {}).get('status', 'running') == 'running':
+        run.info = dict(run.info or {}, status='interrupted')
+        recorder.repo.save_run(run, include_step_metrics=False)
+
+
+def run_sweep(recorder: 'Recorder',
+              func: Callable[..., Any],
+              params_list: Iterable[dict],
+              workers: int = 1,
+              experiment: Optional[Experiment] = None,
+              skip_if_exists: bool = False,
+             ) -> List[SweepResult]:
+    """Call the function with each parameter set in a process pool.
+
+    See `Recorder.sweep` for details.
+
+    When a worker process dies, the pool is broken and all the calls in
+    flight fail, so the process which died is unknown. Their runs are
+    marked as interrupted, and the calls are retried one at a time in a
+    new pool to find the call which terminates its process. The other
+    calls are recorded again as new runs.
+    """
+    from concurrent.futures import FIRST_COMPLETED
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    if workers < 1:
+        raise ValueError('workers must be positive ({})'.format(workers))
+
+    params_iter = iter(enumerate(params_list))
+    results = {}
+    pending = {}
+    # calls in flight when a worker process died, retried one at a time
+    suspects = []
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(index: int, params: dict) -> None:
+        run_id = uuid.uuid4().hex
+        future = executor.submit(_run_trial, recorder, func, params, run_id,
+                                 skip_if_exists)
+        pending[future] = (index, params, run_id)
+
+    try:
+        while True:
+            if suspects:
+                if not pending:
+                    submit(*suspects.pop(0))
+            else:
+                # keep at most `workers` calls in flight, so that parameter
+                # sets given by a generator are consumed lazily
+                for index, params in itertools.islice(
+                        params_iter, workers - len(pending)):
+                    submit(index, params)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = []
+            for future in done:
+                index, params, run_id = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except BrokenProcessPool:
+                    # a worker process died (e.g. killed by the OS)
+                    broken.append((index, params, run_id))
+                except Exception as e:
+                    results[index] = SweepResult(
+                        params=params, run_id=run_id,
+                        error='{}: {}'.format(type(e).__name__, e))
+            if not broken:
+                continue
+
+            # the pool cannot be used anymore
+            broken += pending.values()
+            pending = {}
+            executor.shutdown(wait=True)
+            executor = ProcessPoolExecutor(max_workers=workers)
+            for index, params, run_id in broken:
+                _mark_interrupted(recorder, run_id)
+            if len(broken) == 1:
+                # the only call in flight terminated its process
+                index, params, run_id = broken[0]
+                results[index] = SweepResult(
+                    params=params, run_id=run_id,
+                    error='Worker process terminated')
+            else:
+                suspects += [(index, params) for index, params, _ in broken]
+                suspects.sort(key=lambda suspect: suspect[0])
+    finally:
+        executor.shutdown(wait=True)
+
+    results = [results[index] for index in sorted(results)]
+
+    if experiment is not None:
+        run_ids = [r.run_id for r in results if r.run_id is not None]
+        repo = recorder.repo
+        with repo.open_workspace() as workspace:
+            experiment = repo.save_experiment(experiment)
+            workspace.add_uncommitted_experiment(experiment.id)
+            for run_id in run_ids:
+                workspace.assign_run_to_experiment(run_id, experiment.id)
+
+    return results
@@ -0,0 +1,150 @@
+"""
+Compression codecs of stored objects.
+
+Compressed objects are detected by the magic bytes of the codecs, so that
+plain and compressed objects can be mixed in a repository (e.g. while it
+is migrated). All the formats allow concatenated streams, which is used to
+append data to a compressed object.
+"""
+
+
+import io
+from typing import BinaryIO
+from typing import Dict
+from typing import Optional
+
+
+# bytes to be read to detect the codec of an object
+MAGIC_SIZE = 6
+
+
+class Codec:
+    """A compression codec."""
+
+    name = ''
+    magic = b''
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def open_reader(self, f: BinaryIO) -> BinaryIO:
+        """Open a stream to decompress data read from the file object."""
+        raise NotImplementedError
+
+    def decompress_head(self, data: bytes) -> bytes:
+        """Decompress the beginning of a stream (`data` can be truncated)."""
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    """Deflate (zlib) in the gzip format, which supports multiple members.
+
+    The fastest level is used by default, since higher levels are several
+    times slower and reduce JSON of step metrics only slightly more.
+    """
+
+    name = 'zlib'
+    magic = b'\x1f\x8b'
+
+    def __init__(self, level: int = 1) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        import gzip
+        # mtime is fixed to make the output deterministic
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def open_reader(self, f: BinaryIO) -> BinaryIO:
+        import gzip
+        return gzip.GzipFile(fileobj=f, mode='rb')
+
+    def decompress_head(self, data: bytes) -> bytes:
+        import zlib
+        # the gzip format
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS).decompress(data)
+
+
+class LzmaCodec(Codec):
+    """LZMA in the xz format."""
+
+    name = 'lzma'
+    magic = b'\xfd7zXZ\x00'
+
+    def compress(self, data: bytes) -> bytes:
+        import lzma
+        return lzma.compress(data)
+
+    def open_reader(self, f: BinaryIO) -> BinaryIO:
+        import lzma
+        return lzma.LZMAFile(f, mode='rb')
+
+    def decompress_head(self, data: bytes) -> bytes:
+        import lzma
+        return lzma.LZMADecompressor().decompress(data)
+
+
+class ZstdCodec(Codec):
+    """Zstandard (requires the `zstandard` package)."""
+
+    name = 'zstd'
+    magic = b'\x28\xb5\x2f\xfd'
+
+    def __init__(self, level: int = 3) -> None:
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def open_reader(self, f: BinaryIO) -> BinaryIO:
+        return self._decompressor.stream_reader(f, read_across_frames=True)
+
+    def decompress_head(self, data: bytes) -> bytes:
+        return self._decompressor.decompressobj().decompress(data)
+
+
+_CODEC_CLASSES = {cls.name: cls for cls in (ZlibCodec, LzmaCodec, ZstdCodec)}
+CODECS = tuple(_CODEC_CLASSES)
+
+_codecs: Dict[str, Codec] = {}
+
+
+def get_codec(name: str) -> Codec:
+    """Get the codec of the name.
+
+    Raises:
+        ValueError if the codec is unknown or not available.
+    """
+    codec = _codecs.get(name)
+    if codec is None:
+        codec_class = _CODEC_CLASSES.get(name)
+        if codec_class is None:
+            raise ValueError('Unknown compression codec ({})'.format(name))
+        try:
+            codec = codec_class()
+        except ImportError as e:
+            raise ValueError('Compression codec {} is not available ({})'
+                             .format(name, e))
+        _codecs[name] = codec
+    return codec
+
+
+def detect_codec(head: bytes) -> Optional[Codec]:
+    """Detect the codec from the first bytes of an object.
+
+    Returns:
+        Codec or None: The codec (None for an uncompressed object).
+    """
+    for name, codec_class in _CODEC_CLASSES.items():
+        if head.startswith(codec_class.magic):
+            return get_codec(name)
+    return None
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompress data of an object (plain data is returned as it is)."""
+    codec = detect_codec(data[:MAGIC_SIZE])
+    if codec is None:
+        return data
+    return codec.open_reader(io.BytesIO(data)).read()
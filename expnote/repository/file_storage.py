@@ -4,16 +4,84 @@ Local file storage.
 
 
 from contextlib import contextmanager
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from typing import IO
 from typing import Optional
 from typing import List
 from typing import Union
+from typing import TYPE_CHECKING
 from pathlib import Path
+import uuid
 
-import filelock
-from PIL import Image
+from .compression import MAGIC_SIZE
+from .compression import Codec
+from .compression import detect_codec
+from .compression import get_codec
+from .pack import PackSet
+from .pack import write_pack
+
+if TYPE_CHECKING:
+    import filelock
 
 
 DIR_NAME = '.expnote'
+CONFIG_NAME = 'config'
+BLOB_DIR = 'blobs/'
+PACK_DIR = 'packs/'
+
+# 'flat': <dir>/<name>, 'fanout': <dir>/<2 hex>/<2 hex>/<name>
+LAYOUTS = ('flat', 'fanout')
+# the layout of repositories created before the config was introduced
+LEGACY_LAYOUT = 'flat'
+DEFAULT_LAYOUT = 'fanout'
+HASH_CHUNK_SIZE = 1 << 20
+
+# ioctl request to clone a file by reflink (copy-on-write) on Linux
+_FICLONE = 0x40049409
+
+
+def hash_file(file_path: Union[str, Path]) -> str:
+    """Compute the SHA-256 digest of a file reading it chunk by chunk."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _clone_file(src: Path, dst: Path) -> None:
+    """Copy a file by reflink if the file system supports it."""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with src.open('rb') as fsrc, dst.open('wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            # not supported (e.g. ext4) or across file systems
+            pass
+    shutil.copyfile(src, dst)
+
+
+def _read(f: IO[bytes], data_type: str) -> Union[str, bytes]:
+    """Read an object decompressing it if it is compressed."""
+    codec = detect_codec(f.read(MAGIC_SIZE))
+    f.seek(0)
+    if codec is not None:
+        # decompressed chunk by chunk
+        f = codec.open_reader(f)
+    if data_type == 'binary':
+        return f.read()
+    return io.TextIOWrapper(f, encoding='utf-8').read()
 
 
 def _find_storage_dir(base_dir: Union[str, Path]) -> Optional[Path]:
@@ -43,11 +111,116 @@ class FileStorage:
         if self.root is None:
             raise FileNotFoundError(
                 'Local storage not found (dir name: {})'.format(DIR_NAME))
+        try:
+            self.config = json.loads((self.root / CONFIG_NAME).read_text())
+        except FileNotFoundError:
+            self.config = {}
+        self._packs = PackSet(self.root / PACK_DIR)
 
     @classmethod
     def initialize(cls) -> 'FileStorage':
         Path(DIR_NAME).mkdir()
-        return cls()
+        storage = cls()
+        storage.save_config({'layout': DEFAULT_LAYOUT})
+        return storage
+
+    def save_config(self, config: dict) -> None:
+        """Save the storage config (e.g. the layout)."""
+        # not compressed, since the codec is read from the config
+        (self.root / CONFIG_NAME).write_text(json.dumps(config, indent=2))
+        self.config = config
+
+    @property
+    def codec(self) -> Optional[Codec]:
+        """The codec to compress text objects (None for no compression)."""
+        name = self.config.get('compression')
+        return None if name is None else get_codec(name)
+
+    @property
+    def layout(self) -> str:
+        """The directory layout of objects (see `fanout_dir`)."""
+        return self.config.get('layout', LEGACY_LAYOUT)
+
+    def fanout_dir(self,
+                   directory: str,
+                   key: str,
+                   layout: Optional[str] = None,
+                  ) -> str:
+        """Get the directory of the objects of a key (e.g. a run id).
+
+        In the fan-out layout, objects are spread over subdirectories
+        named by the hash of the key (e.g. runs/3f/a2), so that no
+        directory gets too large.
+        """
+        layout = layout or self.layout
+        if layout == 'flat':
+            return directory
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return '{}/{}/{}'.format(directory, digest[:2], digest[2:4])
+
+    def fanout_glob(self,
+                    directory: str,
+                    name_pattern: str,
+                    layout: Optional[str] = None,
+                   ) -> List[str]:
+        """Find object paths of the name pattern (see `fanout_dir`)."""
+        layout = layout or self.layout
+        if layout == 'flat':
+            return self.glob(directory + '/' + name_pattern)
+        return self.glob(directory + '/*/*/' + name_pattern)
+
+    def relayout(self, directory: str, layout: str) -> int:
+        """Move objects in the directory to the layout.
+
+        Objects are keyed by the file name before the first '.'. This can
+        be run again to complete an interrupted migration.
+
+        Returns:
+            int: The number of moved objects.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError('Unknown layout ({})'.format(layout))
+        obj_paths = []
+        for src_layout in LAYOUTS:
+            obj_paths += self.fanout_glob(directory, '*', layout=src_layout)
+
+        num_moved = 0
+        # packed objects are moved by renaming them in the pack indexes
+        renames = {}
+        for obj_path in obj_paths:
+            name = obj_path.split('/')[-1]
+            dst_path = '{}/{}'.format(
+                self.fanout_dir(directory, name.split('.')[0], layout=layout),
+                name)
+            if dst_path == obj_path:
+                continue
+            if self._packs.find(obj_path) is not None:
+                renames[obj_path] = dst_path
+            src_file = self._obj_path_to_file_path(obj_path)
+            if not src_file.is_file():
+                continue
+            dst_file = self._obj_path_to_file_path(dst_path)
+            dst_file.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src_file, dst_file)
+            self._remove_empty_dirs(src_file.parent)
+            num_moved += 1
+
+        if renames:
+            with self.lock(PACK_DIR + 'pack'):
+                self._packs.refresh()
+                self._packs.rename(renames)
+            num_moved += len(renames)
+        return num_moved
+
+    def _remove_empty_dirs(self, dir_path: Path) -> None:
+        """Remove the directory and its parents while they are empty."""
+        while dir_path != self.root:
+            try:
+                dir_path.rmdir()
+            except OSError:
+                # not empty (e.g. a new object was added in the meantime)
+                return
+            dir_path = dir_path.parent
 
     def _obj_path_to_file_path(self, obj_path: str) -> Path:
         """Get file path from object path str."""
@@ -61,51 +234,265 @@ class FileStorage:
     def save(self, data: str, obj_path: str, data_type: str = 'text') -> None:
         """Save an object to the storage.
 
+        Text data is compressed by the codec of the storage (see
+        `compression`). Text and binary data are replaced atomically, so
+        that a partially written object is never read (e.g. a run record
+        of a killed process).
+
         Args:
-            data (str or PIL.Image.Image): An object data.
+            data (str, bytes or PIL.Image.Image): An object data.
             obj_path (str): An object path for the data.
-            data_type (str, optional) : Data type in ('text', 'image').
+            data_type (str, optional) : Data type in ('text', 'binary',
+                'image').
         """
         file_path = self._obj_path_to_file_path(obj_path)
         file_path.parent.mkdir(parents=True, exist_ok=True)
-        if data_type == 'text':
-            with file_path.open('w') as f:
-                f.write(data)
+        codec = self.codec
+        if data_type in ('text', 'binary'):
+            if data_type == 'text':
+                data = data.encode()
+                if codec is not None:
+                    data = codec.compress(data)
+            tmp_path = file_path.with_name('{}.{}.tmp'.format(
+                file_path.name, uuid.uuid4().hex))
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, file_path)
         elif data_type == 'image':
             data.save(file_path)
         else:
             raise ValueError('Unknown data type ({})'.format(data_type))
 
+    def append(self, data: str, obj_path: str) -> None:
+        """Append text data to an object in the storage.
+
+        The object is created if it does not exist (compressed by the codec
+        of the storage). A packed object is copied out of the pack before
+        the data is appended.
+
+        Args:
+            data (str): Text data to be appended.
+            obj_path (str): An object path for the data.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        if not file_path.exists():
+            self._unpack(obj_path)
+        # the codec is detected from an existing object, since it can be
+        # compressed after the config of this process was loaded
+        try:
+            with file_path.open('rb') as f:
+                codec = detect_codec(f.read(MAGIC_SIZE))
+        except FileNotFoundError:
+            codec = self.codec
+        if codec is not None:
+            # data is appended to a compressed object as a new stream
+            with file_path.open('ab') as f:
+                f.write(codec.compress(data.encode()))
+            return
+        with file_path.open('a') as f:
+            f.write(data)
+
     def get(self, obj_path: str, data_type: str = 'text') -> str:
         """Get an object from the storage.
 
         Args:
             obj_path (str): An object path.
-            data_type (str, optional) : Data type in ('text', 'image').
+            data_type (str, optional) : Data type in ('text', 'binary',
+                'image').
 
         Raises:
             KeyError for non-existent object path.
 
         Returns:
-            str or PIL.Image.Image: The object data content.
+            str, bytes or PIL.Image.Image: The object data content.
         """
         file_path = self._obj_path_to_file_path(obj_path)
         if not file_path.is_file():
-            raise KeyError('Object not found ({})'.format(obj_path))
-        if data_type == 'text':
-            with file_path.open() as f:
-                data = f.read()
+            return self._get_packed(obj_path, data_type)
+        if data_type in ('text', 'binary'):
+            with file_path.open('rb') as f:
+                data = _read(f, data_type)
         elif data_type == 'image':
+            from PIL import Image
             data = Image.open(file_path)
         else:
             raise ValueError('Unknown data type ({})'.format(data_type))
         return data
 
-    def remove(self, obj_path: str) -> None:
+    def _get_packed(self, obj_path: str, data_type: str = 'text') -> str:
+        """Get an object from the packs."""
+        self._packs.refresh()
+        content = self._packs.get(obj_path)
+        if content is None:
+            raise KeyError('Object not found ({})'.format(obj_path))
+        if data_type in ('text', 'binary'):
+            return _read(io.BytesIO(content), data_type)
+        elif data_type == 'image':
+            from PIL import Image
+            return Image.open(io.BytesIO(content))
+        raise ValueError('Unknown data type ({})'.format(data_type))
+
+    def _unpack(self, obj_path: str) -> None:
+        """Copy a packed object to its file (if it does not exist)."""
+        self._packs.refresh()
+        content = self._packs.get(obj_path)
+        if content is None:
+            return
+        file_path = self._obj_path_to_file_path(obj_path)
+        tmp_path = file_path.with_name('{}.{}.tmp'.format(
+            file_path.name, uuid.uuid4().hex))
+        tmp_path.write_bytes(content)
+        try:
+            # fails if another process has created the file
+            os.link(tmp_path, file_path)
+        except FileExistsError:
+            pass
+        finally:
+            tmp_path.unlink()
+
+    def get_size(self, obj_path: str) -> int:
+        """Get the stored (i.e. compressed) size of an object.
+
+        Raises:
+            KeyError for non-existent object path.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        try:
+            return file_path.stat().st_size
+        except FileNotFoundError:
+            pass
+        self._packs.refresh()
+        buffer = self._packs.get_buffer(obj_path)
+        if buffer is None:
+            raise KeyError('Object not found ({})'.format(obj_path))
+        return len(buffer)
+
+    def get_range(self,
+                  obj_path: str,
+                  start: int = 0,
+                  size: int = -1
+                 ) -> bytes:
+        """Get a byte range of the stored (i.e. compressed) data of an object.
+
+        Only the range is read (e.g. data appended to an object).
+
+        Args:
+            obj_path (str): An object path.
+            start (int, optional): The offset of the range.
+            size (int, optional): The size of the range (to the end of the
+                object if negative).
+
+        Raises:
+            KeyError for non-existent object path.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        try:
+            with file_path.open('rb') as f:
+                f.seek(start)
+                return f.read(size)
+        except (FileNotFoundError, IsADirectoryError):
+            pass
+        self._packs.refresh()
+        buffer = self._packs.get_buffer(obj_path)
+        if buffer is None:
+            raise KeyError('Object not found ({})'.format(obj_path))
+        end = len(buffer) if size < 0 else start + size
+        return bytes(buffer[start:end])
+
+    def get_buffer(self, obj_path: str) -> Union[bytes, memoryview]:
+        """Get the stored data of an object as a buffer.
+
+        A loose object is read into memory, so that no file is kept open.
+        A packed object is a view of the memory-mapped pack, which is
+        shared by the objects in the pack.
+
+        Raises:
+            KeyError for non-existent object path.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        try:
+            return file_path.read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            pass
+        self._packs.refresh()
+        buffer = self._packs.get_buffer(obj_path)
+        if buffer is None:
+            raise KeyError('Object not found ({})'.format(obj_path))
+        return buffer
+
+    def recompress(self, obj_paths: List[str]) -> int:
+        """Compress text objects by the codec of the storage.
+
+        Objects are decompressed if the storage has no codec. Each object
+        is replaced atomically, so this can be run again to complete an
+        interrupted migration. Packed objects are kept as they are.
+
+        Objects must not be appended to during the conversion (data
+        appended between reading and replacing an object is lost), so
+        recording processes and the daemon should be stopped.
+
+        Returns:
+            int: The number of converted objects.
+        """
+        codec = self.codec
+        num_converted = 0
+        for obj_path in obj_paths:
+            file_path = self._obj_path_to_file_path(obj_path)
+            try:
+                with file_path.open('rb') as f:
+                    object_codec = detect_codec(f.read(MAGIC_SIZE))
+                    f.seek(0)
+                    if object_codec is codec:
+                        continue
+                    data = _read(f, 'binary')
+            except FileNotFoundError:
+                continue
+            if codec is not None:
+                data = codec.compress(data)
+            tmp_path = file_path.with_name('{}.{}.tmp'.format(
+                file_path.name, uuid.uuid4().hex))
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, file_path)
+            num_converted += 1
+        return num_converted
+
+    def pack(self, obj_paths: List[str]) -> int:
+        """Move objects into a new pack.
+
+        Packed objects are read through `mmap` without opening their
+        files. Objects should not be modified after they are packed (e.g.
+        runs of committed experiments), since an object saved again is
+        stored out of the pack. Objects packed already are skipped.
+
+        Returns:
+            int: The number of packed objects.
+        """
+        with self.lock(PACK_DIR + 'pack'):
+            objects = []
+            for obj_path in obj_paths:
+                file_path = self._obj_path_to_file_path(obj_path)
+                try:
+                    objects.append((obj_path, file_path.read_bytes()))
+                except FileNotFoundError:
+                    continue
+            if not objects:
+                return 0
+
+            name = '{:016x}'.format(time.time_ns())
+            write_pack(self.root / PACK_DIR, name, objects)
+            for obj_path, _ in objects:
+                file_path = self._obj_path_to_file_path(obj_path)
+                file_path.unlink()
+                self._remove_empty_dirs(file_path.parent)
+        return len(objects)
+
+    def remove(self, obj_path: str, remove_empty_dirs: bool = True) -> None:
         """Remove an object from the storage.
 
         Args:
             obj_path (str): An object path.
+            remove_empty_dirs (bool, optional): If True, directories left
+                empty (e.g. fan-out directories) are removed.
 
         Raises:
             KeyError for non-existent object path.
@@ -114,13 +501,20 @@ class FileStorage:
         try:
             file_path.unlink()
         except FileNotFoundError:
-            raise KeyError('Object not found ({})'.format(obj_path))
+            removed = False
+        else:
+            removed = True
+            if remove_empty_dirs:
+                self._remove_empty_dirs(file_path.parent)
 
-        rel_path = file_path.relative_to(self.root)
-        if len(rel_path.parts) > 1:
-            parent_dir = file_path.parent
-            if len(list(parent_dir.iterdir())) == 0:
-                parent_dir.rmdir()
+        # a packed copy must not appear after the object is removed
+        self._packs.refresh()
+        if self._packs.find(obj_path) is not None:
+            with self.lock(PACK_DIR + 'pack'):
+                self._packs.refresh()
+                removed = self._packs.remove(obj_path) or removed
+        if not removed:
+            raise KeyError('Object not found ({})'.format(obj_path))
 
     def glob(self, obj_path_pattern: str) -> List[str]:
         """Find object paths matching with the pattern.
@@ -131,21 +525,134 @@ class FileStorage:
         Returns:
             list of str: Object path list that match the specified pattern.
         """
-        file_path_pattern = self._obj_path_to_file_path(obj_path_pattern)
+        # validate the pattern
+        self._obj_path_to_file_path(obj_path_pattern)
 
-        parent_dir = file_path_pattern.parent
-        file_name_pattern = file_path_pattern.parts[-1]
-        found = parent_dir.glob(file_name_pattern)
+        found = self.root.glob(obj_path_pattern)
 
-        obj_paths = [str(p.relative_to(self.root)) for p in found]
+        # temporary files of objects being saved are not objects
+        obj_paths = [p.relative_to(self.root).as_posix() for p in found
+                     if p.suffix != '.tmp']
+        self._packs.refresh()
+        packed = self._packs.glob(obj_path_pattern)
+        if packed:
+            obj_paths = list(dict.fromkeys(obj_paths + packed))
         return obj_paths
 
+    def file_path(self, obj_path: str) -> Path:
+        """Get the file path of an object for direct access (e.g. SQLite).
+
+        The parent directory is created if it does not exist.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return file_path
+
+    def open(self, obj_path: str, mode: str = 'r') -> IO:
+        """Open an object as a file object.
+
+        Args:
+            obj_path (str): An object path.
+            mode (str, optional): A mode to open the file (e.g. 'r', 'a').
+
+        Raises:
+            KeyError for non-existent object path in read mode.
+        """
+        file_path = self._obj_path_to_file_path(obj_path)
+        if 'r' in mode and not file_path.is_file():
+            raise KeyError('Object not found ({})'.format(obj_path))
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return file_path.open(mode)
+
     @contextmanager
-    def lock(self, obj_path: str) -> filelock.AcquireReturnProxy:
-        """Aqruire file lock."""
+    def lock(self,
+             obj_path: str,
+             timeout: float = -1
+            ) -> 'filelock.AcquireReturnProxy':
+        """Aqruire file lock.
+
+        Args:
+            obj_path (str): An object path to be locked.
+            timeout (float, optional): Timeout in seconds (negative value
+                means no timeout).
+
+        Raises:
+            TimeoutError if the lock cannot be acquired within the timeout.
+        """
+        import filelock
+
         file_path = self._obj_path_to_file_path(obj_path)
         parent_dir = file_path.parent
         file_path.parent.mkdir(parents=True, exist_ok=True)
         lock_path = parent_dir / (file_path.name + '.lock')
-        with filelock.FileLock(str(lock_path)) as proxy:
+        with filelock.FileLock(str(lock_path), timeout=timeout) as proxy:
             yield proxy
+
+    def _blob_file_path(self, digest: str) -> Path:
+        return self._obj_path_to_file_path(
+            BLOB_DIR + digest[:2] + '/' + digest[2:])
+
+    def put_blob(self, file_path: Union[str, Path], link: bool = False) -> str:
+        """Store a file as a blob named by the hash of the content.
+
+        A file with the same content is stored only once. A new blob is
+        cloned by reflink if the file system supports it, and copied
+        otherwise.
+
+        Args:
+            file_path (str or Path): A file to be stored.
+            link (bool, optional): If True, the blob is hard-linked to the
+                file when possible, so that no data is copied. The file
+                must not be modified in place after that.
+
+        Returns:
+            str: The digest of the content.
+        """
+        file_path = Path(file_path)
+        digest = hash_file(file_path)
+        blob_path = self._blob_file_path(digest)
+        if blob_path.is_file():
+            return digest
+
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        # written to a temporary file not to expose a partial blob
+        tmp_path = blob_path.parent / (uuid.uuid4().hex + '.tmp')
+        linked = False
+        if link:
+            try:
+                os.link(file_path, tmp_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked:
+            _clone_file(file_path, tmp_path)
+            tmp_path.chmod(0o444)
+        os.replace(tmp_path, blob_path)
+        return digest
+
+    def put_blob_data(self, data: bytes) -> str:
+        """Store bytes as a blob (see `put_blob`).
+
+        Returns:
+            str: The digest of the content.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_file_path(digest)
+        if not blob_path.is_file():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = blob_path.parent / (uuid.uuid4().hex + '.tmp')
+            tmp_path.write_bytes(data)
+            tmp_path.chmod(0o444)
+            os.replace(tmp_path, blob_path)
+        return digest
+
+    def blob_path(self, digest: str) -> Path:
+        """Get the file path of a blob.
+
+        Raises:
+            KeyError for non-existent blob.
+        """
+        blob_path = self._blob_file_path(digest)
+        if not blob_path.is_file():
+            raise KeyError('Blob not found ({})'.format(digest))
+        return blob_path
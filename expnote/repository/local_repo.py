@@ -4,18 +4,272 @@ File based local repository.
 
 
 from contextlib import contextmanager
+import hashlib
 import json
+import os
+from pathlib import Path
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
+from typing import Union
+import uuid
 
 from expnote.run import Run
+from expnote.step_metrics import StepMetrics
+from expnote.step_metrics import as_step_metrics
+from expnote.step_times import decode_times
+from expnote.step_times import encode_times
 from expnote.note import Table
 from expnote.note import Figure
 from expnote.note import Note
 from expnote.experiment import Experiment
 from expnote.experiment import Workspace
+from .file_storage import DEFAULT_LAYOUT
 from .file_storage import FileStorage
+from .compression import MAGIC_SIZE
+from .compression import decompress
+from .compression import detect_codec
+from .compression import get_codec
+from .wal import WriteAheadLog
+from .wal import replay_wal
+from .wal import _to_json
+from .step_columns import decode_step_columns
+from .step_columns import encode_step_columns
+from .run_index import RunIndex
+
+
+STEP_LOG_SUFFIX = '.steps'
+STEP_COLUMNS_SUFFIX = '.stepcols'
+WAL_DIR = 'wal/'
+INBOX_DIR = 'workspaces/default.inbox/'
+DAEMON_SOCKET = 'daemon.sock'
+SHARD_SUFFIX = '.rank'
+PARAMS_INDEX_DIR = 'index/params/'
+RUN_INDEX = 'index/runs.db'
+RUN_INDEX_INBOX_DIR = 'index/runs.inbox/'
+RUN_DIR = 'runs'
+
+# run statuses in the order of priority to merge shards
+_STATUS_ORDER = ('failed', 'interrupted', 'running', 'complete')
+
+# bytes of a step log read to check its generation
+_LOG_HEAD_SIZE = 4096
+
+# keys of step numbers, which are not averaged between ranks, for shards
+# saved without the step keys used to record them
+_STEP_KEYS = ('epoch', 'epochs',
+              'step', 'steps',
+              'iteration', 'iterations', 'iter')
+
+
+def _run_name(run_id: str, rank: Optional[int] = None) -> str:
+    """Get the file name of the run (or the shard of the rank)."""
+    if rank is None:
+        return run_id
+    return run_id + SHARD_SUFFIX + str(rank)
+
+
+def params_hash(params: dict) -> str:
+    """Compute a hash of params which does not depend on the key order."""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'),
+                           default=_to_json)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _merge_values(values: List[Any]) -> Any:
+    """Merge values of ranks.
+
+    Dicts are merged key by key. Numeric values are averaged if they differ
+    and the value of the first rank is used for other values.
+    """
+    if all(isinstance(v, dict) for v in values):
+        keys = []
+        for value in values:
+            keys.extend(k for k in value if k not in keys)
+        return {k: _merge_values([v[k] for v in values if k in v])
+                for k in keys}
+    if all(v == values[0] for v in values[1:]):
+        return values[0]
+    if all(type(v) in (int, float) for v in values):
+        return sum(values) / len(values)
+    return values[0]
+
+
+def _merge_infos(infos: List[Optional[dict]]) -> Optional[dict]:
+    """Merge run infos of ranks (the most severe status is used)."""
+    infos = [info for info in infos if info is not None]
+    if not infos:
+        return None
+    info = dict(infos[0])
+    statuses = [i['status'] for i in infos if i.get('status') in _STATUS_ORDER]
+    if statuses:
+        info['status'] = min(statuses, key=_STATUS_ORDER.index)
+    if 'end_time' in info:
+        end_times = [i.get('end_time') for i in infos]
+        info['end_time'] = None if None in end_times else max(end_times)
+    return info
+
+
+def _merge_rows(rows: List[dict], step_keys: Sequence[str]) -> dict:
+    """Merge rows of step metrics of ranks (step numbers are kept)."""
+    merged = _merge_values(rows)
+    for key in step_keys:
+        if key in merged:
+            merged[key] = next(row[key] for row in rows if key in row)
+    return merged
+
+
+def _find_step_key(step_metrics_list: List[StepMetrics],
+                   step_keys: Sequence[str]
+                  ) -> Optional[str]:
+    """Find a step key set in all the rows of the ranks."""
+    for key in step_keys:
+        if all(sm.has_value(index, key)
+               for sm in step_metrics_list for index in range(len(sm))):
+            return key
+    return None
+
+
+def _merge_step_metrics(step_metrics_list: List[StepMetrics],
+                        step_keys: Optional[Sequence[str]] = None
+                       ) -> Optional[StepMetrics]:
+    """Merge step metrics of ranks.
+
+    Rows are matched by the value of a step key (e.g. 'epoch'), so that
+    ranks can record different steps. Rows are merged row by row if no
+    step key is set in all the rows.
+
+    Args:
+        step_metrics_list (list of StepMetrics): Step metrics of the ranks.
+        step_keys (sequence of str, optional): Keys of step numbers used to
+            record the step metrics (common step key names by default).
+    """
+    step_metrics_list = [sm for sm in step_metrics_list if sm is not None]
+    if not step_metrics_list:
+        return None
+    if not step_keys:
+        step_keys = _STEP_KEYS
+    merged = StepMetrics()
+    step_key = _find_step_key(step_metrics_list, step_keys)
+    if step_key is None:
+        for index in range(max(len(sm) for sm in step_metrics_list)):
+            rows = [dict(sm[index]) for sm in step_metrics_list
+                    if index < len(sm)]
+            merged.append(_merge_rows(rows, step_keys))
+        return merged
+
+    # step number -> rows of the step
+    steps = {}
+    for sm in step_metrics_list:
+        for row in sm.tolist():
+            steps.setdefault(row[step_key], []).append(row)
+    step_nums = list(steps)
+    try:
+        step_nums.sort()
+    except TypeError:
+        # keep the order of the ranks
+        pass
+    for step_num in step_nums:
+        merged.append(_merge_rows(steps[step_num], step_keys))
+    return merged
+
+
+def _combine_summaries(summaries: List[dict]) -> dict:
+    """Combine summaries of a metric of ranks field by field."""
+    summaries = [s for s in summaries if s['count'] > 0]
+    if not summaries:
+        return {'last': None, 'min': None, 'argmin': None, 'max': None,
+                'argmax': None, 'mean': None, 'count': 0}
+    min_summary = min(summaries, key=lambda s: s['min'])
+    max_summary = max(summaries, key=lambda s: s['max'])
+    count = sum(s['count'] for s in summaries)
+    return {
+        'last': _merge_values([s['last'] for s in summaries]),
+        'min': min_summary['min'],
+        'argmin': min_summary['argmin'],
+        'max': max_summary['max'],
+        'argmax': max_summary['argmax'],
+        'mean': sum(s['mean'] * s['count'] for s in summaries) / count,
+        'count': count,
+    }
+
+
+def _merge_summaries(summaries_list: List[Optional[dict]],
+                     step_metrics: Optional[StepMetrics],
+                     step_keys: Sequence[str]
+                    ) -> Optional[dict]:
+    """Merge summaries of ranks.
+
+    The summaries are recomputed from the merged step metrics if they are
+    loaded, so that they agree with the merged curves. Otherwise, the
+    summaries of the ranks are combined (e.g. the minimum of the ranks).
+    """
+    names = list(dict.fromkeys(
+        name for summaries in summaries_list for name in summaries or {}))
+    if not names:
+        return None
+    recomputed = {}
+    if step_metrics is not None:
+        step_key = _find_step_key([step_metrics], step_keys or _STEP_KEYS)
+        recomputed = step_metrics.summarize(step_key)
+    return {name: recomputed.get(name) or _combine_summaries(
+                [s[name] for s in summaries_list if name in (s or {})])
+            for name in names}
+
+
+def _merge_shards(run_id: str, shards: List[Run]) -> Run:
+    """Aggregate shards of ranks into a run."""
+    step_keys = list(dict.fromkeys(
+        key for s in shards for key in s.step_keys or []))
+    step_metrics = _merge_step_metrics([s.step_metrics for s in shards],
+                                       step_keys)
+    return Run(
+        id=run_id,
+        params=_merge_values([s.params for s in shards]),
+        metrics=_merge_values([s.metrics for s in shards]),
+        step_metrics=step_metrics,
+        info=_merge_infos([s.info for s in shards]),
+        system_metrics=_merge_step_metrics(
+            [s.system_metrics for s in shards]),
+        summaries=_merge_summaries([s.summaries for s in shards],
+                                   step_metrics, step_keys),
+        # steps are synchronized between ranks in most cases
+        step_times=next((s.step_times for s in shards
+                         if s.step_times is not None), None),
+        timing=_merge_values([s.timing or {} for s in shards]) or None,
+        artifacts=_merge_values([s.artifacts or {} for s in shards]) or None,
+        step_keys=step_keys or None,
+    )
+
+
+def _match_log_stamp(head: bytes, size: int, stamp: Optional[dict]) -> bool:
+    """Test if a step log is the one which a step columns file was made from.
+
+    The generation id in the first line of the log changes when the log is
+    saved again, and the codec changes when the log is recompressed.
+
+    Args:
+        head (bytes): The head of the stored log.
+        size (int): The stored size of the log.
+        stamp (dict, optional): The stamp of the log in the columns file.
+    """
+    if not stamp or stamp['size'] > size:
+        return False
+    codec = detect_codec(head[:MAGIC_SIZE])
+    if (None if codec is None else codec.name) != stamp['codec']:
+        return False
+    if codec is not None:
+        head = codec.decompress_head(head)
+    try:
+        generation = json.loads(head.partition(b'\n')[0])['generation']
+    except (ValueError, KeyError, TypeError):
+        return False
+    return generation == stamp['generation']
 
 
 class LocalRepository:
@@ -23,41 +277,526 @@ class LocalRepository:
 
     def __init__(self) -> None:
         self._storage = FileStorage()
+        self._index = RunIndex(self._storage.file_path(RUN_INDEX),
+                               self._scan_run_ids)
+        # run ids added to the index by this object
+        self._indexed = set()
 
     @classmethod
     def initialize(cls) -> 'LocalRepository':
         FileStorage.initialize()
         return cls()
 
-    def save_run(self, run: Run) -> None:
-        """Save the run data."""
+    def _run_path(self, run_id: str, rank: Optional[int] = None) -> str:
+        """Get the object path of the run (or the shard of the rank)."""
+        return '{}/{}'.format(self._storage.fanout_dir(RUN_DIR, run_id),
+                              _run_name(run_id, rank))
+
+    def migrate_layout(self, layout: str = DEFAULT_LAYOUT) -> int:
+        """Move the run files to the directory layout.
+
+        Recording processes (and the daemon) should be stopped during the
+        migration. An interrupted migration is completed by running it
+        again.
+
+        Returns:
+            int: The number of moved files.
+        """
+        num_moved = self._storage.relayout(RUN_DIR, layout)
+        config = dict(self._storage.config, layout=layout)
+        self._storage.save_config(config)
+        return num_moved
+
+    def migrate_compression(self, codec: Optional[str]) -> int:
+        """Set the compression codec and convert the stored objects.
+
+        Recording processes (and the daemon) should be stopped during the
+        migration, since data appended to an object while it is converted
+        is lost. An interrupted migration is completed by running it
+        again.
+
+        Args:
+            codec (str, optional): A codec name in `compression.CODECS`
+                (None for no compression).
+
+        Returns:
+            int: The number of converted objects.
+        """
+        if codec is not None:
+            # raise ValueError for an unknown or unavailable codec
+            get_codec(codec)
+        config = dict(self._storage.config, compression=codec)
+        if codec is None:
+            del config['compression']
+        self._storage.save_config(config)
+
+        obj_paths = [p for p in self._storage.fanout_glob(RUN_DIR, '*')
+                     if not p.endswith(STEP_COLUMNS_SUFFIX)]
+        obj_paths += self._storage.glob('experiments/*/data')
+        obj_paths += self._storage.glob(PARAMS_INDEX_DIR + '*')
+        obj_paths.append('workspaces/default')
+        return self._storage.recompress(obj_paths)
+
+    def save_run(self,
+                 run: Run,
+                 include_step_metrics: bool = True,
+                 rank: Optional[int] = None,
+                ) -> None:
+        """Save the run data.
+
+        Step metrics are saved to a step log next to the run record, to
+        which `append_step_metrics` appends rows later, and to a binary
+        step columns file (see `step_columns`) to load them fast. If
+        `include_step_metrics` is False, the stored step metrics are kept
+        as they are and only the other fields are saved.
+
+        If `rank` is specified, the data is saved to the shard of the rank,
+        so that processes of the ranks can record one run without locking.
+        """
         data = {
             'id': run.id,
             'params': run.params,
             'metrics': run.metrics,
         }
-        if run.step_metrics is not None:
-            data['step_metrics'] = run.step_metrics
         if run.info is not None:
             data['info'] = run.info
-        obj_path = 'runs/' + run.id
+        if run.system_metrics is not None:
+            data['system_metrics'] = as_step_metrics(
+                run.system_metrics).to_dict()
+        if run.summaries is not None:
+            data['summaries'] = run.summaries
+        if run.timing is not None:
+            data['timing'] = run.timing
+        if run.artifacts is not None:
+            data['artifacts'] = run.artifacts
+        if run.step_keys is not None:
+            data['step_keys'] = run.step_keys
+        obj_path = self._run_path(run.id, rank)
         self._storage.save(json.dumps(data), obj_path)
+        if run.id not in self._indexed:
+            # a marker is merged into the run index on read, so that
+            # recording processes never wait for the lock of the index
+            self._storage.save('', RUN_INDEX_INBOX_DIR + run.id)
+            self._indexed.add(run.id)
+        if (run.info or {}).get('status') == 'complete':
+            self._index_params(run.id, run.params)
+
+        if not include_step_metrics:
+            return
+
+        steps_path = obj_path + STEP_LOG_SUFFIX
+        columns_path = obj_path + STEP_COLUMNS_SUFFIX
+        if run.step_metrics is not None:
+            step_metrics = as_step_metrics(run.step_metrics)
+            # the generation identifies the saved log in the columns file
+            generation = uuid.uuid4().hex
+            content = (json.dumps({'generation': generation}) + '\n' +
+                       json.dumps(step_metrics.to_dict()) + '\n')
+            if run.step_times:
+                content += json.dumps({'time_row': 0, 'times': encode_times(
+                    run.step_times)}) + '\n'
+            self._storage.save(content, steps_path)
+            codec = self._storage.codec
+            log_stamp = {
+                'size': self._storage.get_size(steps_path),
+                'generation': generation,
+                'codec': None if codec is None else codec.name,
+            }
+            self._storage.save(
+                encode_step_columns(step_metrics, run.step_times, log_stamp),
+                columns_path, data_type='binary')
+        else:
+            for path in (steps_path, columns_path):
+                try:
+                    self._storage.remove(path)
+                except KeyError:
+                    pass
+
+    def append_step_metrics(self,
+                            run_id: str,
+                            rows: List[Tuple[int, dict]],
+                            rank: Optional[int] = None,
+                            times: Optional[Tuple[int, List[float]]] = None,
+                           ) -> None:
+        """Append (row index, step data) pairs to the step log of the run.
+
+        A row appended later overwrites the values of the same row.
+        `times` is a pair of a row index and timestamps of the rows from
+        the index, which are delta-encoded (see `encode_times`).
+        """
+        lines = [json.dumps({'row': index, 'data': data}) + '\n'
+                 for index, data in rows]
+        if times is not None and times[1]:
+            lines.append(json.dumps({'time_row': times[0],
+                                     'times': encode_times(times[1])}) + '\n')
+        self._storage.append(''.join(lines),
+                             self._run_path(run_id, rank) + STEP_LOG_SUFFIX)
+
+    def _index_params(self, run_id: str, params: dict) -> None:
+        """Add the run to the index of params of completed runs."""
+        obj_path = PARAMS_INDEX_DIR + params_hash(params)
+        try:
+            run_ids = self._storage.get(obj_path).split()
+        except KeyError:
+            run_ids = []
+        if run_id not in run_ids:
+            self._storage.append(run_id + '\n', obj_path)
+
+    def find_runs_by_params(self, params: dict) -> List[Run]:
+        """Find completed runs with the same params.
+
+        Runs are looked up in the index of params hashes, so that the cost
+        does not depend on the number of runs. Step metrics are not loaded.
+        """
+        digest = params_hash(params)
+        try:
+            content = self._storage.get(PARAMS_INDEX_DIR + digest)
+        except KeyError:
+            return []
+        runs = []
+        for run_id in dict.fromkeys(content.split()):
+            try:
+                run = self.get_run(run_id, include_step_metrics=False)
+            except KeyError:
+                # removed after it was indexed
+                continue
+            # params can be changed after it was indexed
+            if (params_hash(run.params) == digest and
+                    (run.info or {}).get('status') == 'complete'):
+                runs.append(run)
+        return runs
+
+    def _load_step_metrics(self,
+                           obj_path: str
+                          ) -> Tuple[Optional[StepMetrics],
+                                     Optional[List[float]]]:
+        """Load step metrics and their timestamps from the step log.
+
+        Step metrics saved by `save_run` are loaded from the step columns
+        file, and only the data appended to the log later (after the stored
+        size recorded in the columns file) is read and parsed.
+        """
+        log_path = obj_path + STEP_LOG_SUFFIX
+        try:
+            log_size = self._storage.get_size(log_path)
+        except KeyError:
+            return None, None
+
+        step_metrics = StepMetrics()
+        times = []
+        start = 0
+        try:
+            columns_buffer = self._storage.get_buffer(
+                obj_path + STEP_COLUMNS_SUFFIX)
+            header, columns, columns_times = decode_step_columns(
+                columns_buffer)
+        except (KeyError, ValueError):
+            # e.g. runs saved before step columns files were introduced
+            pass
+        else:
+            # the step log can be saved again without the columns file if
+            # the writer was killed in between
+            head = self._storage.get_range(log_path, 0, _LOG_HEAD_SIZE)
+            if _match_log_stamp(head, log_size, header.get('log')):
+                step_metrics = columns
+                times = columns_times or []
+                start = header['log']['size']
 
-    def get_run(self, run_id: str) -> Run:
-        """Get the run data."""
-        obj_path = 'runs/' + run_id
+        # appended data is compressed separately (see `FileStorage.append`)
+        content = decompress(self._storage.get_range(log_path, start)).decode()
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line can be broken if the writer was killed
+                continue
+            if 'generation' in entry:
+                continue
+            if 'columns' in entry:
+                step_metrics = StepMetrics.from_dict(entry)
+                times = []
+            elif 'time_row' in entry:
+                start = entry['time_row']
+                if start > len(times):
+                    times += [float('nan')] * (start - len(times))
+                decoded = decode_times(entry['times'])
+                times[start:start + len(decoded)] = decoded
+            else:
+                step_metrics.set_row(entry['row'], entry['data'])
+        return step_metrics, times or None
+
+    def _load_run(self, obj_path: str, include_step_metrics: bool) -> Run:
         data = json.loads(self._storage.get(obj_path))
+        if not include_step_metrics:
+            data.pop('step_metrics', None)
+        elif isinstance(data.get('step_metrics'), dict):
+            # columnar format (records in a list are also supported)
+            data['step_metrics'] = StepMetrics.from_dict(data['step_metrics'])
+        if 'system_metrics' in data:
+            data['system_metrics'] = StepMetrics.from_dict(
+                data['system_metrics'])
+        if include_step_metrics:
+            step_metrics, step_times = self._load_step_metrics(obj_path)
+            if step_metrics is not None:
+                data['step_metrics'] = step_metrics
+                data['step_times'] = step_times
         return Run(**data)
 
+    def _load_shards(self,
+                     run_id: str,
+                     include_step_metrics: bool
+                    ) -> Dict[int, Run]:
+        """Load the shards of the run recorded by ranks."""
+        prefix = self._run_path(run_id) + SHARD_SUFFIX
+        # step logs of the shards are also found
+        ranks = [p[len(prefix):] for p in self._storage.glob(prefix + '*')]
+        ranks = sorted(int(rank) for rank in ranks if rank.isdecimal())
+        return {rank: self._load_run(prefix + str(rank), include_step_metrics)
+                for rank in ranks}
+
+    def get_run(self,
+                run_id: str,
+                ranks: str = 'aggregate',
+                include_step_metrics: bool = True,
+               ) -> Run:
+        """Get the run data.
+
+        If `include_step_metrics` is False, step metrics are not loaded,
+        which is much faster for long runs (their summaries are loaded).
+
+        A run recorded by multiple ranks is merged from the shards of the
+        ranks. If `ranks` is 'aggregate', numeric values which differ
+        between the ranks are averaged, and step metrics are merged row by
+        row. If `ranks` is 'separate', only params and info are merged, and
+        the run of each rank is set to `shards` of the run.
+        """
+        try:
+            return self._load_run(self._run_path(run_id), include_step_metrics)
+        except KeyError:
+            shards = self._load_shards(run_id, include_step_metrics)
+            if not shards:
+                raise
+
+        if ranks == 'aggregate':
+            return _merge_shards(run_id, list(shards.values()))
+        elif ranks == 'separate':
+            return Run(
+                id=run_id,
+                params=_merge_values([s.params for s in shards.values()]),
+                metrics={},
+                info=_merge_infos([s.info for s in shards.values()]),
+                shards=shards,
+            )
+        raise ValueError('Unknown ranks option ({})'.format(ranks))
+
     def remove_run(self, run_id: str) -> None:
-        """Remove the run data."""
-        obj_path = 'runs/' + run_id
-        self._storage.remove(obj_path)
+        """Remove the run data (including the shards).
+
+        Blobs of the artifacts are kept since they can be shared by runs.
+        """
+        obj_paths = self._run_obj_paths(run_id)
+        if not obj_paths:
+            raise KeyError('Run not found ({})'.format(run_id))
+        for path in obj_paths:
+            self._storage.remove(path)
+        try:
+            self._storage.remove(RUN_INDEX_INBOX_DIR + run_id,
+                                 remove_empty_dirs=False)
+        except KeyError:
+            pass
+        self._index.remove(run_id)
+        self._indexed.discard(run_id)
+
+    def _run_obj_paths(self, run_id: str) -> List[str]:
+        """List the object paths of the run (including the shards)."""
+        obj_path = self._run_path(run_id)
+        return [p for p in self._storage.glob(obj_path + '*')
+                if p == obj_path or
+                p[len(obj_path):] in (STEP_LOG_SUFFIX, STEP_COLUMNS_SUFFIX) or
+                p[len(obj_path):].startswith(SHARD_SUFFIX)]
+
+    def pack_runs(self, run_ids: List[str]) -> int:
+        """Move the files of runs into a pack (see `FileStorage.pack`).
+
+        Runs should not be updated after they are packed (e.g. runs of
+        committed experiments). Runs packed already and runs still
+        recorded (with the 'running' status) are skipped.
+
+        Returns:
+            int: The number of packed files.
+        """
+        obj_paths = []
+        for run_id in run_ids:
+            try:
+                run = self.get_run(run_id, include_step_metrics=False)
+            except KeyError:
+                continue
+            if (run.info or {}).get('status') == 'running':
+                continue
+            obj_paths += self._run_obj_paths(run_id)
+        return self._storage.pack(obj_paths)
+
+    def discard_run(self, run_id: str) -> None:
+        """Remove the run data and the run from the workspace."""
+        try:
+            self.remove_run(run_id)
+        except KeyError:
+            pass
+        with self.open_workspace() as workspace:
+            try:
+                workspace.remove_run(run_id)
+            except KeyError:
+                pass
+
+    def save_blob(self,
+                  file_path: Union[str, Path],
+                  link: bool = False,
+                 ) -> dict:
+        """Store a file in the content-addressed blob store.
+
+        Returns:
+            dict: A reference to the blob ({'digest': ..., 'size': ...}),
+                which is kept in `artifacts` of a run.
+        """
+        digest = self._storage.put_blob(file_path, link=link)
+        return {'digest': digest, 'size': os.path.getsize(file_path)}
+
+    def save_blob_data(self, data: bytes) -> dict:
+        """Store bytes in the blob store (see `save_blob`)."""
+        digest = self._storage.put_blob_data(data)
+        return {'digest': digest, 'size': len(data)}
+
+    def get_blob_path(self, digest: str) -> Path:
+        """Get the file path of a blob (do not modify the file).
+
+        Raises:
+            KeyError for non-existent blob.
+        """
+        return self._storage.blob_path(digest)
+
+    def get_blob(self, digest: str) -> bytes:
+        """Get the content of a blob."""
+        return self.get_blob_path(digest).read_bytes()
+
+    def _scan_run_ids(self) -> List[str]:
+        """List run ids by scanning the run directory."""
+        obj_paths = self._storage.fanout_glob(RUN_DIR, '*')
+        # step logs and shards share the run id
+        return sorted(set(p.split('/')[-1].split('.')[0] for p in obj_paths))
+
+    def find_run_ids(self, run_id_prefix: str = '') -> List[str]:
+        """Find run ids starting with the prefix.
 
-    def find_runs(self, run_id_prefix: str) -> List[Run]:
-        """Find runs with the specified run id pattern."""
-        obj_paths = self._storage.glob('runs/{}*'.format(run_id_prefix))
-        return [self.get_run(p[5:]) for p in obj_paths]
+        Run ids are looked up in the run index, and run records are not
+        read.
+        """
+        self._merge_index_inbox()
+        return self._index.find(run_id_prefix)
+
+    def _merge_index_inbox(self) -> None:
+        """Add run ids registered by markers in `save_run` to the index."""
+        inbox_paths = self._storage.glob(RUN_INDEX_INBOX_DIR + '*')
+        if not inbox_paths:
+            return
+        self._index.add_many(p[len(RUN_INDEX_INBOX_DIR):]
+                             for p in inbox_paths)
+        for inbox_path in inbox_paths:
+            try:
+                # the inbox directory is kept for `save_run`
+                self._storage.remove(inbox_path, remove_empty_dirs=False)
+            except KeyError:
+                # merged by another process
+                pass
+
+    def find_runs(self,
+                  run_id_prefix: str,
+                  include_step_metrics: bool = True,
+                 ) -> List[Run]:
+        """Find runs with the specified run id prefix."""
+        runs = []
+        for run_id in self.find_run_ids(run_id_prefix):
+            try:
+                runs.append(self.get_run(
+                    run_id, include_step_metrics=include_step_metrics))
+            except KeyError:
+                # removed without updating the index
+                continue
+        return runs
+
+    @contextmanager
+    def open_wal(self,
+                 run_id: str,
+                 sync_interval: float = 1.,
+                 rank: Optional[int] = None,
+                ) -> Iterator[WriteAheadLog]:
+        """Open a write-ahead log of the run (or the shard of the rank).
+
+        The log is locked while it is open, and removed when the context
+        exits without an exception or after the final run data is saved
+        (`WriteAheadLog.mark_saved`), e.g. a run failed with an exception.
+        Otherwise the log is left for `recover_runs`.
+        """
+        name = _run_name(run_id, rank)
+        obj_path = WAL_DIR + name
+        wal = None
+        try:
+            with self._storage.lock(obj_path):
+                with self._storage.open(obj_path, 'a') as f:
+                    wal = WriteAheadLog(f, sync_interval=sync_interval)
+                    try:
+                        yield wal
+                        wal.sync()
+                        wal.mark_saved()
+                    finally:
+                        if wal.saved:
+                            self._storage.remove(obj_path)
+        finally:
+            if wal is not None and wal.saved:
+                self._remove_wal_lock(name)
+
+    def recover_runs(self) -> List[str]:
+        """Recover runs from write-ahead logs left by killed processes.
+
+        Logs locked by running processes are skipped. The recovered runs
+        are saved and added to the untracked runs.
+
+        Returns:
+            list of str: Recovered run ids.
+        """
+        names = [p[len(WAL_DIR):] for p in self._storage.glob(WAL_DIR + '*')
+                 if not p.endswith('.lock')]
+        recovered = []
+        for name in names:
+            run_id, _, rank = name.partition(SHARD_SUFFIX)
+            rank = int(rank) if rank else None
+            obj_path = WAL_DIR + name
+            try:
+                with self._storage.lock(obj_path, timeout=0):
+                    try:
+                        content = self._storage.get(obj_path)
+                    except KeyError:
+                        # already recovered by another process
+                        continue
+                    run = replay_wal(run_id, content)
+                    self.save_run(run, rank=rank)
+                    self.register_run(run_id)
+                    self._storage.remove(obj_path)
+            except TimeoutError:
+                continue
+            self._remove_wal_lock(name)
+            if run_id not in recovered:
+                recovered.append(run_id)
+        return recovered
+
+    def _remove_wal_lock(self, name: str) -> None:
+        try:
+            self._storage.remove(WAL_DIR + name + '.lock')
+        except KeyError:
+            pass
+
+    def daemon_socket_path(self) -> str:
+        """Get the path of the socket of the recording daemon."""
+        return str(self._storage.root / DAEMON_SOCKET)
 
     def _generate_experiment_id(self) -> str:
         prefix = 'experiments/'
@@ -206,6 +945,13 @@ class LocalRepository:
                     **json.loads(self._storage.get('workspaces/default')))
             except KeyError:
                 workspace = Workspace()
+
+            # merge runs registered via the inbox
+            inbox_paths = sorted(self._storage.glob(INBOX_DIR + '*'))
+            for inbox_path in inbox_paths:
+                run_id = inbox_path[len(INBOX_DIR):].split('_', 1)[1]
+                workspace.add_untracked_run(run_id)
+
             yield workspace
             data = {
                 'untracked_runs': workspace._untracked_runs,
@@ -213,6 +959,18 @@ class LocalRepository:
                 'assigned_runs': workspace._assigned_runs
             }
             self._storage.save(json.dumps(data, indent=2), 'workspaces/default')
+            for inbox_path in inbox_paths:
+                # the inbox directory is kept for `register_run`
+                self._storage.remove(inbox_path, remove_empty_dirs=False)
+
+    def register_run(self, run_id: str) -> None:
+        """Add the run to the untracked runs without locking the workspace.
+
+        A marker is put into the inbox of the workspace, and it is merged
+        into the workspace when the workspace is opened next time.
+        """
+        obj_path = INBOX_DIR + '{:020d}_{}'.format(time.time_ns(), run_id)
+        self._storage.save('', obj_path)
 
 
 class FileNameAssigner:
@@ -0,0 +1,225 @@
+"""
+Packfiles to store many immutable objects in a few files.
+
+A pack consists of two files: `<name>.pack` with the concatenated contents
+of objects, and `<name>.idx` with a JSON map from object paths to the
+offsets and sizes of their contents in the pack. Contents are read through
+`mmap`, so that reading an object does not open a file.
+"""
+
+
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+import json
+import mmap
+import os
+from pathlib import Path
+import re
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+
+PACK_SUFFIX = '.pack'
+INDEX_SUFFIX = '.idx'
+
+_WILDCARD = re.compile(r'[*?[]')
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    """Write a file atomically."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with tmp_path.open('wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_pack(pack_dir: Path,
+               name: str,
+               objects: Iterable[Tuple[str, bytes]]
+              ) -> Dict[str, List[int]]:
+    """Write objects to a pack.
+
+    The index is written after the pack, so that a pack is not used until
+    it is complete.
+
+    Returns:
+        dict: The index of the pack.
+    """
+    index = {}
+    contents = []
+    offset = 0
+    for obj_path, content in objects:
+        index[obj_path] = [offset, len(content)]
+        contents.append(content)
+        offset += len(content)
+    _write_file(pack_dir / (name + PACK_SUFFIX), b''.join(contents))
+    write_index(pack_dir, name, index)
+    return index
+
+
+def write_index(pack_dir: Path,
+                name: str,
+                index: Dict[str, List[int]]
+               ) -> None:
+    """Write the index of a pack."""
+    _write_file(pack_dir / (name + INDEX_SUFFIX),
+                json.dumps(index, separators=(',', ':')).encode())
+
+
+def match_path(obj_path: str, pattern: str) -> bool:
+    """Test if an object path matches a glob pattern (e.g. runs/*/abc*)."""
+    parts = obj_path.split('/')
+    pattern_parts = pattern.split('/')
+    return (len(parts) == len(pattern_parts) and
+            all(fnmatchcase(part, pattern_part)
+                for part, pattern_part in zip(parts, pattern_parts)))
+
+
+class PackSet:
+    """Packs in a directory.
+
+    Indexes are reloaded when packs are added or updated by another
+    process. If an object is stored in multiple packs, the newest one
+    (the last in the order of names) is used.
+
+    Args:
+        pack_dir (Path): A directory of packs.
+    """
+
+    def __init__(self, pack_dir: Path) -> None:
+        self.pack_dir = pack_dir
+        # object path -> (pack name, offset, size)
+        self._objects: Dict[str, Tuple[str, int, int]] = {}
+        self._indexes: Dict[str, Dict[str, List[int]]] = {}
+        # sorted object paths to find them by prefix
+        self._sorted: Optional[List[str]] = None
+        self._stamp = None
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    def __getstate__(self) -> dict:
+        # maps cannot be pickled (e.g. to send a repository to workers)
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        state['_stamp'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+    def _index_stamp(self) -> tuple:
+        try:
+            entries = list(os.scandir(self.pack_dir))
+        except FileNotFoundError:
+            return ()
+        # an index rewritten by os.replace has a new inode
+        return tuple(sorted((e.name, e.inode(), e.stat().st_mtime_ns)
+                            for e in entries
+                            if e.name.endswith(INDEX_SUFFIX)))
+
+    def refresh(self) -> None:
+        """Reload the indexes if packs are changed."""
+        stamp = self._index_stamp()
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._indexes = {}
+        self._objects = {}
+        self._sorted = None
+        for file_name, _, _ in stamp:
+            name = file_name[:-len(INDEX_SUFFIX)]
+            try:
+                index = json.loads(
+                    (self.pack_dir / file_name).read_bytes())
+            except FileNotFoundError:
+                continue
+            self._indexes[name] = index
+            for obj_path, (offset, size) in index.items():
+                self._objects[obj_path] = (name, offset, size)
+        for name in list(self._maps):
+            if name not in self._indexes:
+                self._close_map(name)
+
+    def find(self, obj_path: str) -> Optional[str]:
+        """Get the name of the pack of an object."""
+        entry = self._objects.get(obj_path)
+        return None if entry is None else entry[0]
+
+    def get(self, obj_path: str) -> Optional[bytes]:
+        """Get the content of an object (None if it is not packed)."""
+        buffer = self.get_buffer(obj_path)
+        return None if buffer is None else bytes(buffer)
+
+    def get_buffer(self, obj_path: str) -> Optional[memoryview]:
+        """Get the content of an object without copying it."""
+        entry = self._objects.get(obj_path)
+        if entry is None:
+            return None
+        name, offset, size = entry
+        if size == 0:
+            return memoryview(b'')
+        if name not in self._maps:
+            with (self.pack_dir / (name + PACK_SUFFIX)).open('rb') as f:
+                self._maps[name] = mmap.mmap(f.fileno(), 0,
+                                             access=mmap.ACCESS_READ)
+        return memoryview(self._maps[name])[offset:offset + size]
+
+    def _close_map(self, name: str) -> None:
+        try:
+            self._maps.pop(name).close()
+        except BufferError:
+            # still used by a buffer, which keeps the map open
+            pass
+
+    def glob(self, pattern: str) -> List[str]:
+        """Find packed object paths matching the pattern."""
+        if not self._objects:
+            return []
+        if self._sorted is None:
+            self._sorted = sorted(self._objects)
+        wildcard = _WILDCARD.search(pattern)
+        prefix = pattern if wildcard is None else pattern[:wildcard.start()]
+        found = []
+        for i in range(bisect_left(self._sorted, prefix), len(self._sorted)):
+            obj_path = self._sorted[i]
+            if not obj_path.startswith(prefix):
+                break
+            if match_path(obj_path, pattern):
+                found.append(obj_path)
+        return found
+
+    def rename(self, renames: Dict[str, str]) -> None:
+        """Rename objects in the indexes."""
+        for name, index in self._indexes.items():
+            renamed = {renames.get(obj_path, obj_path): entry
+                       for obj_path, entry in index.items()}
+            if renamed != index:
+                write_index(self.pack_dir, name, renamed)
+                self._indexes[name] = renamed
+        self._stamp = None
+
+    def remove(self, obj_path: str) -> bool:
+        """Remove an object from the indexes (the pack is not rewritten).
+
+        Returns:
+            bool: True if the object was packed.
+        """
+        removed = False
+        for name, index in self._indexes.items():
+            if obj_path in index:
+                del index[obj_path]
+                if index:
+                    write_index(self.pack_dir, name, index)
+                else:
+                    # no objects are left in the pack
+                    (self.pack_dir / (name + INDEX_SUFFIX)).unlink()
+                    if name in self._maps:
+                        self._close_map(name)
+                    (self.pack_dir / (name + PACK_SUFFIX)).unlink()
+                removed = True
+        self._stamp = None
+        return removed
@@ -0,0 +1,129 @@
+"""
+An index of run ids for prefix lookup without reading run records.
+"""
+
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+
+
+class RunIndex:
+    """A SQLite index of run ids.
+
+    The index is built from `list_run_ids` when it is opened for the first
+    time (e.g. in a repository created before the index was introduced).
+    A connection is opened for each operation, so that the index can be
+    used by threads and forked processes.
+
+    Args:
+        path (Path): A database file.
+        list_run_ids (callable): A function to list all the run ids.
+        timeout (float, optional): Timeout in seconds to wait for a lock
+            held by another process.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 list_run_ids: Callable[[], Iterable[str]],
+                 timeout: float = 30.,
+                ) -> None:
+        self.path = path
+        self.list_run_ids = list_run_ids
+        self.timeout = timeout
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator['sqlite3.Connection']:
+        # imported here since sqlite3 is slow to load
+        import sqlite3
+
+        connection = sqlite3.connect(str(self.path), timeout=self.timeout,
+                                     isolation_level=None)
+        try:
+            if not self._initialized:
+                self._initialize(connection)
+            yield connection
+        finally:
+            connection.close()
+
+    def _is_built(self, connection: 'sqlite3.Connection') -> bool:
+        import sqlite3
+        try:
+            built = connection.execute(
+                "SELECT value FROM meta WHERE key = 'built'").fetchone()
+        except sqlite3.OperationalError:
+            # the tables are not created yet
+            return False
+        return built is not None
+
+    def _initialize(self, connection: 'sqlite3.Connection') -> None:
+        # checked without the write lock, which is taken only to build the
+        # index (once per repository)
+        if self._is_built(connection):
+            self._initialized = True
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, '
+                'value TEXT)')
+            built = connection.execute(
+                "SELECT value FROM meta WHERE key = 'built'").fetchone()
+            if built is None:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO runs VALUES (?)',
+                    ((run_id,) for run_id in self.list_run_ids()))
+                connection.execute(
+                    "INSERT INTO meta VALUES ('built', '1')")
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._initialized = True
+
+    def add(self, run_id: str) -> None:
+        """Add a run id."""
+        with self._connect() as connection:
+            connection.execute('INSERT OR IGNORE INTO runs VALUES (?)',
+                               (run_id,))
+
+    def add_many(self, run_ids: Iterable[str]) -> None:
+        """Add run ids in one transaction."""
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO runs VALUES (?)',
+                    ((run_id,) for run_id in run_ids))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def remove(self, run_id: str) -> None:
+        """Remove a run id."""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+
+    def find(self, prefix: str = '') -> List[str]:
+        """Find run ids starting with the prefix in the ascending order."""
+        with self._connect() as connection:
+            if not prefix:
+                rows = connection.execute('SELECT id FROM runs ORDER BY id')
+            else:
+                # a range query to use the primary key index
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                rows = connection.execute(
+                    'SELECT id FROM runs WHERE id >= ? AND id < ? '
+                    'ORDER BY id', (prefix, upper))
+            return [row[0] for row in rows]
@@ -0,0 +1,152 @@
+"""
+A binary format of step metrics to load columns without parsing JSON.
+
+A step columns file starts with a magic, the size of a JSON header and the
+header, followed by the 8-byte aligned data of numeric columns (int64 or
+float64 values followed by the mask of each column). Columns of other
+values (e.g. strings) are stored in the header as they are. The header also
+records a stamp of the step log which the file was made from (e.g. its
+stored size), so that rows appended to the log later are detected.
+"""
+
+
+from array import array
+import json
+import struct
+import sys
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from expnote.step_metrics import Column
+from expnote.step_metrics import StepMetrics
+
+
+MAGIC = b'XNSC'
+_PREFIX = struct.Struct('<4sI')
+_ALIGNMENT = 8
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGNMENT
+
+
+def encode_step_columns(step_metrics: StepMetrics,
+                        times: Optional[List[float]],
+                        log_stamp: dict
+                       ) -> bytes:
+    """Encode step metrics (and timestamps of the steps).
+
+    Args:
+        step_metrics (StepMetrics): Step metrics.
+        times (list of float, optional): Timestamps of the steps.
+        log_stamp (dict): A JSON serializable stamp of the step log of the
+            step metrics.
+    """
+    chunks = []
+    offset = 0
+
+    def add_chunk(data: bytes) -> int:
+        nonlocal offset
+        chunk_offset = offset
+        chunks.append(data)
+        chunks.append(bytes(_pad(len(data))))
+        offset += len(data) + _pad(len(data))
+        return chunk_offset
+
+    columns = {}
+    for name, column in step_metrics._columns.items():
+        if column.typecode == 'O':
+            columns[name] = {
+                'type': 'O',
+                'values': [column.get(i) for i in range(len(column))],
+            }
+            continue
+        columns[name] = {
+            'type': column.typecode,
+            'size': len(column),
+            'offset': add_chunk(column.values.tobytes()),
+            'mask_offset': add_chunk(bytes(column.mask)),
+        }
+
+    header = {
+        'num_rows': len(step_metrics),
+        'byteorder': sys.byteorder,
+        'log': log_stamp,
+        'columns': columns,
+        'times': None,
+    }
+    if times:
+        header['times'] = {'size': len(times),
+                           'offset': add_chunk(array('d', times).tobytes())}
+
+    header_data = json.dumps(header).encode()
+    header_data += b' ' * _pad(_PREFIX.size + len(header_data))
+    return b''.join([_PREFIX.pack(MAGIC, len(header_data)), header_data] +
+                    chunks)
+
+
+def read_header(buffer: Any) -> Tuple[dict, int]:
+    """Read the header and the offset of the data.
+
+    Raises:
+        ValueError if the buffer is not in the format.
+    """
+    magic, header_size = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('Not a step columns file')
+    start = _PREFIX.size + header_size
+    header = json.loads(bytes(buffer[_PREFIX.size:start]))
+    return header, start
+
+
+def _load_array(buffer: Any,
+                typecode: str,
+                offset: int,
+                size: int,
+                byteorder: str
+               ) -> array:
+    values = array(typecode)
+    values.frombytes(buffer[offset:offset + size * values.itemsize])
+    if byteorder != sys.byteorder:
+        values.byteswap()
+    return values
+
+
+def decode_step_columns(buffer: Any
+                       ) -> Tuple[dict, StepMetrics, Optional[List[float]]]:
+    """Decode step metrics from a buffer (e.g. a memory-mapped file).
+
+    Numeric columns are copied from the buffer when they are accessed for
+    the first time, so that the other columns are not read.
+
+    Returns:
+        tuple: The header, step metrics and timestamps of the steps.
+    """
+    header, start = read_header(buffer)
+    byteorder = header['byteorder']
+
+    def loader(info: dict):
+        def load():
+            values = _load_array(buffer, info['type'],
+                                 start + info['offset'], info['size'],
+                                 byteorder)
+            mask_offset = start + info['mask_offset']
+            mask = bytearray(buffer[mask_offset:mask_offset + info['size']])
+            return values, mask
+        return load
+
+    columns = {}
+    for name, info in header['columns'].items():
+        if info['type'] == 'O':
+            columns[name] = Column.from_values(info['values'])
+        else:
+            columns[name] = Column.lazy(info['type'], loader(info))
+    step_metrics = StepMetrics.from_columns(header['num_rows'], columns)
+
+    times = None
+    if header['times'] is not None:
+        times = _load_array(buffer, 'd', start + header['times']['offset'],
+                            header['times']['size'], byteorder).tolist()
+    return header, step_metrics, times
@@ -0,0 +1,97 @@
+"""
+A write-ahead log to recover runs of killed processes.
+"""
+
+
+import json
+import os
+import time
+from typing import Any
+from typing import IO
+
+from expnote.run import Run
+
+
+def _to_json(obj: Any) -> Any:
+    """Convert objects not supported by json (e.g. NumPy arrays, range)."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return list(obj)
+
+
+class WriteAheadLog:
+    """Append recording operations to a log file.
+
+    Each entry is passed to the OS immediately, so that it survives a killed
+    process. fsync to survive a system crash is batched every
+    `sync_interval` seconds to keep the overhead bounded.
+    """
+
+    def __init__(self, file: IO, sync_interval: float = 1.) -> None:
+        self._file = file
+        self.sync_interval = sync_interval
+        self._last_sync = time.monotonic()
+        # True once the run data of the log is saved
+        self.saved = False
+
+    def write(self, entry: dict) -> None:
+        """Write a log entry."""
+        self._file.write(json.dumps(entry, default=_to_json) + '\n')
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """Write buffered entries to the disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def mark_saved(self) -> None:
+        """Mark the run data as saved, so that the log is not needed."""
+        self.saved = True
+
+
+def replay_wal(run_id: str, content: str) -> Run:
+    """Rebuild the run from the content of the write-ahead log.
+
+    The entries are replayed into a memory in the same way as the daemon
+    handles messages. A run which was still running when the log was
+    written last is marked as interrupted.
+    """
+    # imported here since the recording package imports this package
+    from expnote.recording.memory import Memory
+
+    memory = Memory(run_id, repo=None)
+    for line in content.splitlines():
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # the last line can be broken if the writer was killed
+            continue
+
+        op = entry['op']
+        if op == 'params':
+            memory.params = entry['data']
+        elif op == 'metrics':
+            step = entry.get('step')
+            memory.set_metrics(entry['data'],
+                               step=None if step is None else tuple(step),
+                               timestamp=entry.get('time'))
+        elif op == 'metrics_batch':
+            memory.set_metrics_batch(entry['data'],
+                                     steps=tuple(entry['steps']),
+                                     timestamp=entry.get('time'))
+        elif op == 'info':
+            memory.set_info(entry['data'])
+        elif op == 'system_metrics':
+            memory.add_system_metrics(entry['data'])
+        elif op == 'timer':
+            memory.add_time(entry['name'], entry['seconds'])
+        elif op == 'artifact':
+            memory.add_artifact(entry['name'], entry['ref'])
+
+    info = memory.info or {}
+    if info.get('status', 'running') == 'running':
+        memory.set_info({'status': 'interrupted'})
+    return memory.to_run()
@@ -4,11 +4,16 @@ A run data structure.
 
 
 from dataclasses import dataclass
+from typing import Dict
 from typing import Optional
 from typing import List
 from typing import Tuple
 from typing import TypedDict
 from typing import Literal
+from typing import Union
+
+from expnote.step_metrics import StepMetrics
+from expnote.step_metrics import as_step_metrics
 
 
 class RunInfo(TypedDict):
@@ -24,8 +29,28 @@ class Run:
     id: str
     params: dict
     metrics: dict
-    step_metrics: Optional[list] = None
+    step_metrics: Optional[Union[StepMetrics, list]] = None
     info: Optional[RunInfo] = None
+    system_metrics: Optional[Union[StepMetrics, list]] = None
+    shards: Optional[Dict[int, 'Run']] = None
+    # metric name -> running summary (see `MetricSummary.to_dict`)
+    summaries: Optional[Dict[str, dict]] = None
+    # wall-clock timestamps of the rows of step metrics
+    step_times: Optional[List[float]] = None
+    # throughput and timing sections, e.g.
+    # {'steps_per_sec': 5.0, 'sections': {'data': {'total': 2.0, 'count': 8}}}
+    timing: Optional[dict] = None
+    # artifact name -> blob reference ({'digest': ..., 'size': ...})
+    artifacts: Optional[Dict[str, dict]] = None
+    # keys of step numbers with which step metrics are recorded (e.g.
+    # 'epoch'), by which shards of ranks are merged
+    step_keys: Optional[List[str]] = None
+
+    def __post_init__(self) -> None:
+        if self.step_metrics is not None:
+            self.step_metrics = as_step_metrics(self.step_metrics)
+        if self.system_metrics is not None:
+            self.system_metrics = as_step_metrics(self.system_metrics)
 
 
 @dataclass
@@ -36,4 +61,10 @@ class RunGroup:
     id: Tuple[str, ...]
     params: dict
     metrics: dict
-    step_metrics: Optional[list] = None
+    step_metrics: Optional[Union[StepMetrics, list]] = None
+    summaries: Optional[Dict[str, dict]] = None
+    timing: Optional[dict] = None
+
+    def __post_init__(self) -> None:
+        if self.step_metrics is not None:
+            self.step_metrics = as_step_metrics(self.step_metrics)
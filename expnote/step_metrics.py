@@ -0,0 +1,554 @@
+"""
+A columnar data structure to store step metrics.
+"""
+
+
+from array import array
+from collections.abc import Sequence
+import numbers
+from types import MappingProxyType
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+
+# typecodes of column values: int64, float64 and python objects
+_TYPE_ORDER = {'q': 0, 'd': 1, 'O': 2}
+
+
+def _typecode(value: Any) -> str:
+    """Get the column typecode to store the value."""
+    value_type = type(value)
+    if value_type is float:
+        return 'd'
+    if value_type is int:
+        return 'q'
+    if value_type is bool:
+        return 'O'
+    if isinstance(value, numbers.Integral):
+        return 'q'
+    if isinstance(value, numbers.Real):
+        return 'd'
+    return 'O'
+
+
+def _as_list(values: Iterable[Any]) -> list:
+    """Convert a sequence (including a NumPy array) into a list."""
+    if hasattr(values, 'tolist'):
+        return values.tolist()
+    return list(values)
+
+
+def _common_typecode(values: List[Any]) -> str:
+    """Get the column typecode to store all the values (None is ignored)."""
+    value_types = set(map(type, values))
+    value_types.discard(type(None))
+    if value_types <= {int}:
+        return 'q'
+    if value_types <= {int, float}:
+        return 'd'
+    typecode = 'q'
+    for value in values:
+        if value is not None:
+            value_typecode = _typecode(value)
+            if _TYPE_ORDER[value_typecode] > _TYPE_ORDER[typecode]:
+                typecode = value_typecode
+    return typecode
+
+
+def _empty_values(typecode: str) -> Union[array, list]:
+    if typecode == 'O':
+        return []
+    return array(typecode)
+
+
+class Column:
+    """A typed column of a step metric.
+
+    Values are stored in an int64 or float64 array as long as possible and
+    fall back to a list of python objects otherwise. Missing values are
+    masked with `mask` (1: present, 0: missing).
+    """
+
+    def __init__(self, typecode: str = 'q') -> None:
+        self.typecode = typecode
+        self.values = _empty_values(typecode)
+        self.mask = bytearray()
+
+    @classmethod
+    def lazy(cls,
+             typecode: str,
+             load: Callable[[], Tuple[Union[array, list], bytearray]]
+            ) -> 'Column':
+        """Make a column whose (values, mask) are loaded on first access."""
+        column = cls.__new__(cls)
+        column.typecode = typecode
+        column._load = load
+        return column
+
+    def __getattr__(self, name: str) -> Any:
+        # called only while `values` and `mask` are not loaded
+        if name not in ('values', 'mask') or '_load' not in self.__dict__:
+            raise AttributeError(name)
+        self.values, self.mask = self.__dict__['_load']()
+        del self.__dict__['_load']
+        return self.__dict__[name]
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any]) -> 'Column':
+        """Make a column from values (None is regarded as missing)."""
+        values = list(values)
+        typecode = _common_typecode(values)
+        column = cls(typecode)
+        column.mask = bytearray(0 if v is None else 1 for v in values)
+        if typecode == 'O':
+            column.values = values
+        else:
+            fill = 0 if typecode == 'q' else 0.
+            try:
+                column.values = array(
+                    typecode, [fill if v is None else v for v in values])
+            except OverflowError:
+                column.typecode = 'O'
+                column.values = values
+        return column
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    def get(self, index: int, default: Any = None) -> Any:
+        """Get the value at the index (default for a missing value)."""
+        if index < len(self.mask) and self.mask[index]:
+            return self.values[index]
+        return default
+
+    def set(self, index: int, value: Any) -> None:
+        """Set the value at the index."""
+        typecode = _typecode(value)
+        if _TYPE_ORDER[typecode] > _TYPE_ORDER[self.typecode]:
+            self._promote(typecode)
+        try:
+            self._set(index, value)
+        except OverflowError:
+            self._promote('O')
+            self._set(index, value)
+
+    def extend(self, start: int, values: List[Any]) -> None:
+        """Set values from the start index to the end of the column.
+
+        None is regarded as a missing value.
+        """
+        if start < len(self.mask):
+            raise ValueError('Cannot extend from the middle of the column.')
+        if start > len(self.mask):
+            self._pad(start - len(self.mask))
+
+        typecode = _common_typecode(values)
+        if _TYPE_ORDER[typecode] > _TYPE_ORDER[self.typecode]:
+            self._promote(typecode)
+
+        if None in values:
+            mask = bytes(0 if v is None else 1 for v in values)
+            if self.typecode != 'O':
+                fill = 0 if self.typecode == 'q' else 0.
+                values = [fill if v is None else v for v in values]
+        else:
+            mask = b'\x01' * len(values)
+
+        size = len(self.values)
+        try:
+            self.values.extend(values)
+        except OverflowError:
+            del self.values[size:]
+            self._promote('O')
+            self.values.extend(values)
+        self.mask.extend(mask)
+
+    def _set(self, index: int, value: Any) -> None:
+        size = len(self.mask)
+        if index < size:
+            self.values[index] = value
+            self.mask[index] = 1
+            return
+        if index > size:
+            self._pad(index - size)
+        self.values.append(value)
+        self.mask.append(1)
+
+    def _pad(self, num: int) -> None:
+        """Append missing values."""
+        if self.typecode == 'O':
+            self.values.extend([None] * num)
+        else:
+            self.values.extend(array(self.typecode, [0]) * num)
+        self.mask.extend(bytes(num))
+
+    def _promote(self, typecode: str) -> None:
+        """Convert values to a more generic type."""
+        if typecode == 'O':
+            self.values = list(self.values)
+        else:
+            self.values = array(typecode, self.values)
+        self.typecode = typecode
+
+
+class MetricSummary:
+    """A running summary of a metric updated in O(1) per value.
+
+    Non-numeric values and NaN are ignored. `argmin` and `argmax` are the
+    step numbers of the minimum and maximum values.
+    """
+
+    def __init__(self) -> None:
+        self.last = None
+        self.min = None
+        self.argmin = None
+        self.max = None
+        self.argmax = None
+        self.count = 0
+        self._sum = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'MetricSummary':
+        """Make a summary from the data made by `to_dict`."""
+        summary = cls()
+        summary.last = data['last']
+        summary.min = data['min']
+        summary.argmin = data['argmin']
+        summary.max = data['max']
+        summary.argmax = data['argmax']
+        summary.count = data['count']
+        if summary.count > 0:
+            summary._sum = data['mean'] * summary.count
+        return summary
+
+    def to_dict(self) -> dict:
+        """Convert into a JSON serializable dict."""
+        return {
+            'last': self.last,
+            'min': self.min,
+            'argmin': self.argmin,
+            'max': self.max,
+            'argmax': self.argmax,
+            'mean': self._sum / self.count if self.count > 0 else None,
+            'count': self.count,
+        }
+
+    def update(self, value: Any, step: Any = None) -> None:
+        """Add a value of the step."""
+        if _typecode(value) == 'O' or value != value:
+            return
+        self.last = value
+        if self.count == 0 or value < self.min:
+            self.min = value
+            self.argmin = step
+        if self.count == 0 or value > self.max:
+            self.max = value
+            self.argmax = step
+        self.count += 1
+        self._sum += value
+
+    def update_batch(self,
+                     values: Iterable[Any],
+                     steps: Iterable[Any]
+                    ) -> None:
+        """Add values of the steps."""
+        for value, step in zip(_as_list(values), _as_list(steps)):
+            self.update(value, step)
+
+
+class StepMetrics(Sequence):
+    """Step metrics stored as one typed column per metric.
+
+    The object behaves like a list of per-step dicts (e.g.
+    `[{'epoch': 0, 'loss': 1.5}, ...]`), where each dict contains the
+    metrics set for the step. Rows are read-only views made from the
+    columns, so steps are updated by `set` or `set_row`, and `tolist`
+    makes a list of dicts (e.g. to serialize it as JSON).
+    """
+
+    def __init__(self, records: Optional[Iterable[dict]] = None) -> None:
+        self._columns: Dict[str, Column] = {}
+        self._num_rows = 0
+
+        # step key -> {step number: row index}, built on demand
+        self._step_indices: Dict[str, dict] = {}
+        self._last_step = None
+
+        for record in (records or []):
+            self.append(record)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StepMetrics':
+        """Make step metrics from the data made by `to_dict`."""
+        return cls.from_columns(
+            data['num_rows'],
+            {name: Column.from_values(values)
+             for name, values in data['columns'].items()})
+
+    @classmethod
+    def from_columns(cls,
+                     num_rows: int,
+                     columns: Dict[str, Column]
+                    ) -> 'StepMetrics':
+        """Make step metrics from columns (e.g. lazily loaded ones)."""
+        step_metrics = cls()
+        step_metrics._num_rows = num_rows
+        step_metrics._columns = dict(columns)
+        return step_metrics
+
+    def to_dict(self) -> dict:
+        """Convert into a JSON serializable dict."""
+        return {
+            'num_rows': self._num_rows,
+            'columns': {name: self.column(name)
+                        for name in list(self._columns)},
+        }
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __getitem__(self,
+                    index: Union[int, slice]
+                   ) -> Union[Mapping, List[Mapping]]:
+        if isinstance(index, slice):
+            return [MappingProxyType(self._row(i))
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._num_rows
+        if not 0 <= index < self._num_rows:
+            raise IndexError('Step metrics index out of range')
+        return MappingProxyType(self._row(index))
+
+    def __iter__(self) -> Iterator[Mapping]:
+        for index in range(self._num_rows):
+            yield MappingProxyType(self._row(index))
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (StepMetrics, list, tuple)):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return all(row1 == row2 for row1, row2 in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return 'StepMetrics({})'.format(self.tolist())
+
+    def tolist(self) -> List[dict]:
+        """Convert into a list of per-step dicts."""
+        return [self._row(index) for index in range(self._num_rows)]
+
+    def _row(self, index: int) -> dict:
+        row = {}
+        for name, column in self._columns.items():
+            if index < len(column.mask) and column.mask[index]:
+                row[name] = column.values[index]
+        return row
+
+    def keys(self) -> List[str]:
+        """List metric names (including step keys)."""
+        return list(self._columns.keys())
+
+    def column(self, name: str) -> List[Any]:
+        """Get values of the metric (None for missing values)."""
+        column = self._columns.get(name)
+        if column is None:
+            return [None] * self._num_rows
+        return [column.get(index) for index in range(self._num_rows)]
+
+    def series(self,
+               x_key: Optional[str],
+               y_key: str
+              ) -> Tuple[List[Any], List[Any]]:
+        """Get (x, y) values of steps where both values are present.
+
+        If `x_key` is None, row indices are used as x values.
+        """
+        y_column = self._columns.get(y_key)
+        if y_column is None:
+            return [], []
+        if x_key is None:
+            x_column = None
+        else:
+            x_column = self._columns.get(x_key)
+            if x_column is None:
+                return [], []
+
+        xs = []
+        ys = []
+        for index in range(len(y_column)):
+            if not y_column.mask[index]:
+                continue
+            if x_column is None:
+                xs.append(index)
+            elif index < len(x_column) and x_column.mask[index]:
+                xs.append(x_column.values[index])
+            else:
+                continue
+            ys.append(y_column.values[index])
+        return xs, ys
+
+    def summarize(self, step_key: Optional[str] = None) -> Dict[str, dict]:
+        """Compute summaries of the metrics (see `MetricSummary`).
+
+        If `step_key` is None, row indices are used as step numbers.
+        """
+        summaries = {}
+        for name in self._columns:
+            if name == step_key:
+                continue
+            summary = MetricSummary()
+            summary.update_batch(*reversed(self.series(step_key, name)))
+            if summary.count > 0:
+                summaries[name] = summary.to_dict()
+        return summaries
+
+    def append(self, record: dict) -> None:
+        """Append a step record."""
+        index = self._num_rows
+        self._num_rows += 1
+        for key, value in record.items():
+            self._set_value(index, key, value)
+            step_index = self._step_indices.get(key)
+            if step_index is not None:
+                step_index.setdefault(value, index)
+
+    def find(self, step_key: str, step_num: Any) -> Optional[int]:
+        """Find the row index of the step.
+
+        Consecutive lookups of the same step (the typical pattern in
+        training loops) are resolved without a hash lookup.
+        """
+        last = self._last_step
+        if last is not None and last[0] == step_key and last[1] == step_num:
+            return last[2]
+
+        return self._get_step_index(step_key).get(step_num)
+
+    def has_value(self, index: int, key: str) -> bool:
+        """Test if the metric is set in the row at the index."""
+        column = self._columns.get(key)
+        return (column is not None and index < len(column) and
+                bool(column.mask[index]))
+
+    def _get_step_index(self, step_key: str) -> dict:
+        """Get {step number: row index} mapping of the step key."""
+        step_index = self._step_indices.get(step_key)
+        if step_index is None:
+            step_index = {}
+            column = self._columns.get(step_key)
+            if column is not None:
+                for index, present in enumerate(column.mask):
+                    if present:
+                        step_index.setdefault(column.values[index], index)
+            self._step_indices[step_key] = step_index
+        return step_index
+
+    def set(self, step_key: str, step_num: Any, data: dict) -> int:
+        """Set metrics of the step and return the row index."""
+        index = self.find(step_key, step_num)
+        if index is None:
+            index = self._num_rows
+            self.append({step_key: step_num})
+        self._last_step = (step_key, step_num, index)
+
+        for key, value in data.items():
+            self._set_value(index, key, value)
+            if key in self._step_indices:
+                # the step number of the row is overwritten
+                del self._step_indices[key]
+                self._last_step = None
+        return index
+
+    def set_batch(self,
+                  step_key: str,
+                  step_nums: Iterable[Any],
+                  data: Dict[str, Iterable[Any]]
+                 ) -> List[int]:
+        """Set metrics of multiple steps at once and return the row indices.
+
+        Args:
+            step_key (str): A step key (e.g. 'epoch').
+            step_nums (sequence): Step numbers.
+            data (dict): Metric name -> values of the steps. Values can be
+                given as a list or a NumPy array.
+        """
+        step_nums = _as_list(step_nums)
+        data = {key: _as_list(values) for key, values in data.items()}
+        for key, values in data.items():
+            if len(values) != len(step_nums):
+                msg = ('Length mismatch between steps and values '
+                       '({}: {} != {})').format(key, len(values),
+                                                len(step_nums))
+                raise ValueError(msg)
+
+        # assign row indices
+        start = self._num_rows
+        step_index = self._get_step_index(step_key)
+        indices = []
+        new_steps = []
+        for step_num in step_nums:
+            index = step_index.get(step_num)
+            if index is None:
+                index = start + len(new_steps)
+                step_index[step_num] = index
+                new_steps.append(step_num)
+            indices.append(index)
+
+        self._num_rows += len(new_steps)
+        self._last_step = None
+        if new_steps:
+            self._extend_column(step_key, start, new_steps)
+
+        only_new_rows = len(new_steps) == len(step_nums)
+        for key, values in data.items():
+            if key in self._step_indices:
+                # the step numbers of the rows are overwritten
+                del self._step_indices[key]
+            if only_new_rows:
+                self._extend_column(key, start, values)
+            else:
+                for index, value in zip(indices, values):
+                    self._set_value(index, key, value)
+        return indices
+
+    def _extend_column(self, key: str, start: int, values: list) -> None:
+        column = self._columns.get(key)
+        if column is None:
+            column = Column(_common_typecode(values))
+            self._columns[key] = column
+        column.extend(start, values)
+
+    def set_row(self, index: int, data: dict) -> None:
+        """Set metrics of the row at the index.
+
+        Rows are added if the index is out of range.
+        """
+        self._num_rows = max(self._num_rows, index + 1)
+        for key, value in data.items():
+            self._set_value(index, key, value)
+        self._step_indices = {}
+        self._last_step = None
+
+    def _set_value(self, index: int, key: str, value: Any) -> None:
+        column = self._columns.get(key)
+        if column is None:
+            column = Column(_typecode(value))
+            self._columns[key] = column
+        column.set(index, value)
+
+
+def as_step_metrics(data: Union[StepMetrics, Iterable[dict]]) -> StepMetrics:
+    """Convert a list of step dicts into a StepMetrics object."""
+    if isinstance(data, StepMetrics):
+        return data
+    return StepMetrics(data)
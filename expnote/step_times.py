@@ -0,0 +1,62 @@
+"""
+Wall-clock timestamps of steps and the throughput derived from them.
+"""
+
+
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+
+def encode_times(times: Sequence[float]) -> dict:
+    """Encode timestamps compactly.
+
+    The first timestamp is kept as it is, and the others are encoded as
+    differences from the previous ones in integer microseconds.
+
+    Example:
+        >>> encode_times([1700000000.0, 1700000000.25, 1700000000.5])
+        {'start': 1700000000.0, 'deltas': [250000, 250000]}
+    """
+    if len(times) == 0:
+        return {'start': None, 'deltas': []}
+    # deltas of rounded values do not accumulate rounding errors
+    micros = [round(t * 1e6) for t in times]
+    deltas = [micros[i] - micros[i - 1] for i in range(1, len(micros))]
+    return {'start': times[0], 'deltas': deltas}
+
+
+def decode_times(data: dict) -> List[float]:
+    """Decode timestamps encoded by `encode_times`."""
+    if data['start'] is None:
+        return []
+    micros = round(data['start'] * 1e6)
+    times = [data['start']]
+    for delta in data['deltas']:
+        micros += delta
+        times.append(micros * 1e-6)
+    return times
+
+
+def steps_per_sec(times: Sequence[float]) -> Optional[float]:
+    """Compute the average throughput from timestamps of steps."""
+    if len(times) < 2:
+        return None
+    duration = times[-1] - times[0]
+    if not duration > 0:
+        return None
+    return (len(times) - 1) / duration
+
+
+def throughput_series(times: Sequence[float],
+                      window: int = 10
+                     ) -> List[Optional[float]]:
+    """Compute the throughput at each step.
+
+    The throughput is averaged over the last `window` steps, since the
+    interval of two steps is noisy.
+    """
+    series = [None]
+    for i in range(1, len(times)):
+        series.append(steps_per_sec(times[max(0, i - window):i + 1]))
+    return series
@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
 from argparse import Namespace
+import json
 import os
 from pathlib import Path
 import shutil
@@ -20,6 +21,11 @@ from expnote.cli.commands import ShowCmd
 from expnote.cli.commands import CommitCmd
 from expnote.cli.commands import LogCmd
 from expnote.cli.commands import EditCmd
+from expnote.cli.commands import SweepCmd
+from expnote.cli.commands import ProfileCmd
+from expnote.cli.commands import MigrateCmd
+from expnote.cli.commands import PackCmd
+from expnote.cli.commands import CompressCmd
 
 
 @pytest.fixture
@@ -188,6 +194,15 @@ class TestShowCmd:
         cmd = ShowCmd(parser)
         cmd(parser.parse_args(['run1']))
 
+    def test_step_metrics(self, sample_repo, capsys):
+        sample_repo.save_run(Run('run3', params={}, metrics={},
+                                 step_metrics=[{'epoch': 0, 'loss': 1.5}]))
+        parser = ArgumentParser()
+        cmd = ShowCmd(parser)
+        cmd(parser.parse_args(['run3']))
+        data = json.loads(capsys.readouterr().out)
+        assert data['step_metrics'] == [{'epoch': 0, 'loss': 1.5}]
+
 
 class TestCommit:
 
@@ -221,3 +236,121 @@ class TestEditCmd:
         exp = sample_repo.get_experiment('0')
         assert exp.title == 'new title'
         assert exp.purpose == 'new purpose'
+
+
+class TestSweepCmd:
+
+    def test(self, sample_repo, capsys):
+        Path('train.py').write_text('\n'.join([
+            'from expnote.recording.memory import set_metrics',
+            'def main(lr, name):',
+            '    set_metrics({"score": lr})',
+        ]))
+        parser = ArgumentParser()
+        cmd = SweepCmd(parser)
+        cmd(parser.parse_args(['train.py:main', '-p', 'lr=0.1,0.2',
+                               '-p', 'name=a', '-j', '2', '-e', 'sweep']))
+        assert 'Recorded 2 runs (0 failed)' in capsys.readouterr().out
+
+        runs = [run for run in sample_repo.find_runs('')
+                if run.id not in ('run1', 'run2')]
+        assert sorted(run.params['lr'] for run in runs) == [0.1, 0.2]
+        assert all(run.params['name'] == 'a' for run in runs)
+        with sample_repo.open_workspace() as workspace:
+            assert workspace.uncommitted_experiments == ['0', '1']
+            assert len(workspace.assigned_runs['1']) == 2
+
+
+class TestProfileCmd:
+
+    def test(self, sample_repo, capsys):
+        profile = {
+            'mode': 'deterministic',
+            'duration': 1.5,
+            'functions': [
+                {'file': '/src/train.py', 'line': 10, 'function': 'step',
+                 'calls': 100, 'self_time': 1.0, 'total_time': 1.2},
+                {'file': '/src/train.py', 'line': 1, 'function': 'main',
+                 'calls': 1, 'self_time': 0.1, 'total_time': 1.5},
+            ],
+            'allocations': [
+                {'file': '/src/data.py', 'line': 5, 'size': 1024,
+                 'count': 3},
+            ],
+        }
+        ref = sample_repo.save_blob_data(json.dumps(profile).encode())
+        sample_repo.save_run(Run('run1', params={}, metrics={},
+                                 artifacts={'profile': ref}))
+
+        parser = ArgumentParser()
+        cmd = ProfileCmd(parser)
+        cmd(parser.parse_args(['run1', '--sort', 'total', '-n', '1']))
+        out = capsys.readouterr().out
+        assert 'train.py:1(main)' in out
+        assert 'train.py:10(step)' not in out
+        assert 'data.py:5' in out
+
+    def test_not_found(self, sample_repo, capsys):
+        ref = sample_repo.save_blob_data(b'{}')
+        sample_repo.save_run(Run('run1', params={}, metrics={},
+                                 artifacts={'profile.rank0': ref}))
+        parser = ArgumentParser()
+        cmd = ProfileCmd(parser)
+        cmd(parser.parse_args(['run1']))
+        out = capsys.readouterr().out
+        assert 'No profile named profile' in out
+        assert 'profile.rank0' in out
+
+
+class TestMigrateCmd:
+
+    def test(self, sample_repo, capsys):
+        parser = ArgumentParser()
+        cmd = MigrateCmd(parser)
+        cmd(parser.parse_args(['--layout', 'flat']))
+        assert 'Moved 2 files to the flat layout' in capsys.readouterr().out
+
+        repo = Repository()
+        assert (repo._storage.root / 'runs' / 'run1').is_file()
+        assert repo.get_run('run1').id == 'run1'
+
+        cmd(parser.parse_args([]))
+        assert 'Moved 2 files to the fanout layout' in capsys.readouterr().out
+        assert Repository().get_run('run2').id == 'run2'
+
+
+class TestPackCmd:
+
+    def test(self, sample_repo, capsys):
+        parser = ArgumentParser()
+        cmd = PackCmd(parser)
+        cmd(parser.parse_args([]))
+        assert 'No runs to be packed.' in capsys.readouterr().out
+
+        with sample_repo.open_workspace() as workspace:
+            workspace.assign_run_to_experiment('run1', '0')
+        parser = ArgumentParser()
+        CommitCmd(parser)(parser.parse_args([]))
+
+        parser = ArgumentParser()
+        cmd = PackCmd(parser)
+        cmd(parser.parse_args([]))
+        assert 'Packed 1 files' in capsys.readouterr().out
+        assert Repository().get_run('run1').id == 'run1'
+
+
+class TestCompressCmd:
+
+    def test(self, sample_repo, capsys):
+        parser = ArgumentParser()
+        cmd = CompressCmd(parser)
+        cmd(parser.parse_args(['lzma']))
+        # 2 runs, an experiment and a workspace
+        assert 'Converted 4 objects (lzma)' in capsys.readouterr().out
+        repo = Repository()
+        assert repo._storage.config['compression'] == 'lzma'
+        assert repo.get_run('run1').id == 'run1'
+
+        cmd(parser.parse_args(['none']))
+        assert 'Converted 4 objects (none)' in capsys.readouterr().out
+        assert 'compression' not in Repository()._storage.config
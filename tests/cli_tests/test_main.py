@@ -1,3 +1,8 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+
 import pytest
 
 from expnote.cli.main import SubcommandExecutor
@@ -22,3 +27,32 @@ class TestSubcommandExecutor:
         executor(args=['dummy', 'value'])
         with pytest.raises(ValueError):
             executor(args=['dummy', 'errorvalue'])
+
+    def test_lazy_command(self):
+        executor = SubcommandExecutor([
+            ('dummy', __name__ + ':DummyCommand'),
+            ('other', 'not_existing_module:Command'),
+        ])
+        assert executor.commands == {}
+
+        executor(args=['dummy', 'value'])
+        assert list(executor.commands.keys()) == ['dummy']
+        assert isinstance(executor.commands['dummy'], DummyCommand)
+
+
+def test_main_without_plotting_modules(tmp_path):
+    script = '\n'.join([
+        'import sys',
+        'from expnote.cli.main import COMMANDS, SubcommandExecutor',
+        'SubcommandExecutor(COMMANDS)(["init"])',
+        'SubcommandExecutor(COMMANDS)(["status"])',
+        'print(" ".join(sys.modules), file=sys.stderr)',
+    ])
+    package_root = Path(__file__).resolve().parents[2]
+    env = dict(os.environ, PYTHONPATH=str(package_root))
+    proc = subprocess.run([sys.executable, '-c', script], cwd=tmp_path,
+                          env=env, capture_output=True, text=True,
+                          check=True)
+    modules = proc.stderr.split()
+    for name in ('matplotlib', 'PIL'):
+        assert name not in modules
@@ -1,5 +1,7 @@
 import math
 
+import pytest
+
 from expnote.run import Run
 from expnote.functions.comparison import make_run_groups
 from expnote.functions.comparison import compare_runs
@@ -74,3 +76,46 @@ class TestCompareRuns:
         table = compare_runs([run1, run2, run3], grouping=False)
         assert set(table.columns) == set(['id', 'lr', 'acc', 'comment'])
         assert len(table.rows) == 3
+
+    def test_summaries(self):
+        run1 = Run(id='1', params={'lr': 0.5}, metrics={},
+                   summaries={'loss': {'min': 0.1, 'last': 0.2}})
+        run2 = Run(id='2', params={'lr': 0.5}, metrics={},
+                   summaries={'loss': {'min': 0.3, 'last': 0.4}})
+        # summaries are computed for runs recorded without them
+        run3 = Run(id='3', params={'lr': 0.1}, metrics={},
+                   step_metrics=[{'epoch': 0, 'loss': 2},
+                                 {'epoch': 1, 'loss': 1}])
+
+        table = compare_runs([run1, run2, run3], grouping=False,
+                             summaries=('min', 'last'))
+        assert table.columns == ['id', 'lr', 'min(loss)', 'last(loss)',
+                                 'comment']
+        assert [row[2:4] for row in table.rows] == [
+            [0.1, 0.2], [0.3, 0.4], [1, 1]]
+
+        table = compare_runs([run1, run2, run3], summaries=('min',))
+        assert [row[2] for row in table.rows] == [
+            pytest.approx(0.2), 1]
+
+    def test_timing(self):
+        run1 = Run(id='1', params={'lr': 0.5}, metrics={},
+                   timing={'steps_per_sec': 2.,
+                           'sections': {'data': {'total': 4., 'count': 8}}})
+        run2 = Run(id='2', params={'lr': 0.5}, metrics={},
+                   timing={'steps_per_sec': 4.,
+                           'sections': {'data': {'total': 2., 'count': 8}}})
+        # throughput is computed for runs recorded without timing
+        run3 = Run(id='3', params={'lr': 0.1}, metrics={},
+                   step_metrics=[{'step': 0}, {'step': 1}, {'step': 2}],
+                   step_times=[10., 10.2, 10.4])
+
+        table = compare_runs([run1, run2, run3], grouping=False, timing=True)
+        assert table.columns == ['id', 'lr', 'steps/sec', 'time(data)',
+                                 'comment']
+        assert [row[2:4] for row in table.rows] == [
+            [2., 4.], [4., 2.], [pytest.approx(5.), None]]
+
+        table = compare_runs([run1, run2, run3], timing=True)
+        assert [row[2:4] for row in table.rows] == [
+            [3., 3.], [pytest.approx(5.), None]]
@@ -109,3 +109,16 @@ class TestVisualizeStepMetrics:
         run2 = Run(id='2', **opt, step_metrics=None)
         fig = visualize_step_metrics([run1, run2])
         assert isinstance(fig.image, Image.Image)
+
+    def test_throughput(self):
+        opt = {'params': {}, 'metrics': {}}
+        run1 = Run(id='1', **opt, step_metrics=[
+            {'epoch': 0, 'loss': 10},
+            {'epoch': 1, 'loss': 5},
+            {'epoch': 2, 'loss': 3},
+        ], step_times=[10., 10.5, 11.5])
+        run2 = Run(id='2', **opt, step_metrics=[
+            {'epoch': 0, 'loss': 10},
+        ])
+        fig = visualize_step_metrics([run1, run2], throughput=True)
+        assert isinstance(fig.image, Image.Image)
@@ -1,7 +1,10 @@
+import time
+
 import pytest
 
 from expnote.recording.memory import Memory
 from expnote.recording.collectors import RunInfoCollector
+from expnote.recording.collectors import ResourceCollector
 
 
 class TestRunInfoCollector:
@@ -33,3 +36,21 @@ class TestRunInfoCollector:
             pass
 
         assert mem.info['status'] == expected
+
+
+class TestResourceCollector:
+
+    def test(self):
+        with Memory(run_id='1') as mem:
+            with ResourceCollector(interval=0.01):
+                for i in range(10):
+                    mem.set_metrics({'loss': i}, step=(i, 'step'))
+                    time.sleep(0.005)
+
+        samples = mem.system_metrics
+        assert len(samples) >= 2
+        for key in ('time', 'cpu_percent', 'steps'):
+            assert key in samples.keys()
+        assert samples[-1]['steps'] == 10
+        times = samples.column('time')
+        assert times == sorted(times)
@@ -0,0 +1,212 @@
+import asyncio
+import os
+from pathlib import Path
+import shutil
+import socket
+from tempfile import mkdtemp
+import threading
+
+import pytest
+
+from expnote.repository import Repository
+from expnote.recording import Recorder
+from expnote.recording.daemon import DaemonClient
+from expnote.recording.daemon import RecordingDaemon
+from expnote.recording.daemon import connect_daemon
+from expnote.recording.daemon import decode_messages
+from expnote.recording.daemon import encode_message
+
+
+@pytest.fixture
+def work_dir() -> Path:
+    org_dir = os.getcwd()
+    try:
+        # a short path is used since the length of socket path is limited
+        tmp_dir = mkdtemp(dir='/tmp')
+        tmp_dir_path = Path(tmp_dir).resolve()
+        os.chdir(tmp_dir_path)
+        yield tmp_dir_path
+
+    finally:
+        os.chdir(org_dir)
+        shutil.rmtree(tmp_dir)
+
+
+@pytest.fixture
+def daemon(work_dir) -> RecordingDaemon:
+    repo = Repository.initialize()
+    daemon = RecordingDaemon(repo, flush_interval=0.05)
+    daemon.start()
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    try:
+        yield daemon
+    finally:
+        daemon.shutdown()
+        thread.join()
+        daemon.close()
+
+
+def test_encode_decode_messages():
+    buffer = bytearray()
+    buffer += encode_message({'op': 'params', 'data': {'lr': 0.1}})
+    frame = encode_message({'op': 'end'})
+    buffer += frame[:3]
+
+    assert list(decode_messages(buffer)) == [
+        {'op': 'params', 'data': {'lr': 0.1}}]
+    assert buffer == frame[:3]
+
+    buffer += frame[3:]
+    assert list(decode_messages(buffer)) == [{'op': 'end'}]
+    assert buffer == b''
+
+
+class TestRecordingDaemon:
+
+    def test(self, daemon):
+        repo = Repository()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main():
+            recorder.params({'lr': 0.1})
+            recorder.metrics({'acc': 0.9})
+            for i in range(100):
+                recorder.metrics({'loss': i}, step=(i, 'epoch'))
+
+        main()
+
+        runs = repo.find_runs('')
+        assert len(runs) == 1
+        run = runs[0]
+        assert run.params == {'lr': 0.1}
+        assert run.metrics == {'acc': 0.9}
+        assert run.step_metrics.column('loss') == list(range(100))
+        assert run.info['status'] == 'complete'
+        with repo.open_workspace() as ws:
+            assert ws.untracked_runs == [run.id]
+
+        # nothing is written directly by the recorder
+        assert repo._storage.glob('workspaces/default.inbox/*') == []
+
+    def test_async_scope(self, daemon, monkeypatch):
+        repo = Repository()
+        recorder = Recorder(repo=repo)
+        close_threads = []
+        close = DaemonClient.close
+
+        def recording_close(self, *args, **kwargs):
+            close_threads.append(threading.current_thread())
+            return close(self, *args, **kwargs)
+
+        monkeypatch.setattr(DaemonClient, 'close', recording_close)
+
+        @recorder.scope
+        async def main():
+            recorder.params({'lr': 0.1})
+            for i in range(10):
+                recorder.metrics({'loss': i}, step=(i, 'epoch'))
+                await asyncio.sleep(0)
+
+        asyncio.run(main())
+
+        # waiting for the daemon does not block the event loop
+        assert close_threads
+        assert threading.main_thread() not in close_threads
+        run = repo.find_runs('')[0]
+        assert run.params == {'lr': 0.1}
+        assert run.step_metrics.column('loss') == list(range(10))
+        assert run.info['status'] == 'complete'
+
+    def test_concurrent_clients(self, daemon):
+        repo = Repository()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main(value):
+            recorder.params({'value': value})
+            for i in range(10):
+                recorder.metrics({'value': value}, step=(i, 'step'))
+
+        threads = [threading.Thread(target=main, args=(i,))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        runs = repo.find_runs('')
+        assert len(runs) == 20
+        for run in runs:
+            value = run.params['value']
+            assert run.step_metrics.column('value') == [value] * 10
+        with repo.open_workspace() as ws:
+            assert len(ws.untracked_runs) == 20
+
+    def test_killed_client(self, daemon):
+        repo = Repository()
+        client = connect_daemon(repo, 'run1')
+        client.write({'op': 'params', 'data': {'lr': 0.1}})
+        client.write({'op': 'info', 'data': {'status': 'running'}})
+        client._send()
+        client._sock.close()
+
+        run = None
+        for _ in range(100):
+            try:
+                run = repo.get_run('run1')
+            except KeyError:
+                pass
+            else:
+                if run.info.get('status') == 'interrupted':
+                    break
+            threading.Event().wait(0.01)
+        assert run.params == {'lr': 0.1}
+        assert run.info['status'] == 'interrupted'
+
+    def test_already_running(self, daemon):
+        with pytest.raises(RuntimeError):
+            RecordingDaemon(Repository()).start()
+
+
+class TestFallback:
+
+    def test_no_daemon(self, work_dir):
+        repo = Repository.initialize()
+        assert connect_daemon(repo, 'run1') is None
+
+    def test_stale_socket(self, work_dir):
+        repo = Repository.initialize()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(repo.daemon_socket_path())
+        sock.close()
+        assert connect_daemon(repo, 'run1') is None
+
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main():
+            recorder.params({'lr': 0.1})
+
+        main()
+        assert repo.find_runs('')[0].params == {'lr': 0.1}
+
+    def test_daemon_stopped(self, work_dir):
+        repo = Repository.initialize()
+        daemon = RecordingDaemon(repo)
+        daemon.start()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main():
+            recorder.params({'lr': 0.1})
+            # the daemon stops without processing any message
+            daemon.close()
+
+        main()
+        run = repo.find_runs('')[0]
+        assert run.params == {'lr': 0.1}
+        assert run.info['status'] == 'complete'
+        with repo.open_workspace() as ws:
+            assert ws.untracked_runs == [run.id]
@@ -0,0 +1,92 @@
+import time
+import warnings
+
+import pytest
+
+from expnote.recording.memory import Memory
+from expnote.recording.flusher import BackgroundFlusher
+
+
+class Repository:
+    """Simple repository implementation for testing."""
+
+    def __init__(self):
+        self.runs = {}
+        self.step_logs = {}
+
+    def save_run(self, run, include_step_metrics=True, rank=None):
+        self.runs[run.id] = run
+
+    def append_step_metrics(self, run_id, rows, rank=None, times=None):
+        self.step_logs.setdefault(run_id, []).extend(rows)
+
+
+def wait_until(condition, timeout=5.):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+class TestBackgroundFlusher:
+
+    def test_no_trigger(self):
+        with pytest.raises(ValueError):
+            BackgroundFlusher(Memory(run_id='0'))
+
+    def test_steps(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            with BackgroundFlusher(mem, steps=10):
+                for i in range(25):
+                    mem.set_metrics({'loss': i}, step=(i, 'epoch'))
+                assert wait_until(
+                    lambda: len(repo.step_logs.get('0', [])) >= 20)
+            assert mem.step_hooks == []
+
+    def test_interval(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            with BackgroundFlusher(mem, interval=0.01):
+                mem.set_params({'lr': 0.1})
+                mem.set_metrics({'loss': 1}, step=(0, 'epoch'))
+                assert wait_until(lambda: '0' in repo.step_logs)
+
+        assert repo.runs['0'].params == {'lr': 0.1}
+        assert repo.step_logs['0'] == [(0, {'epoch': 0, 'loss': 1})]
+
+    def test_flush_error(self):
+        class BrokenRepository(Repository):
+            def append_step_metrics(self, run_id, rows, rank=None, times=None):
+                raise OSError('disk full')
+
+        with Memory(run_id='0', repo=BrokenRepository()) as mem:
+            with pytest.warns(UserWarning):
+                with BackgroundFlusher(mem, steps=1):
+                    mem.set_metrics({'loss': 1}, step=(0, 'epoch'))
+                    time.sleep(0.1)
+        # the rows are flushed again next time
+        assert list(mem._dirty_rows) == [0]
+
+    def test_updated_while_flushing(self):
+        class SlowRepository(Repository):
+            def save_run(self, run, include_step_metrics=True, rank=None):
+                # serialized while the recording thread adds keys
+                for data in (run.params, run.metrics, run.info or {}):
+                    for _ in data:
+                        time.sleep(0)
+                super().save_run(run, include_step_metrics, rank)
+
+        with Memory(run_id='0', repo=SlowRepository()) as mem:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                with BackgroundFlusher(mem, interval=0.001):
+                    for i in range(3000):
+                        time.sleep(0)
+                        mem.set_params({'p{}'.format(i): i})
+                        mem.set_metrics({'m{}'.format(i): i})
+                        mem.set_info({'i{}'.format(i): i})
+        assert caught == []
+
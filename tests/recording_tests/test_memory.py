@@ -1,10 +1,15 @@
+import asyncio
+import threading
+
 import pytest
 
 from expnote.recording.memory import merge_dicts
 from expnote.recording.memory import Memory
 from expnote.recording.memory import set_params
 from expnote.recording.memory import set_metrics
+from expnote.recording.memory import set_metrics_batch
 from expnote.recording.memory import set_info
+from expnote.recording.memory import get_current_memory
 
 
 @pytest.mark.parametrize('dict1, dict2, expected', [
@@ -25,10 +30,16 @@ class Repository:
 
     def __init__(self):
         self.runs = {}
+        self.step_logs = {}
 
-    def save_run(self, run):
+    def save_run(self, run, include_step_metrics=True, rank=None):
+        if not include_step_metrics and run.id in self.runs:
+            run.step_metrics = self.runs[run.id].step_metrics
         self.runs[run.id] = run
 
+    def append_step_metrics(self, run_id, rows, rank=None, times=None):
+        self.step_logs.setdefault(run_id, []).extend(rows)
+
     def get_run(self, run_id):
         return self.runs[run_id]
 
@@ -86,3 +97,245 @@ class TestMemory:
             'status': 'complete',
             'start_time': '2022-10-09 12:00:00.000000'
         }
+
+    def test_step_metrics_update(self):
+        with Memory(run_id='0') as mem:
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 2}, step=(1, 'epoch'))
+            mem.set_metrics({'acc': 0.5, 'lr': 0.1}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 1}, step=(2, 'epoch'))
+            mem.set_metrics({'acc': 0.7}, step=(1, 'epoch'))
+
+        assert mem.step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.5, 'lr': 0.1},
+            {'epoch': 1, 'loss': 2, 'acc': 0.7},
+            {'epoch': 2, 'loss': 1},
+        ]
+
+    def test_step_metrics_different_step_keys(self):
+        with Memory(run_id='0') as mem:
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 2}, step=(0, 'iteration'))
+            mem.set_metrics({'acc': 0.5}, step=(0, 'epoch'))
+
+        assert mem.step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.5},
+            {'iteration': 0, 'loss': 2},
+        ]
+        assert mem.step_keys == ['epoch', 'iteration']
+
+    def test_incremental_flush(self):
+        repo = Repository()
+
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.set_params({'lr': 0.1})
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 2}, step=(1, 'epoch'))
+            mem.flush(incremental=True)
+            assert repo.step_logs['0'] == [
+                (0, {'epoch': 0, 'loss': 3}),
+                (1, {'epoch': 1, 'loss': 2}),
+            ]
+
+            # only new rows and updated rows are appended
+            mem.set_metrics({'loss': 1}, step=(2, 'epoch'))
+            mem.set_metrics({'acc': 0.5}, step=(0, 'epoch'))
+            mem.flush(incremental=True)
+            assert repo.step_logs['0'][2:] == [
+                (0, {'epoch': 0, 'loss': 3, 'acc': 0.5}),
+                (2, {'epoch': 2, 'loss': 1}),
+            ]
+
+            mem.flush(incremental=True)
+            assert len(repo.step_logs['0']) == 4
+
+        run = repo.get_run('0')
+        assert run.params == {'lr': 0.1}
+        assert run.step_metrics is None
+
+    def test_summaries(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            for i, loss in enumerate([3, 1, 2]):
+                mem.set_metrics({'loss': loss, 'tag': 'a'}, step=(i, 'epoch'))
+            mem.set_metrics_batch({'loss': [0.5, 4.]},
+                                  steps=([3, 4], 'epoch'))
+            mem.set_metrics({'acc': 0.9})
+            mem.flush(incremental=True)
+
+        assert repo.get_run('0').summaries == {
+            'loss': {'last': 4., 'min': 0.5, 'argmin': 3, 'max': 4.,
+                     'argmax': 4, 'mean': 2.1, 'count': 5},
+        }
+
+    def test_summaries_overwritten(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 1}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 2}, step=(1, 'epoch'))
+            # a metric added to a recorded step is not an overwrite
+            mem.set_metrics({'acc': 0.5}, step=(1, 'epoch'))
+            mem.set_metrics_batch({'acc': [0.1, 0.2]},
+                                  steps=([0, 1], 'epoch'))
+            mem.flush(incremental=True)
+
+        assert repo.get_run('0').summaries == {
+            'loss': {'last': 2, 'min': 1, 'argmin': 0, 'max': 2,
+                     'argmax': 1, 'mean': 1.5, 'count': 2},
+            'acc': {'last': 0.2, 'min': 0.1, 'argmin': 0, 'max': 0.2,
+                    'argmax': 1, 'mean': 0.15000000000000002, 'count': 2},
+        }
+        assert mem._stale_summaries == {}
+
+    def test_summaries_flushed_concurrently(self):
+        mem = Memory(run_id='0')
+        mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+        threads = []
+        set_step = mem.step_metrics.set
+
+        def set_while_flushing(*args):
+            # summaries are recomputed in a flushing thread while the step
+            # is overwritten
+            thread = threading.Thread(target=mem._summaries_dict)
+            thread.start()
+            thread.join(0.1)
+            threads.append(thread)
+            return set_step(*args)
+
+        mem.step_metrics.set = set_while_flushing
+        mem.set_metrics({'loss': 1}, step=(0, 'epoch'))
+        for thread in threads:
+            thread.join()
+        assert mem._summaries_dict()['loss'] == {
+            'last': 1, 'min': 1, 'argmin': 0, 'max': 1, 'argmax': 0,
+            'mean': 1., 'count': 1}
+
+    def test_summaries_repeated_in_batch(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.set_metrics_batch({'loss': [3, 1]}, steps=([0, 0], 'epoch'))
+            mem.flush()
+
+        assert repo.get_run('0').summaries['loss'] == {
+            'last': 1, 'min': 1, 'argmin': 0, 'max': 1, 'argmax': 0,
+            'mean': 1., 'count': 1}
+
+    def test_step_times(self):
+        repo = Repository()
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'), timestamp=10.)
+            # an updated step keeps the time of the first record
+            mem.set_metrics({'acc': 0.1}, step=(0, 'epoch'), timestamp=11.)
+            mem.set_metrics({'loss': 2}, step=(1, 'epoch'), timestamp=12.)
+            mem.set_metrics_batch({'loss': [1, 0]}, steps=([2, 3], 'epoch'),
+                                  timestamp=13.)
+            mem.add_time('data', 0.5)
+            mem.add_time('data', 1.5)
+            mem.flush()
+
+        run = repo.get_run('0')
+        assert run.step_times == [10., 12., 13., 13.]
+        assert run.timing == {
+            'steps_per_sec': 1.,
+            'sections': {'data': {'total': 2., 'count': 2}},
+        }
+
+    def test_step_times_incremental_flush(self):
+        repo = Repository()
+        appended = []
+        repo.append_step_metrics = (
+            lambda run_id, rows, rank=None, times=None: appended.append(times))
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'), timestamp=10.)
+            mem.flush(incremental=True)
+            mem.set_metrics({'acc': 0.1}, step=(0, 'epoch'))
+            mem.set_metrics({'loss': 2}, step=(1, 'epoch'), timestamp=12.)
+            mem.flush(incremental=True)
+
+        assert appended == [(0, [10.]), (1, [12.])]
+
+    def test_set_metrics_batch(self):
+        repo = Repository()
+        new_steps = []
+
+        with Memory(run_id='0', repo=repo) as mem:
+            mem.step_hooks.append(new_steps.append)
+            mem.set_metrics({'loss': 3}, step=(0, 'epoch'))
+            mem.flush(incremental=True)
+            set_metrics_batch({'loss': [2, 1], 'acc': [0.5, 0.6]},
+                              steps=([1, 2], 'epoch'))
+            mem.set_metrics_batch({'acc': [0.4]}, steps=([0], 'epoch'))
+            mem.flush(incremental=True)
+
+        assert mem.step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.4},
+            {'epoch': 1, 'loss': 2, 'acc': 0.5},
+            {'epoch': 2, 'loss': 1, 'acc': 0.6},
+        ]
+        assert new_steps == [1, 2]
+        assert [index for index, _ in repo.step_logs['0']] == [0, 0, 1, 2]
+
+
+class TestConcurrentMemories:
+
+    def test_threads(self):
+        num_threads = 200
+        barrier = threading.Barrier(num_threads)
+        memories = {}
+
+        def record(run_id):
+            with Memory(run_id=run_id) as mem:
+                memories[run_id] = mem
+                barrier.wait()  # all memories are in use
+                set_params({'run_id': run_id})
+                for i in range(10):
+                    set_metrics({'value': run_id}, step=(i, 'step'))
+
+        threads = [threading.Thread(target=record, args=(str(i),))
+                   for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(memories) == num_threads
+        for run_id, mem in memories.items():
+            assert mem.params == {'run_id': run_id}
+            assert mem.step_metrics.column('value') == [run_id] * 10
+
+    def test_asyncio_tasks(self):
+        num_tasks = 500
+
+        async def record(run_id):
+            with Memory(run_id=run_id) as mem:
+                for i in range(10):
+                    set_metrics({'value': run_id}, step=(i, 'step'))
+                    await asyncio.sleep(0)
+            return mem
+
+        async def main():
+            return await asyncio.gather(*[record(str(i))
+                                          for i in range(num_tasks)])
+
+        memories = asyncio.run(main())
+        for mem in memories:
+            assert mem.step_metrics.column('value') == [mem.run_id] * 10
+
+    def test_nested(self):
+        with Memory(run_id='0') as mem0:
+            with Memory(run_id='1') as mem1:
+                assert get_current_memory() is mem1
+            assert get_current_memory() is mem0
+
+    def test_child_thread(self):
+        # a thread without memory uses the only memory in use
+        with Memory(run_id='0') as mem:
+            thread = threading.Thread(target=set_params, args=({'a': 1},))
+            thread.start()
+            thread.join()
+        assert mem.params == {'a': 1}
+
+    def test_no_memory(self):
+        with pytest.raises(IndexError):
+            get_current_memory()
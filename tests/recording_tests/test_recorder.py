@@ -1,10 +1,17 @@
+import asyncio
+import json
 import os
 from pathlib import Path
 import shutil
+import subprocess
+import sys
 from tempfile import mkdtemp
+import threading
+import time
 
 import pytest
 
+from expnote.run import Run
 from expnote.repository import Repository
 from expnote.recording import Recorder
 
@@ -59,3 +66,376 @@ class TestRecorder:
         assert 'end_time' in run.info
         assert run.info['status'] == 'complete'
         assert run.info['tag'] == 'train'
+
+    def test_concurrent_scopes(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+        num_threads = 100
+
+        @recorder.scope
+        def main(value):
+            recorder.params({'value': value})
+            for i in range(10):
+                recorder.metrics({'value': value}, step=(i, 'step'))
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=main, args=(i,))
+                   for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        runs = repo.find_runs('')
+        assert len(runs) == num_threads
+        for run in runs:
+            value = run.params['value']
+            assert run.step_metrics.column('value') == [value] * 10
+        with repo.open_workspace() as ws:
+            assert len(ws.untracked_runs) == num_threads
+
+    def test_ranks(self, work_dir):
+        repo = Repository.initialize()
+
+        def main(rank):
+            recorder = Recorder(repo=repo, run_id='shared', rank=rank)
+
+            @recorder.scope
+            def train():
+                recorder.params({'lr': 0.1})
+                for i in range(10):
+                    recorder.metrics({'epoch': i, 'throughput': rank},
+                                     step=(i, 'epoch'))
+
+            train()
+
+        threads = [threading.Thread(target=main, args=(rank,))
+                   for rank in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        runs = repo.find_runs('')
+        assert len(runs) == 1
+        run = runs[0]
+        assert run.id == 'shared'
+        assert run.params == {'lr': 0.1}
+        assert run.step_metrics.column('throughput') == [1.5] * 10
+        assert run.info['status'] == 'complete'
+        assert len(repo.get_run('shared', ranks='separate').shards) == 4
+        with repo.open_workspace() as ws:
+            assert ws.untracked_runs == ['shared']
+
+    def test_resource_collector(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, resource_interval=0.01)
+
+        @recorder.scope
+        def main():
+            time.sleep(0.05)
+
+        main()
+        run = repo.find_runs('')[0]
+        assert len(run.system_metrics) >= 1
+        assert 'cpu_percent' in run.system_metrics.keys()
+
+    def test_metrics_batch(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main():
+            recorder.metrics_batch({'loss': [3, 2, 1]},
+                                   steps=(range(3), 'epoch'))
+            recorder.metrics({'acc': 0.5}, step=(2, 'epoch'))
+
+        main()
+        run = repo.find_runs('')[0]
+        assert run.step_metrics == [
+            {'epoch': 0, 'loss': 3},
+            {'epoch': 1, 'loss': 2},
+            {'epoch': 2, 'loss': 1, 'acc': 0.5},
+        ]
+
+    def test_skip_if_exists(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+        calls = []
+
+        @recorder.scope(skip_if_exists=True)
+        def main(lr):
+            recorder.params({'lr': lr, 'model': {'depth': 18}})
+            calls.append(lr)
+            recorder.metrics({'acc': lr * 2})
+            return lr
+
+        assert main(0.1) == 0.1
+        run = main(0.1)
+        assert run.params == {'lr': 0.1, 'model': {'depth': 18}}
+        assert run.metrics == {'acc': 0.2}
+        assert main(0.2) == 0.2
+        assert calls == [0.1, 0.2]
+
+        # the skipped run is discarded
+        runs = repo.find_runs('')
+        assert len(runs) == 2
+        with repo.open_workspace() as workspace:
+            assert sorted(workspace.untracked_runs) == sorted(
+                r.id for r in runs)
+
+    def test_skip_if_exists_wal(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, wal=True, flush_interval=0.01)
+
+        @recorder.scope(skip_if_exists=True)
+        def main():
+            recorder.params({'lr': 0.1})
+            time.sleep(0.05)
+
+        main()
+        assert isinstance(main(), Run)
+        assert len(repo.find_runs('')) == 1
+        assert repo.recover_runs() == []
+
+    def test_timing(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, flush_steps=2)
+
+        @recorder.scope
+        def main():
+            for i in range(5):
+                with recorder.timer('data'):
+                    time.sleep(0.01)
+                recorder.metrics({'loss': 5 - i}, step=(i, 'step'))
+
+        main()
+        run = repo.find_runs('')[0]
+        assert len(run.step_times) == 5
+        assert run.step_times == sorted(run.step_times)
+        assert 0 < run.timing['steps_per_sec'] < 100
+        assert run.timing['sections']['data']['count'] == 5
+        assert run.timing['sections']['data']['total'] >= 0.05
+
+    @pytest.mark.parametrize('mode', ['deterministic', 'sampling'])
+    def test_profile(self, work_dir, mode):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        def busy_function():
+            end = time.perf_counter() + 0.1
+            data = []
+            while time.perf_counter() < end:
+                data.append(bytearray(100))
+            return data
+
+        @recorder.scope(profile=mode)
+        def main():
+            return busy_function()
+
+        main()
+        run = repo.find_runs('')[0]
+        assert list(run.artifacts) == ['profile']
+        profile = json.loads(repo.get_blob(run.artifacts['profile']['digest']))
+        assert profile['mode'] == mode
+        names = [f['function'] for f in profile['functions']]
+        assert 'busy_function' in names
+        assert profile['allocations'][0]['size'] > 0
+
+    def test_profile_section(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        def main():
+            with recorder.profile(name='section', memory=False):
+                sum(range(1000))
+
+        main()
+        run = repo.find_runs('')[0]
+        profile = json.loads(repo.get_blob(run.artifacts['section']['digest']))
+        assert 'allocations' not in profile
+
+    def test_no_profile(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+        main = recorder.scope(lambda: None)
+        main()
+        run = repo.find_runs('')[0]
+        assert run.artifacts is None
+
+    def test_artifact(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+        Path('model.bin').write_bytes(b'weights')
+        Path('config.json').write_text('{}')
+
+        @recorder.scope
+        def main(lr):
+            recorder.params({'lr': lr})
+            recorder.artifact('model.bin')
+            recorder.artifact('config.json', name='cfg')
+
+        main(0.1)
+        main(0.2)
+        runs = repo.find_runs('')
+        refs = [run.artifacts['model.bin'] for run in runs]
+        assert refs[0] == refs[1]
+        assert refs[0]['size'] == 7
+        assert repo.get_blob(refs[0]['digest']) == b'weights'
+        assert repo.get_blob(runs[0].artifacts['cfg']['digest']) == b'{}'
+
+        # blobs are shared by the runs
+        blobs = [p for p in (work_dir / '.expnote' / 'blobs').rglob('*')
+                 if p.is_file()]
+        assert len(blobs) == 2
+
+    def test_background_flush(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, flush_steps=10)
+
+        @recorder.scope
+        def main():
+            for i in range(100):
+                recorder.metrics({'loss': i}, step=(i, 'epoch'))
+            # steps are readable while the run is in progress
+            start = time.time()
+            while time.time() - start < 5:
+                run = repo.find_runs('')[0]
+                if run.step_metrics is not None and len(run.step_metrics) == 100:
+                    break
+                time.sleep(0.01)
+            assert run.info['status'] == 'running'
+            assert len(run.step_metrics) == 100
+
+        main()
+        run = repo.find_runs('')[0]
+        assert run.info['status'] == 'complete'
+        assert len(run.step_metrics) == 100
+
+    def test_background_flush_latency(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, flush_interval=0.01, flush_steps=100)
+        num_steps = 20000
+
+        @recorder.scope
+        def main():
+            start = time.perf_counter()
+            for i in range(num_steps):
+                recorder.metrics({'loss': 1.0, 'acc': 0.5}, step=(i, 'iter'))
+            return (time.perf_counter() - start) / num_steps
+
+        per_call = main()
+        assert per_call < 100e-6
+
+        run = repo.find_runs('')[0]
+        assert len(run.step_metrics) == num_steps
+
+    def test_async(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, flush_interval=0.01)
+
+        @recorder.scope
+        async def evaluate(value):
+            recorder.params({'value': value})
+            for i in range(5):
+                await asyncio.sleep(0.001)
+                recorder.metrics({'value': value}, step=(i, 'step'))
+            return value
+
+        async def main():
+            return await asyncio.gather(*[evaluate(i) for i in range(20)])
+
+        assert asyncio.iscoroutinefunction(evaluate)
+        assert asyncio.run(main()) == list(range(20))
+
+        runs = repo.find_runs('')
+        assert len(runs) == 20
+        for run in runs:
+            assert run.info['status'] == 'complete'
+            value = run.params['value']
+            assert run.step_metrics.column('value') == [value] * 5
+
+    def test_async_failed(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        @recorder.scope
+        async def evaluate():
+            await asyncio.sleep(0)
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            asyncio.run(evaluate())
+
+        runs = repo.find_runs('')
+        assert len(runs) == 1
+
+    def test_wal(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, wal=True)
+
+        @recorder.scope
+        def main():
+            recorder.params({'lr': 0.1})
+
+        main()
+        assert len(repo.find_runs('')) == 1
+        assert repo.recover_runs() == []
+
+    def test_wal_failed(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo, wal=True)
+
+        @recorder.scope
+        def main():
+            recorder.params({'lr': 0.1})
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            main()
+        # the log is removed since the failed run is saved
+        assert repo._storage.glob('wal/*') == []
+        assert repo.recover_runs() == []
+        assert repo.get_run(repo.find_run_ids('')[0]).info['status'] == \
+            'failed'
+
+    def test_wal_killed(self, work_dir):
+        Repository.initialize()
+        script = '\n'.join([
+            'import os',
+            'from expnote.recording import Recorder',
+            'recorder = Recorder(wal=True)',
+            '@recorder.scope',
+            'def main():',
+            '    recorder.params({"lr": 0.1})',
+            '    for i in range(3):',
+            '        recorder.metrics({"loss": i}, step=(i, "epoch"))',
+            '    os._exit(1)',
+            'main()',
+        ])
+        package_root = Path(__file__).resolve().parents[2]
+        env = dict(os.environ, PYTHONPATH=str(package_root))
+        subprocess.run([sys.executable, '-c', script], env=env)
+
+        repo = Repository()
+        assert len(repo.recover_runs()) == 1
+        run = repo.find_runs('')[0]
+        assert run.info['status'] == 'interrupted'
+        assert run.params == {'lr': 0.1}
+        assert len(run.step_metrics) == 3
+
+    def test_import_without_heavy_modules(self):
+        script = '\n'.join([
+            'import sys',
+            'from expnote.recording import Recorder',
+            'print(" ".join(sys.modules))',
+        ])
+        package_root = Path(__file__).resolve().parents[2]
+        env = dict(os.environ, PYTHONPATH=str(package_root))
+        proc = subprocess.run([sys.executable, '-c', script], env=env,
+                              capture_output=True, text=True, check=True)
+        modules = proc.stdout.split()
+        for name in ('PIL', 'filelock', 'matplotlib', 'numpy',
+                     'cProfile', 'tracemalloc'):
+            assert name not in modules
@@ -0,0 +1,153 @@
+import os
+from pathlib import Path
+import shutil
+from tempfile import mkdtemp
+
+import pytest
+
+from expnote.experiment import Experiment
+from expnote.repository import Repository
+from expnote.recording import Recorder
+from expnote.recording.memory import set_metrics
+from expnote.recording.sweep import grid
+from expnote.recording.sweep import random_search
+
+
+def train(lr, batch_size=32):
+    if lr < 0:
+        raise ValueError('negative lr')
+    if lr == 0:
+        os._exit(1)
+    set_metrics({'loss': lr * batch_size})
+    return lr * 10
+
+
+@pytest.fixture
+def work_dir() -> Path:
+    org_dir = os.getcwd()
+    try:
+        tmp_dir = mkdtemp()
+        tmp_dir_path = Path(tmp_dir).resolve()
+        os.chdir(tmp_dir_path)
+        yield tmp_dir_path
+
+    finally:
+        os.chdir(org_dir)
+        shutil.rmtree(tmp_dir)
+
+
+def test_grid():
+    params_list = list(grid({'lr': [0.1, 0.01], 'batch_size': [32, 64]}))
+    assert params_list == [
+        {'lr': 0.1, 'batch_size': 32},
+        {'lr': 0.1, 'batch_size': 64},
+        {'lr': 0.01, 'batch_size': 32},
+        {'lr': 0.01, 'batch_size': 64},
+    ]
+
+
+def test_random_search():
+    space = {'lr': lambda rng: rng.uniform(0., 1.), 'batch_size': [32, 64]}
+    params_list = list(random_search(space, num_samples=5, seed=0))
+    assert len(params_list) == 5
+    for params in params_list:
+        assert 0. <= params['lr'] <= 1.
+        assert params['batch_size'] in (32, 64)
+    assert params_list == list(random_search(space, num_samples=5, seed=0))
+
+
+class TestSweep:
+
+    def test(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        params_list = list(grid({'lr': [0.1, 0.2, 0.3], 'batch_size': [1]}))
+        results = recorder.sweep(train, params_list, workers=2)
+
+        assert [r.params for r in results] == params_list
+        assert [r.value for r in results] == [1., 2., 3.]
+        assert all(r.error is None for r in results)
+
+        runs = {run.id: run for run in repo.find_runs('')}
+        assert len(runs) == 3
+        for result in results:
+            run = runs[result.run_id]
+            assert run.params == result.params
+            assert run.metrics == {'loss': result.params['lr']}
+            assert run.info['status'] == 'complete'
+        with repo.open_workspace() as ws:
+            assert sorted(ws.untracked_runs) == sorted(runs)
+
+    def test_skip_if_exists(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        first = recorder.sweep(train, [{'lr': 0.1}, {'lr': -1.}])
+        results = recorder.sweep(train, [{'lr': 0.1}, {'lr': -1.}, {'lr': 0.2}],
+                                 skip_if_exists=True)
+
+        assert results[0].skipped
+        assert results[0].run_id == first[0].run_id
+        # failed runs are recorded again
+        assert not results[1].skipped
+        assert results[1].error == 'ValueError: negative lr'
+        assert not results[2].skipped
+        assert results[2].value == 2.
+        assert len(repo.find_runs('')) == 4
+
+    def test_failure_isolation(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        params_list = [{'lr': 0.1}, {'lr': -1.}, {'lr': 0}, {'lr': 0.2}]
+        results = recorder.sweep(train, params_list, workers=1)
+
+        assert results[0].error is None
+        assert results[1].error == 'ValueError: negative lr'
+        assert results[2].error == 'Worker process terminated'
+        assert results[3].error is None
+        assert results[3].value == 2.
+
+        failed_run = repo.get_run(results[1].run_id)
+        assert failed_run.info['status'] == 'failed'
+        killed_run = repo.get_run(results[2].run_id)
+        assert killed_run.info['status'] == 'interrupted'
+
+    def test_failure_isolation_parallel(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        params_list = [{'lr': 0.1}, {'lr': 0}, {'lr': 0.2}, {'lr': 0.3},
+                       {'lr': 0.4}]
+        results = recorder.sweep(train, params_list, workers=3)
+
+        # only the call which terminated the process fails
+        assert [r.error for r in results] == \
+            [None, 'Worker process terminated', None, None, None]
+        assert [r.value for r in results] == [1., None, 2., 3., 4.]
+        assert repo.get_run(results[1].run_id).info['status'] == \
+            'interrupted'
+        for result in results:
+            if result.error is None:
+                run = repo.get_run(result.run_id)
+                assert run.info['status'] == 'complete'
+        # runs of the calls terminated with the process are not left
+        # running
+        assert all(run.info['status'] != 'running'
+                   for run in repo.find_runs(''))
+
+    def test_experiment(self, work_dir):
+        repo = Repository.initialize()
+        recorder = Recorder(repo=repo)
+
+        experiment = Experiment(title='lr search')
+        results = recorder.sweep(train, grid({'lr': [0.1, 0.2]}),
+                                 workers=2, experiment=experiment)
+
+        assert experiment.id is not None
+        with repo.open_workspace() as ws:
+            assert ws.uncommitted_experiments == [experiment.id]
+            assert sorted(ws.assigned_runs[experiment.id]) == sorted(
+                r.run_id for r in results)
+            assert ws.untracked_runs == []
@@ -0,0 +1,37 @@
+import pytest
+
+from expnote.repository.compression import decompress
+from expnote.repository.compression import detect_codec
+from expnote.repository.compression import get_codec
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize('name', ['zlib', 'lzma'])
+    def test_codec(self, tmp_path, name):
+        codec = get_codec(name)
+        path = tmp_path / 'data'
+        # concatenated streams are read as one
+        path.write_bytes(codec.compress(b'abc' * 100) + codec.compress(b'de'))
+
+        with path.open('rb') as f:
+            assert detect_codec(f.read(6)) is codec
+            f.seek(0)
+            assert codec.open_reader(f).read() == b'abc' * 100 + b'de'
+
+    @pytest.mark.parametrize('name', ['zlib', 'lzma'])
+    def test_decompress(self, name):
+        codec = get_codec(name)
+        data = codec.compress(b'head\n' + bytes(range(256)) * 100)
+        assert decompress(data + codec.compress(b'x')).endswith(b'\xffx')
+        assert decompress(b'plain') == b'plain'
+        # the head is decompressed from truncated data
+        assert codec.decompress_head(data[:200]).startswith(b'head\n')
+
+    def test_detect_plain(self):
+        assert detect_codec(b'{"id": ') is None
+        assert detect_codec(b'') is None
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_codec('unknown')
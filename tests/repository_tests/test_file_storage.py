@@ -1,4 +1,6 @@
+import hashlib
 import os
+import re
 from pathlib import Path
 import shutil
 from tempfile import mkdtemp
@@ -8,6 +10,8 @@ from PIL import Image
 
 from expnote.repository.file_storage import FileStorage
 from expnote.repository.file_storage import DIR_NAME
+from expnote.repository.file_storage import HASH_CHUNK_SIZE
+from expnote.repository.file_storage import hash_file
 
 
 @pytest.fixture
@@ -103,6 +107,164 @@ class TestFileStorage:
                                   prefix + 'aaa2',
                                   prefix + 'aaa3'}
 
+    def test_save_atomic(self, work_dir):
+        storage = FileStorage.initialize()
+        storage.save('content', 'inbox/aaa1')
+        # e.g. a temporary file left by a process killed while saving
+        (work_dir / DIR_NAME / 'inbox' / 'aaa2.0123.tmp').write_text('con')
+        assert storage.glob('inbox/*') == ['inbox/aaa1']
+        assert storage.get('inbox/aaa1') == 'content'
+
+    def test_fanout(self, work_dir):
+        storage = FileStorage.initialize()
+        assert storage.layout == 'fanout'
+        assert FileStorage().layout == 'fanout'
+
+        obj_dir = storage.fanout_dir('runs', 'abc')
+        assert re.fullmatch('runs/[0-9a-f]{2}/[0-9a-f]{2}', obj_dir)
+        assert storage.fanout_dir('runs', 'abc', layout='flat') == 'runs'
+
+        storage.save('', obj_dir + '/abc')
+        storage.save('', obj_dir + '/abc.steps')
+        assert sorted(storage.fanout_glob('runs', 'abc*')) == [
+            obj_dir + '/abc', obj_dir + '/abc.steps']
+
+    def test_legacy_layout(self, work_dir):
+        # a storage created before the config was introduced
+        Path(DIR_NAME).mkdir()
+        assert FileStorage().layout == 'flat'
+
+    def test_relayout(self, work_dir):
+        storage = FileStorage.initialize()
+        for name in ['abc', 'abc.steps', 'def']:
+            storage.save(name, 'runs/' + name)
+
+        assert storage.relayout('runs', 'fanout') == 3
+        for name in ['abc', 'abc.steps', 'def']:
+            obj_dir = storage.fanout_dir('runs', name.split('.')[0])
+            assert storage.get(obj_dir + '/' + name) == name
+        assert storage.fanout_glob('runs', '*', layout='flat') == [
+            p for p in storage.glob('runs/*') if len(p) == len('runs/00')]
+        # completed already
+        assert storage.relayout('runs', 'fanout') == 0
+
+        assert storage.relayout('runs', 'flat') == 3
+        assert sorted(storage.glob('runs/*')) == [
+            'runs/abc', 'runs/abc.steps', 'runs/def']
+
+    def test_pack(self, work_dir):
+        storage = FileStorage.initialize()
+        storage.save('content1', 'runs/ab/abc1')
+        storage.save('content2', 'runs/ab/abc2')
+        assert storage.pack(['runs/ab/abc1', 'runs/ab/abc2']) == 2
+        assert storage.pack(['runs/ab/abc1']) == 0
+        assert not (work_dir / DIR_NAME / 'runs').exists()
+
+        storage = FileStorage()
+        assert storage.get('runs/ab/abc1') == 'content1'
+        assert bytes(storage.get_buffer('runs/ab/abc2')) == b'content2'
+        assert sorted(storage.glob('runs/ab/abc*')) == [
+            'runs/ab/abc1', 'runs/ab/abc2']
+
+        # saved again out of the pack
+        storage.save('updated', 'runs/ab/abc1')
+        assert storage.get('runs/ab/abc1') == 'updated'
+        assert storage.glob('runs/ab/abc1') == ['runs/ab/abc1']
+
+        storage.remove('runs/ab/abc1')
+        with pytest.raises(KeyError):
+            storage.get('runs/ab/abc1')
+        assert storage.get('runs/ab/abc2') == 'content2'
+
+    def test_relayout_packed(self, work_dir):
+        storage = FileStorage.initialize()
+        storage.save('packed', 'runs/abc')
+        storage.pack(['runs/abc'])
+        storage.save('loose', 'runs/def')
+
+        assert storage.relayout('runs', 'fanout') == 2
+        assert storage.get(storage.fanout_dir('runs', 'abc') + '/abc') == \
+            'packed'
+        assert storage.get(storage.fanout_dir('runs', 'def') + '/def') == \
+            'loose'
+        with pytest.raises(KeyError):
+            storage.get('runs/abc')
+
+    @pytest.mark.parametrize('obj_path', ['test', 'tests/abcdefg'])
+    def test_append(self, work_dir, obj_path):
+        storage = FileStorage.initialize()
+        storage.append('abc', obj_path)
+        storage.append('def', obj_path)
+        assert storage.get(obj_path) == 'abcdef'
+
+    def test_binary(self, work_dir):
+        storage = FileStorage.initialize()
+        storage.save(b'\x00\x01', 'data', data_type='binary')
+        buffer = storage.get_buffer('data')
+        # a loose object is read into memory and no file is kept open
+        assert isinstance(buffer, bytes)
+        storage.save(b'\x02', 'data', data_type='binary')
+        assert buffer == b'\x00\x01'
+        assert storage.get('data', data_type='binary') == b'\x02'
+        with pytest.raises(KeyError):
+            storage.get_buffer('unknown')
+
+    def test_get_range(self, work_dir):
+        storage = FileStorage.initialize()
+        storage.save(b'0123456789', 'loose', data_type='binary')
+        storage.save(b'abcdefghij', 'packed', data_type='binary')
+        storage.pack(['packed'])
+        for obj_path, data in [('loose', b'0123456789'),
+                               ('packed', b'abcdefghij')]:
+            assert storage.get_range(obj_path) == data
+            assert storage.get_range(obj_path, 2, 3) == data[2:5]
+            assert storage.get_range(obj_path, 8) == data[8:]
+            assert storage.get_range(obj_path, 0, 100) == data
+            assert storage.get_size(obj_path) == 10
+        with pytest.raises(KeyError):
+            storage.get_range('unknown')
+
+    @pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+    def test_compression(self, work_dir, codec):
+        storage = FileStorage.initialize()
+        storage.save('plain', 'plain')
+        storage.save_config(dict(storage.config, compression=codec))
+
+        storage = FileStorage()
+        content = '{"loss": 0.5}\n' * 100
+        storage.save(content, 'runs/1')
+        assert len((work_dir / DIR_NAME / 'runs' / '1').read_bytes()) < 100
+        storage.append('{"loss": 0.1}\n', 'runs/1')
+        assert storage.get('runs/1') == content + '{"loss": 0.1}\n'
+        assert storage.get('runs/1', data_type='binary') == \
+            (content + '{"loss": 0.1}\n').encode()
+        # plain objects are read as they are
+        storage.append('\ntext', 'plain')
+        assert storage.get('plain') == 'plain\ntext'
+
+        storage.pack(['runs/1'])
+        assert storage.get('runs/1').startswith(content)
+
+        # an object created by append is compressed
+        storage.append(content, 'runs/3')
+        storage.append('{"loss": 0.1}\n', 'runs/3')
+        assert len((work_dir / DIR_NAME / 'runs' / '3').read_bytes()) < 200
+        assert storage.get('runs/3') == content + '{"loss": 0.1}\n'
+
+        # appended by a process which loaded the config before compression
+        storage.save(content, 'runs/2')
+        FileStorage().append('{"loss": 0.1}\n', 'runs/2')
+        old_storage = FileStorage()
+        old_storage.save_config({})
+        old_storage.append('{"loss": 0.2}\n', 'runs/2')
+        assert storage.get('runs/2') == \
+            content + '{"loss": 0.1}\n{"loss": 0.2}\n'
+
+        storage.save('data', 'data')
+        storage.save_config({})
+        assert storage.recompress(['data', 'plain', 'unknown']) == 1
+        assert (work_dir / DIR_NAME / 'data').read_text() == 'data'
+
     def test_file_lock(self, work_dir):
         storage = FileStorage.initialize()
         with storage.lock('lock1'):
@@ -115,3 +277,35 @@ class TestFileStorage:
             image, 'figures/image1.png', data_type='image')
         ret = storage.get('figures/image1.png', data_type='image')
         assert ret.size == image.size
+
+    def test_hash_file(self, work_dir):
+        data = os.urandom(HASH_CHUNK_SIZE * 2 + 10)
+        Path('large.bin').write_bytes(data)
+        assert hash_file('large.bin') == hashlib.sha256(data).hexdigest()
+
+    def test_put_blob(self, work_dir):
+        storage = FileStorage.initialize()
+        Path('a.bin').write_bytes(b'data')
+        Path('b.bin').write_bytes(b'data')
+        digest = storage.put_blob('a.bin')
+        assert storage.put_blob('b.bin') == digest
+        assert storage.put_blob_data(b'data') == digest
+
+        blob_path = storage.blob_path(digest)
+        assert blob_path.read_bytes() == b'data'
+        assert blob_path.relative_to(storage.root).parts == (
+            'blobs', digest[:2], digest[2:])
+        assert [p.name for p in blob_path.parent.iterdir()] == [digest[2:]]
+
+        # the blob is a copy of the file
+        Path('a.bin').unlink()
+        assert blob_path.read_bytes() == b'data'
+
+        with pytest.raises(KeyError):
+            storage.blob_path('0' * 64)
+
+    def test_put_blob_link(self, work_dir):
+        storage = FileStorage.initialize()
+        Path('a.bin').write_bytes(b'data')
+        digest = storage.put_blob('a.bin', link=True)
+        assert os.path.samefile(storage.blob_path(digest), 'a.bin')
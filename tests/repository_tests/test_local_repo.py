@@ -1,12 +1,16 @@
+import json
 import os
+import pickle
 from pathlib import Path
 import shutil
 from tempfile import mkdtemp
+import threading
 
 import pytest
 from PIL import Image
 
 from expnote.run import Run
+from expnote.step_metrics import StepMetrics
 from expnote.note import Table
 from expnote.note import Figure
 from expnote.note import Note
@@ -55,6 +59,162 @@ class TestLocalRepository:
         run2 = repo.get_run(run.id)
         assert run2 == run
 
+    def test_save_get_run_system_metrics(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run(**sample_run_data, system_metrics=[
+            {'time': 0., 'cpu_percent': 50., 'rss': 1000},
+            {'time': 1., 'cpu_percent': 70., 'rss': 2000},
+        ])
+        repo.save_run(run)
+        assert repo.get_run(run.id) == run
+
+    def test_get_run_record_list(self, work_dir):
+        # step metrics stored as a list of dicts are also supported
+        repo = LocalRepository.initialize()
+        repo._storage.save(json.dumps(sample_run_data), repo._run_path('1'))
+        run = repo.get_run('1')
+        assert run.step_metrics == sample_run_data['step_metrics']
+
+    def test_append_step_metrics(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run(**sample_run_data)
+        repo.save_run(run)
+        repo.append_step_metrics(run.id, [
+            (1, {'epoch': 1, 'loss': 1.0}),
+            (0, {'epoch': 0, 'loss': 1.5, 'acc': 0.5}),
+        ])
+        repo.append_step_metrics(run.id, [(2, {'epoch': 2, 'loss': 0.5})])
+
+        # only the run record is updated
+        run.metrics = {'acc': 0.95}
+        repo.save_run(run, include_step_metrics=False)
+
+        run2 = repo.get_run(run.id)
+        assert run2.metrics == {'acc': 0.95}
+        assert run2.step_metrics == [
+            {'epoch': 0, 'loss': 1.5, 'acc': 0.5},
+            {'epoch': 1, 'loss': 1.0},
+            {'epoch': 2, 'loss': 0.5},
+        ]
+
+        # saving the whole run replaces the step log
+        repo.save_run(run2)
+        assert repo.get_run(run.id) == run2
+
+    def test_step_times(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run(**sample_run_data, step_times=[100., 100.5],
+                  timing={'steps_per_sec': 2.})
+        repo.save_run(run)
+        repo.append_step_metrics(run.id, [(2, {'epoch': 2, 'loss': 0.5})],
+                                 times=(2, [101.25]))
+
+        run2 = repo.get_run(run.id)
+        assert run2.step_times == pytest.approx([100., 100.5, 101.25])
+        assert run2.timing == {'steps_per_sec': 2.}
+        assert repo.get_run(run.id, include_step_metrics=False).timing == {
+            'steps_per_sec': 2.}
+
+        # timestamps are delta-encoded in the step log
+        content = repo._storage.get(repo._run_path('1') + '.steps')
+        assert '"deltas": [500000]' in content
+
+    def test_step_columns(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run('1', params={}, metrics={},
+                  step_metrics=[{'epoch': 0, 'loss': 1.5, 'acc': 0.1}],
+                  step_times=[10.])
+        repo.save_run(run)
+        assert repo._storage.get(repo._run_path('1') + '.stepcols',
+                                 data_type='binary').startswith(b'XNSC')
+        repo.append_step_metrics('1', [(1, {'epoch': 1, 'loss': 1.})],
+                                 times=(1, [11.]))
+
+        run2 = repo.get_run('1')
+        # columns are loaded on demand
+        assert run2.step_metrics.series('epoch', 'loss') == ([0, 1],
+                                                             [1.5, 1.])
+        assert '_load' in vars(run2.step_metrics._columns['acc'])
+        assert run2.step_metrics == [{'epoch': 0, 'loss': 1.5, 'acc': 0.1},
+                                     {'epoch': 1, 'loss': 1.}]
+        assert run2.step_times == [10., 11.]
+
+        # the step log saved again without the columns file
+        repo._storage.save(
+            json.dumps({'num_rows': 1, 'columns': {'epoch': [5]}}) + '\n',
+            repo._run_path('1') + '.steps')
+        assert repo.get_run('1').step_metrics == [{'epoch': 5}]
+
+    @pytest.mark.parametrize('codec', [None, 'zlib'])
+    def test_step_columns_log_tail(self, work_dir, codec):
+        repo = LocalRepository.initialize()
+        repo._storage.save_config(dict(repo._storage.config,
+                                       compression=codec))
+        step_metrics = [{'epoch': i, 'loss': 1. / (i + 1)}
+                        for i in range(10000)]
+        repo.save_run(Run('1', params={}, metrics={},
+                          step_metrics=step_metrics))
+        steps_path = repo._run_path('1') + '.steps'
+        size = repo._storage.get_size(steps_path)
+        repo.append_step_metrics('1', [(1, {'loss': 2.})])
+
+        # the saved part of the log is not parsed (only its head is read)
+        file_path = work_dir / '.expnote' / steps_path
+        content = file_path.read_bytes()
+        assert size > 4096
+        file_path.write_bytes(content[:4096] + bytes(size - 4096) +
+                              content[size:])
+        loaded = repo.get_run('1').step_metrics
+        assert len(loaded) == 10000
+        assert loaded[1] == {'epoch': 1, 'loss': 2.}
+
+    def test_step_columns_recompressed(self, work_dir):
+        repo = LocalRepository.initialize()
+        repo.save_run(Run('1', params={}, metrics={},
+                          step_metrics=[{'epoch': 0, 'loss': 1.5}]))
+        repo.append_step_metrics('1', [(1, {'epoch': 1, 'loss': 1.})])
+        # the stored size is changed, so the whole log is parsed
+        repo.migrate_compression('lzma')
+        repo.append_step_metrics('1', [(2, {'epoch': 2})])
+        assert repo.get_run('1').step_metrics == [
+            {'epoch': 0, 'loss': 1.5}, {'epoch': 1, 'loss': 1.},
+            {'epoch': 2}]
+
+    @pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                        reason='requires /proc/self/fd')
+    def test_step_columns_no_open_files(self, work_dir):
+        repo = LocalRepository.initialize()
+        for i in range(20):
+            repo.save_run(Run(str(i), params={}, metrics={},
+                              step_metrics=[{'epoch': 0, 'loss': 1.5}]))
+        num_fds = len(os.listdir('/proc/self/fd'))
+        # loaded runs keep no file open (e.g. for lazily loaded columns)
+        runs = [repo.get_run(str(i)) for i in range(20)]
+        assert len(os.listdir('/proc/self/fd')) <= num_fds
+        assert all(run.step_metrics.series('epoch', 'loss') == ([0], [1.5])
+                   for run in runs)
+
+    def test_append_step_metrics_broken_line(self, work_dir):
+        repo = LocalRepository.initialize()
+        repo.save_run(Run(id='1', params={}, metrics={}))
+        repo.append_step_metrics('1', [(0, {'epoch': 0, 'loss': 1.5})])
+        repo._storage.append('{"row": 1, "da',
+                             repo._run_path('1') + '.steps')
+        assert repo.get_run('1').step_metrics == [{'epoch': 0, 'loss': 1.5}]
+
+    def test_get_run_without_step_metrics(self, work_dir):
+        repo = LocalRepository.initialize()
+        summaries = {'loss': {'last': 1, 'min': 1, 'argmin': 0, 'max': 1,
+                              'argmax': 0, 'mean': 1., 'count': 1}}
+        repo.save_run(Run(id='1', params={}, metrics={},
+                          step_metrics=[{'epoch': 0, 'loss': 1}],
+                          summaries=summaries))
+
+        run = repo.get_run('1', include_step_metrics=False)
+        assert run.step_metrics is None
+        assert run.summaries == summaries
+        assert repo.get_run('1').step_metrics == [{'epoch': 0, 'loss': 1}]
+
     def test_remove_run(self, work_dir):
         repo = LocalRepository.initialize()
         run = Run(**sample_run_data)
@@ -63,9 +223,188 @@ class TestLocalRepository:
         with pytest.raises(KeyError):
             repo.get_run(run.id)
 
+    def test_find_run_ids(self, work_dir):
+        repo = LocalRepository.initialize()
+        for run_id in ['abc1', 'abc2', 'abd1']:
+            repo.save_run(Run(run_id, params={}, metrics={}), rank=0)
+        assert repo.find_run_ids('abc') == ['abc1', 'abc2']
+        assert repo.find_run_ids() == ['abc1', 'abc2', 'abd1']
+
+        # run records are not read
+        repo._storage.save('broken', repo._run_path('abc1', rank=0))
+        assert repo.find_run_ids('abc1') == ['abc1']
+
+        repo.remove_run('abc2')
+        assert repo.find_run_ids('abc') == ['abc1']
+        assert [run.id for run in repo.find_runs('abd')] == ['abd1']
+
+    def test_run_index_built_from_runs(self, work_dir):
+        repo = LocalRepository.initialize()
+        repo.save_run(Run('run1', params={}, metrics={}))
+        repo.save_run(Run('run2', params={}, metrics={}), rank=1)
+
+        # e.g. a repository created before the index was introduced
+        shutil.rmtree(work_dir / '.expnote' / 'index')
+        repo = LocalRepository()
+        assert repo.find_run_ids() == ['run1', 'run2']
+
+    def test_run_index_lock_free(self, work_dir):
+        import sqlite3
+
+        repo = LocalRepository.initialize()
+        repo.save_run(Run('run1', params={}, metrics={}))
+        assert repo.find_run_ids() == ['run1']
+        connection = sqlite3.connect(
+            str(work_dir / '.expnote' / 'index' / 'runs.db'),
+            isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            # saving a run does not wait for the lock of the index
+            repo._index.timeout = 0.1
+            repo.save_run(Run('run2', params={}, metrics={}))
+        finally:
+            connection.execute('ROLLBACK')
+            connection.close()
+        # merged into the index on read
+        assert repo.find_run_ids('run') == ['run1', 'run2']
+        assert repo._storage.glob('index/runs.inbox/*') == []
+
+        repo.save_run(Run('run3', params={}, metrics={}))
+        repo.remove_run('run3')
+        assert repo.find_run_ids('run') == ['run1', 'run2']
+
+    def test_migrate_layout(self, work_dir):
+        # a repository created before the fan-out layout was introduced
+        repo = LocalRepository.initialize()
+        repo._storage.save_config({})
+        repo = LocalRepository()
+        run = Run(**sample_run_data)
+        repo.save_run(run)
+        repo.save_run(Run('abc1', params={}, metrics={}), rank=0)
+        repo.append_step_metrics(run.id, [(1, {'epoch': 1, 'loss': 1.})])
+        assert (work_dir / '.expnote' / 'runs' / run.id).is_file()
+
+        assert repo.migrate_layout() == 4
+        repo = LocalRepository()
+        assert repo._storage.layout == 'fanout'
+        assert not (work_dir / '.expnote' / 'runs' / run.id).exists()
+        assert repo.get_run(run.id).step_metrics == [
+            {'epoch': 0, 'loss': 1.5}, {'epoch': 1, 'loss': 1.}]
+        assert repo.get_run('abc1').id == 'abc1'
+        assert repo.find_run_ids() == [run.id, 'abc1']
+
+    def test_pack_runs(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run(**sample_run_data)
+        repo.save_run(run)
+        repo.save_run(Run('abc1', params={}, metrics={}), rank=0)
+        repo.save_run(Run('abc2', params={}, metrics={},
+                          info={'status': 'running'}))
+
+        assert repo.pack_runs([run.id, 'abc1', 'abc2', 'unknown']) == 4
+        assert repo.pack_runs([run.id]) == 0
+        assert repo._storage.glob('packs/*.idx') != []
+
+        repo = LocalRepository()
+        assert repo.get_run(run.id) == run
+        assert repo.get_run('abc1').id == 'abc1'
+        assert repo.find_runs('abc')[1].id == 'abc2'
+
+        repo.remove_run(run.id)
+        with pytest.raises(KeyError):
+            repo.get_run(run.id)
+        assert repo.get_run('abc1').id == 'abc1'
+
+    def test_pickle_after_packed_read(self, work_dir):
+        repo = LocalRepository.initialize()
+        repo.save_run(Run('r', params={'lr': 0.1}, metrics={}))
+        repo.pack_runs(['r'])
+        assert repo.get_run('r').params == {'lr': 0.1}
+
+        repo = pickle.loads(pickle.dumps(repo))
+        assert repo.get_run('r').params == {'lr': 0.1}
+
+    def test_append_packed_run(self, work_dir):
+        repo = LocalRepository.initialize()
+        repo.save_run(Run('r', params={}, metrics={}, step_metrics=[
+            {'epoch': 0, 'loss': 1.}, {'epoch': 1, 'loss': 0.5}]))
+        repo.pack_runs(['r'])
+        repo.append_step_metrics('r', [(2, {'epoch': 2, 'loss': 0.2})])
+        assert repo.get_run('r').step_metrics == [
+            {'epoch': 0, 'loss': 1.}, {'epoch': 1, 'loss': 0.5},
+            {'epoch': 2, 'loss': 0.2}]
+
+    def test_migrate_compression(self, work_dir):
+        repo = LocalRepository.initialize()
+        run = Run(**sample_run_data, info={'status': 'complete'})
+        repo.save_run(run)
+        exp = repo.save_experiment(Experiment('title', run_ids=[run.id]))
+        with repo.open_workspace() as workspace:
+            workspace.add_untracked_run(run.id)
+
+        # records, step logs, an experiment, a params index and a workspace
+        assert repo.migrate_compression('zlib') == 5
+        assert repo.migrate_compression('zlib') == 0
+        content = (work_dir / '.expnote' / repo._run_path(run.id)).read_bytes()
+        assert content.startswith(b'\x1f\x8b')
+
+        repo = LocalRepository()
+        assert repo.get_run(run.id) == run
+        assert repo.get_experiment(exp.id).run_ids == [run.id]
+        assert [r.id for r in repo.find_runs_by_params(run.params)] == [run.id]
+        with repo.open_workspace() as workspace:
+            assert workspace.untracked_runs == [run.id]
+
+        repo.append_step_metrics(run.id, [(1, {'epoch': 1})])
+        assert repo.migrate_compression(None) == 5
+        assert len(repo.get_run(run.id).step_metrics) == 2
+
+        with pytest.raises(ValueError):
+            repo.migrate_compression('unknown')
+
+    def test_find_runs_by_params(self, work_dir):
+        repo = LocalRepository.initialize()
+        params = {'lr': 0.1, 'model': {'depth': 18, 'size': (224, 224)}}
+        repo.save_run(Run('run1', params=params, metrics={},
+                          info={'status': 'running'}))
+        assert repo.find_runs_by_params(params) == []
+
+        repo.save_run(Run('run1', params=params, metrics={'acc': 0.9},
+                          info={'status': 'complete'}))
+        repo.save_run(Run('run2', params={'lr': 0.2}, metrics={},
+                          info={'status': 'complete'}))
+        # the key order does not matter
+        same_params = {'model': {'size': [224, 224], 'depth': 18}, 'lr': 0.1}
+        found = repo.find_runs_by_params(same_params)
+        assert [run.id for run in found] == ['run1']
+        assert found[0].metrics == {'acc': 0.9}
+
+        repo.remove_run('run1')
+        assert repo.find_runs_by_params(params) == []
+
+    def test_artifacts(self, work_dir):
+        repo = LocalRepository.initialize()
+        Path('model.bin').write_bytes(b'weights')
+        ref = repo.save_blob('model.bin')
+        assert ref['size'] == 7
+        assert repo.save_blob_data(b'weights') == ref
+
+        run = Run(**sample_run_data, artifacts={'model.bin': ref})
+        repo.save_run(run)
+        run2 = repo.get_run(run.id)
+        assert run2.artifacts == {'model.bin': ref}
+        assert repo.get_blob(ref['digest']) == b'weights'
+        with pytest.raises(KeyError):
+            repo.get_blob('0' * 64)
+
+        # blobs can be shared by runs
+        repo.remove_run(run.id)
+        assert repo.get_blob(ref['digest']) == b'weights'
+
     def test_find_runs(self, work_dir):
         repo = LocalRepository.initialize()
-        repo.save_run(Run(id='a111', params={}, metrics={}))
+        repo.save_run(Run(id='a111', params={}, metrics={},
+                          step_metrics=[{'epoch': 0}]))
         repo.save_run(Run(id='a222', params={}, metrics={}))
         repo.save_run(Run(id='b333', params={}, metrics={}))
 
@@ -80,6 +419,161 @@ class TestLocalRepository:
         assert len(ret) == 2
         assert set(r.id for r in ret) == set(('a111', 'a222'))
 
+    def test_shards(self, work_dir):
+        repo = LocalRepository.initialize()
+        for rank in range(2):
+            repo.save_run(Run(
+                id='run1',
+                params={'lr': 0.1, 'rank': rank},
+                metrics={'loss': 1. + rank, 'acc': 0.5},
+                step_metrics=[{'epoch': 0, 'loss': 2. + rank},
+                              {'epoch': 1, 'loss': 1. + rank}],
+                info={'status': ['complete', 'failed'][rank]},
+            ), rank=rank)
+        repo.append_step_metrics('run1', [(2, {'epoch': 2, 'loss': 0.})],
+                                 rank=1)
+
+        run = repo.get_run('run1')
+        assert run.id == 'run1'
+        assert run.params == {'lr': 0.1, 'rank': 0.5}
+        assert run.metrics == {'loss': 1.5, 'acc': 0.5}
+        assert run.step_metrics == [
+            {'epoch': 0, 'loss': 2.5},
+            {'epoch': 1, 'loss': 1.5},
+            {'epoch': 2, 'loss': 0.},
+        ]
+        assert run.info == {'status': 'failed'}
+        assert run.shards is None
+
+        run = repo.get_run('run1', ranks='separate')
+        assert run.metrics == {}
+        assert list(run.shards.keys()) == [0, 1]
+        assert run.shards[1].metrics == {'loss': 2., 'acc': 0.5}
+        assert len(run.shards[1].step_metrics) == 3
+
+        assert [r.id for r in repo.find_runs('run')] == ['run1']
+        repo.remove_run('run1')
+        assert repo.find_runs('') == []
+        with pytest.raises(KeyError):
+            repo.get_run('run1')
+
+    def test_shards_different_steps(self, work_dir):
+        repo = LocalRepository.initialize()
+        epochs_list = [[0, 2], [0, 1, 2]]
+        for rank, epochs in enumerate(epochs_list):
+            repo.save_run(Run(
+                id='run1',
+                params={},
+                metrics={},
+                step_metrics=[{'epoch': e, 'iteration': e * 10 + rank,
+                               'loss': e + rank}
+                              for e in epochs],
+            ), rank=rank)
+
+        # rows are matched by the step key, which is never averaged
+        assert repo.get_run('run1').step_metrics == [
+            {'epoch': 0, 'iteration': 0, 'loss': 0.5},
+            {'epoch': 1, 'iteration': 11, 'loss': 2},
+            {'epoch': 2, 'iteration': 20, 'loss': 2.5},
+        ]
+
+    def test_shards_summaries(self, work_dir):
+        repo = LocalRepository.initialize()
+        losses_list = [[1, 2, 3, 4, 5], [3, 2, 1, 0, -1]]
+        for rank, losses in enumerate(losses_list):
+            step_metrics = StepMetrics([{'epoch': e, 'loss': loss}
+                                        for e, loss in enumerate(losses)])
+            repo.save_run(Run(
+                id='run1',
+                params={},
+                metrics={},
+                step_metrics=step_metrics,
+                summaries=step_metrics.summarize('epoch'),
+                step_keys=['epoch'],
+            ), rank=rank)
+
+        # recomputed from the merged curve
+        run = repo.get_run('run1')
+        assert run.step_metrics.series('epoch', 'loss')[1] == [2.] * 5
+        assert run.summaries == {'loss': {
+            'last': 2., 'min': 2., 'argmin': 0, 'max': 2., 'argmax': 0,
+            'mean': 2., 'count': 5}}
+
+        # combined field by field without step metrics
+        run = repo.get_run('run1', include_step_metrics=False)
+        assert run.summaries == {'loss': {
+            'last': 2., 'min': -1, 'argmin': 4, 'max': 5, 'argmax': 4,
+            'mean': 2., 'count': 10}}
+
+    def test_shards_recorded_step_key(self, work_dir):
+        repo = LocalRepository.initialize()
+        steps_list = [[0, 200], [0, 100, 200]]
+        for rank, steps in enumerate(steps_list):
+            repo.save_run(Run(
+                id='run1',
+                params={},
+                metrics={},
+                step_metrics=[{'global_step': s, 'loss': s + rank}
+                              for s in steps],
+                step_keys=['global_step'],
+            ), rank=rank)
+
+        # the step key used to record the shards is not averaged
+        run = repo.get_run('run1')
+        assert run.step_metrics == [
+            {'global_step': 0, 'loss': 0.5},
+            {'global_step': 100, 'loss': 101},
+            {'global_step': 200, 'loss': 200.5},
+        ]
+        assert run.step_keys == ['global_step']
+
+    def test_recover_shards(self, work_dir):
+        repo = LocalRepository.initialize()
+        for rank in range(2):
+            with pytest.raises(RuntimeError):
+                with repo.open_wal('run1', rank=rank) as wal:
+                    wal.write({'op': 'params', 'data': {'rank': rank}})
+                    raise RuntimeError()
+
+        assert repo.recover_runs() == ['run1']
+        run = repo.get_run('run1', ranks='separate')
+        assert run.shards[0].params == {'rank': 0}
+        assert run.shards[1].params == {'rank': 1}
+        with repo.open_workspace() as ws:
+            assert ws.untracked_runs == ['run1']
+
+    def test_open_wal(self, work_dir):
+        repo = LocalRepository.initialize()
+        with repo.open_wal('run1') as wal:
+            wal.write({'op': 'params', 'data': {'lr': 0.1}})
+            # locked by the writer
+            assert repo.recover_runs() == []
+        # removed after the normal exit
+        assert repo._storage.glob('wal/*') == []
+
+        # removed after the run data is saved, even with an exception
+        with pytest.raises(RuntimeError):
+            with repo.open_wal('run2') as wal:
+                wal.mark_saved()
+                raise RuntimeError()
+        assert repo._storage.glob('wal/*') == []
+
+    def test_recover_runs(self, work_dir):
+        repo = LocalRepository.initialize()
+        with pytest.raises(RuntimeError):
+            with repo.open_wal('run1') as wal:
+                wal.write({'op': 'info', 'data': {'status': 'running'}})
+                wal.write({'op': 'params', 'data': {'lr': 0.1}})
+                raise RuntimeError()
+
+        assert repo.recover_runs() == ['run1']
+        run = repo.get_run('run1')
+        assert run.params == {'lr': 0.1}
+        assert run.info['status'] == 'interrupted'
+        with repo.open_workspace() as ws:
+            assert ws.untracked_runs == ['run1']
+        assert repo.recover_runs() == []
+
     def test_save_get_experiment(self, work_dir):
         repo = LocalRepository.initialize()
 
@@ -152,6 +646,46 @@ class TestLocalRepository:
             assert workspace.uncommitted_experiments == ['0']
             assert workspace.assigned_runs == {'0': ['run1']}
 
+    def test_register_run(self, work_dir):
+        repo = LocalRepository.initialize()
+        with repo.open_workspace() as workspace:
+            workspace.add_untracked_run('run1')
+
+        repo.register_run('run2')
+        repo.register_run('run3')
+        assert len(repo._storage.glob('workspaces/default.inbox/*')) == 2
+
+        with repo.open_workspace() as workspace:
+            assert workspace.untracked_runs == ['run1', 'run2', 'run3']
+        assert repo._storage.glob('workspaces/default.inbox/*') == []
+        # kept for runs registered concurrently
+        inbox_dir = work_dir / '.expnote' / 'workspaces' / 'default.inbox'
+        assert inbox_dir.is_dir()
+
+        with repo.open_workspace() as workspace:
+            assert workspace.untracked_runs == ['run1', 'run2', 'run3']
+
+    def test_register_run_concurrent(self, work_dir):
+        repo = LocalRepository.initialize()
+        run_ids = ['run{}'.format(i) for i in range(200)]
+
+        def register(ids):
+            for run_id in ids:
+                repo.register_run(run_id)
+
+        threads = [threading.Thread(target=register, args=(run_ids[i::4],))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            with repo.open_workspace():
+                pass
+        for thread in threads:
+            thread.join()
+
+        with repo.open_workspace() as workspace:
+            assert sorted(workspace.untracked_runs) == sorted(run_ids)
+
 
 class TestFileNameAssigner:
 
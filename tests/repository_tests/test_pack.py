@@ -0,0 +1,53 @@
+import pytest
+
+from expnote.repository.pack import PackSet
+from expnote.repository.pack import match_path
+from expnote.repository.pack import write_pack
+
+
+class TestPackSet:
+
+    def test(self, tmp_path):
+        write_pack(tmp_path, '01', [('runs/a', b'a1'), ('runs/b', b'b1'),
+                                    ('runs/empty', b'')])
+        packs = PackSet(tmp_path)
+        packs.refresh()
+        assert packs.get('runs/a') == b'a1'
+        assert packs.get('runs/empty') == b''
+        assert packs.get('runs/c') is None
+
+        # the newer pack is used
+        write_pack(tmp_path, '02', [('runs/a', b'a2'), ('runs/c', b'c2')])
+        packs.refresh()
+        assert packs.get('runs/a') == b'a2'
+        assert packs.find('runs/b') == '01'
+        assert sorted(packs.glob('runs/*')) == [
+            'runs/a', 'runs/b', 'runs/c', 'runs/empty']
+
+        assert packs.remove('runs/c')
+        assert not packs.remove('runs/c')
+        packs.refresh()
+        assert packs.get('runs/c') is None
+        assert packs.get('runs/a') == b'a2'
+
+        packs.rename({'runs/b': 'runs/x/b'})
+        packs.refresh()
+        assert packs.get('runs/x/b') == b'b1'
+        assert packs.get('runs/b') is None
+
+    def test_remove_pack(self, tmp_path):
+        write_pack(tmp_path, '01', [('runs/a', b'a1')])
+        packs = PackSet(tmp_path)
+        packs.refresh()
+        assert packs.get('runs/a') == b'a1'
+        packs.remove('runs/a')
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize('obj_path, pattern, expected', [
+        ('runs/abc', 'runs/a*', True),
+        ('runs/ab/cd/abc', 'runs/*/*/abc*', True),
+        ('runs/ab/cd/abc', 'runs/*', False),
+        ('runs/abc.steps', 'runs/abc', False),
+    ])
+    def test_match_path(self, obj_path, pattern, expected):
+        assert match_path(obj_path, pattern) == expected
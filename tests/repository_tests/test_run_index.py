@@ -0,0 +1,70 @@
+import threading
+
+from expnote.repository.run_index import RunIndex
+
+
+class TestRunIndex:
+
+    def test(self, tmp_path):
+        index = RunIndex(tmp_path / 'runs.db', lambda: [])
+        for run_id in ['abc', 'abd', 'b12', 'ab']:
+            index.add(run_id)
+        index.add('abc')
+        assert index.find() == ['ab', 'abc', 'abd', 'b12']
+        assert index.find('ab') == ['ab', 'abc', 'abd']
+        assert index.find('abc') == ['abc']
+        assert index.find('c') == []
+
+        index.remove('abc')
+        index.remove('unknown')
+        assert index.find('ab') == ['ab', 'abd']
+
+    def test_add_many(self, tmp_path):
+        index = RunIndex(tmp_path / 'runs.db', lambda: ['abc'])
+        index.add_many(['b12', 'abc', 'abd'])
+        assert index.find() == ['abc', 'abd', 'b12']
+
+    def test_build(self, tmp_path):
+        scanned = []
+
+        def list_run_ids():
+            scanned.append(True)
+            return ['run1', 'run2']
+
+        index = RunIndex(tmp_path / 'runs.db', list_run_ids)
+        assert index.find() == ['run1', 'run2']
+
+        # the index is built only once
+        index2 = RunIndex(tmp_path / 'runs.db', list_run_ids)
+        index2.add('run3')
+        assert index2.find('run') == ['run1', 'run2', 'run3']
+        assert len(scanned) == 1
+
+    def test_built_without_write_lock(self, tmp_path):
+        import sqlite3
+
+        RunIndex(tmp_path / 'runs.db', lambda: ['run1']).find()
+        connection = sqlite3.connect(str(tmp_path / 'runs.db'),
+                                     isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            # a built index is opened while another process is writing
+            index = RunIndex(tmp_path / 'runs.db', lambda: [], timeout=0.1)
+            assert index.find() == ['run1']
+        finally:
+            connection.execute('ROLLBACK')
+            connection.close()
+
+    def test_threads(self, tmp_path):
+        index = RunIndex(tmp_path / 'runs.db', lambda: [])
+
+        def add(i):
+            for j in range(20):
+                index.add('{}_{}'.format(i, j))
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(index.find()) == 80
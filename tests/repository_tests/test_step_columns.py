@@ -0,0 +1,43 @@
+import pytest
+
+from expnote.step_metrics import StepMetrics
+from expnote.repository.step_columns import decode_step_columns
+from expnote.repository.step_columns import encode_step_columns
+from expnote.repository.step_columns import read_header
+
+
+class TestStepColumns:
+
+    def test(self):
+        step_metrics = StepMetrics([
+            {'epoch': 0, 'loss': 1.5, 'name': 'a'},
+            {'epoch': 1, 'flag': True},
+            {'epoch': 2, 'loss': 0.5, 'big': 2 ** 70},
+        ])
+        stamp = {'size': 3, 'generation': 'abc', 'codec': None}
+        data = encode_step_columns(step_metrics, [10., 10.5, 11.], stamp)
+        header, decoded, times = decode_step_columns(data)
+        assert header['log'] == stamp
+        assert decoded == step_metrics
+        assert decoded.keys() == step_metrics.keys()
+        assert times == [10., 10.5, 11.]
+
+        # decoded columns can be updated
+        decoded.set('epoch', 3, {'loss': 0.1})
+        assert decoded[-1] == {'epoch': 3, 'loss': 0.1}
+
+    def test_lazy(self):
+        step_metrics = StepMetrics([{'epoch': i, 'loss': float(i)}
+                                    for i in range(10)])
+        data = encode_step_columns(step_metrics, None, {})
+        _, decoded, times = decode_step_columns(memoryview(data))
+        assert times is None
+        assert decoded.series(None, 'loss')[1] == [float(i)
+                                                   for i in range(10)]
+        # the other columns are not loaded
+        assert '_load' in vars(decoded._columns['epoch'])
+        assert '_load' not in vars(decoded._columns['loss'])
+
+    def test_not_step_columns(self):
+        with pytest.raises(ValueError):
+            read_header(b'{"num_rows": 1}')
@@ -0,0 +1,103 @@
+import json
+
+from expnote.repository.wal import WriteAheadLog
+from expnote.repository.wal import replay_wal
+
+
+class TestWriteAheadLog:
+
+    def test(self, tmp_path):
+        with open(tmp_path / 'wal', 'a') as f:
+            wal = WriteAheadLog(f, sync_interval=0)
+            wal.write({'op': 'params', 'data': {'lr': 0.1}})
+            wal.write({'op': 'metrics_batch', 'data': {'loss': range(2)},
+                       'steps': (range(2), 'epoch')})
+
+            # synced without closing the file
+            lines = (tmp_path / 'wal').read_text().splitlines()
+            assert json.loads(lines[0]) == {'op': 'params',
+                                            'data': {'lr': 0.1}}
+            assert json.loads(lines[1])['steps'] == [[0, 1], 'epoch']
+
+
+class TestReplayWal:
+
+    def test(self):
+        entries = [
+            {'op': 'info', 'data': {'start_time': 'time', 'status': 'running'}},
+            {'op': 'params', 'data': {'lr': 0.1}},
+            {'op': 'params', 'data': {'lr': 0.1, 'wd': 0.01}},
+            {'op': 'metrics', 'data': {'acc': 0.9}, 'step': None},
+            {'op': 'metrics', 'data': {'loss': 3}, 'step': [0, 'epoch']},
+            {'op': 'metrics', 'data': {'acc': 0.1}, 'step': [0, 'epoch']},
+            {'op': 'metrics_batch', 'data': {'loss': [2, 1]},
+             'steps': [[1, 2], 'epoch']},
+            {'op': 'system_metrics', 'data': {'time': 1., 'rss': 100}},
+        ]
+        content = ''.join(json.dumps(e) + '\n' for e in entries)
+        content += '{"op": "metrics", "da'  # broken line
+
+        run = replay_wal('run1', content)
+        assert run.id == 'run1'
+        assert run.params == {'lr': 0.1, 'wd': 0.01}
+        assert run.metrics == {'acc': 0.9}
+        assert run.step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.1},
+            {'epoch': 1, 'loss': 2},
+            {'epoch': 2, 'loss': 1},
+        ]
+        assert run.info == {'start_time': 'time', 'status': 'interrupted'}
+        assert run.system_metrics == [{'time': 1., 'rss': 100}]
+        assert run.summaries['loss'] == {
+            'last': 1, 'min': 1, 'argmin': 2, 'max': 3, 'argmax': 0,
+            'mean': 2., 'count': 3}
+        # the run is built by a memory as it is saved while recording
+        assert run.step_keys == ['epoch']
+
+    def test_summaries_overwritten(self):
+        entries = [
+            {'op': 'metrics', 'data': {'loss': 3}, 'step': [0, 'epoch']},
+            {'op': 'metrics', 'data': {'loss': 1}, 'step': [0, 'epoch']},
+            {'op': 'metrics_batch', 'data': {'loss': [2, 4]},
+             'steps': [[1, 1], 'epoch']},
+        ]
+        content = ''.join(json.dumps(e) + '\n' for e in entries)
+        assert replay_wal('run1', content).summaries['loss'] == {
+            'last': 4, 'min': 1, 'argmin': 0, 'max': 4, 'argmax': 1,
+            'mean': 2.5, 'count': 2}
+
+    def test_timing(self):
+        entries = [
+            {'op': 'metrics', 'data': {'loss': 3}, 'step': [0, 'step'],
+             'time': 10.},
+            {'op': 'metrics', 'data': {'acc': 0.1}, 'step': [0, 'step'],
+             'time': 11.},
+            {'op': 'metrics_batch', 'data': {'loss': [2, 1]},
+             'steps': [[1, 2], 'step'], 'time': 12.},
+            {'op': 'timer', 'name': 'data', 'seconds': 0.5},
+        ]
+        content = ''.join(json.dumps(e) + '\n' for e in entries)
+
+        run = replay_wal('run1', content)
+        assert run.step_times == [10., 12., 12.]
+        assert run.timing == {
+            'steps_per_sec': 1.,
+            'sections': {'data': {'total': 0.5, 'count': 1}},
+        }
+
+    def test_artifact(self):
+        ref = {'digest': 'abc', 'size': 1}
+        entries = [
+            {'op': 'artifact', 'name': 'model', 'ref': {'digest': 'x'}},
+            {'op': 'artifact', 'name': 'model', 'ref': ref},
+        ]
+        content = ''.join(json.dumps(e) + '\n' for e in entries)
+        assert replay_wal('run1', content).artifacts == {'model': ref}
+
+    def test_finished(self):
+        entries = [
+            {'op': 'info', 'data': {'status': 'running'}},
+            {'op': 'info', 'data': {'status': 'failed'}},
+        ]
+        content = ''.join(json.dumps(e) + '\n' for e in entries)
+        assert replay_wal('run1', content).info['status'] == 'failed'
@@ -0,0 +1,210 @@
+import pytest
+
+from expnote.step_metrics import Column
+from expnote.step_metrics import MetricSummary
+from expnote.step_metrics import StepMetrics
+from expnote.step_metrics import as_step_metrics
+
+
+class TestColumn:
+
+    def test_typecode(self):
+        column = Column()
+        column.set(0, 1)
+        assert column.typecode == 'q'
+        column.set(1, 0.5)
+        assert column.typecode == 'd'
+        assert column.get(0) == 1
+        column.set(2, 'text')
+        assert column.typecode == 'O'
+        assert [column.get(i) for i in range(3)] == [1, 0.5, 'text']
+
+    def test_overflow(self):
+        column = Column()
+        column.set(0, 2 ** 70)
+        assert column.typecode == 'O'
+        assert column.get(0) == 2 ** 70
+
+    def test_missing_values(self):
+        column = Column('d')
+        column.set(3, 0.5)
+        assert len(column) == 4
+        assert column.get(0) is None
+        assert column.get(3) == 0.5
+        assert column.get(10, default=-1) == -1
+
+    def test_from_values(self):
+        column = Column.from_values([1, None, 3])
+        assert column.typecode == 'q'
+        assert [column.get(i) for i in range(3)] == [1, None, 3]
+
+
+class TestStepMetrics:
+
+    def test_list_like(self):
+        records = [
+            {'epoch': 0, 'loss': 3.},
+            {'epoch': 1, 'loss': 2., 'acc': 0.5},
+            {'epoch': 2, 'acc': 0.7},
+        ]
+        step_metrics = StepMetrics(records)
+        assert len(step_metrics) == 3
+        assert step_metrics[0] == records[0]
+        assert step_metrics[-1] == records[-1]
+        assert step_metrics[1:] == records[1:]
+        assert list(step_metrics) == records
+        assert step_metrics == records
+        assert step_metrics != records[:2]
+        with pytest.raises(IndexError):
+            step_metrics[3]
+
+    def test_read_only_rows(self):
+        import json
+
+        records = [{'epoch': 0, 'loss': 3.}, {'epoch': 1}]
+        step_metrics = StepMetrics(records)
+        # rows are views, so updates are not lost silently
+        with pytest.raises(TypeError):
+            step_metrics[0]['loss'] = 1.
+        step_metrics.set('epoch', 0, {'loss': 1.})
+        assert step_metrics[0]['loss'] == 1.
+
+        rows = step_metrics.tolist()
+        assert rows == [{'epoch': 0, 'loss': 1.}, {'epoch': 1}]
+        assert json.loads(json.dumps(rows)) == rows
+        rows[0]['loss'] = 2.
+        assert step_metrics[0]['loss'] == 1.
+
+    def test_keys_column_series(self):
+        step_metrics = StepMetrics([
+            {'epoch': 0, 'loss': 3.},
+            {'epoch': 1, 'acc': 0.5},
+            {'epoch': 2, 'loss': 1., 'acc': 0.7},
+        ])
+        assert step_metrics.keys() == ['epoch', 'loss', 'acc']
+        assert step_metrics.column('acc') == [None, 0.5, 0.7]
+        assert step_metrics.column('lr') == [None, None, None]
+        assert step_metrics.series('epoch', 'loss') == ([0, 2], [3., 1.])
+        assert step_metrics.series(None, 'acc') == ([1, 2], [0.5, 0.7])
+        assert step_metrics.series('epoch', 'lr') == ([], [])
+
+    def test_set(self):
+        step_metrics = StepMetrics()
+        step_metrics.set('epoch', 0, {'loss': 3})
+        step_metrics.set('epoch', 1, {'loss': 2})
+        step_metrics.set('epoch', 0, {'acc': 0.5})
+        assert step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.5},
+            {'epoch': 1, 'loss': 2},
+        ]
+
+    def test_set_after_append(self):
+        step_metrics = StepMetrics([{'epoch': 0, 'loss': 3}])
+        step_metrics.set('epoch', 0, {'acc': 0.5})
+        step_metrics.append({'epoch': 1, 'loss': 2})
+        step_metrics.set('epoch', 1, {'acc': 0.7})
+        assert step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.5},
+            {'epoch': 1, 'loss': 2, 'acc': 0.7},
+        ]
+
+    def test_to_dict_from_dict(self):
+        step_metrics = StepMetrics([
+            {'epoch': 0, 'loss': 3.},
+            {'epoch': 1, 'acc': 0.5},
+        ])
+        data = step_metrics.to_dict()
+        assert data == {
+            'num_rows': 2,
+            'columns': {
+                'epoch': [0, 1],
+                'loss': [3., None],
+                'acc': [None, 0.5],
+            }
+        }
+        assert StepMetrics.from_dict(data) == step_metrics
+
+
+def test_as_step_metrics():
+    step_metrics = StepMetrics()
+    assert as_step_metrics(step_metrics) is step_metrics
+    assert as_step_metrics([{'epoch': 0}]) == [{'epoch': 0}]
+
+
+class TestStepMetricsBatch:
+
+    def test_new_steps(self):
+        step_metrics = StepMetrics([{'epoch': 0, 'loss': 3}])
+        indices = step_metrics.set_batch('epoch', [1, 2, 3], {
+            'loss': [2, 1, 0],
+            'acc': [0.5, 0.6, None],
+        })
+        assert indices == [1, 2, 3]
+        assert step_metrics == [
+            {'epoch': 0, 'loss': 3},
+            {'epoch': 1, 'loss': 2, 'acc': 0.5},
+            {'epoch': 2, 'loss': 1, 'acc': 0.6},
+            {'epoch': 3, 'loss': 0},
+        ]
+
+    def test_existing_steps(self):
+        step_metrics = StepMetrics()
+        step_metrics.set('epoch', 0, {'loss': 3})
+        indices = step_metrics.set_batch('epoch', [1, 0, 1], {
+            'acc': [0.5, 0.4, 0.6],
+        })
+        assert indices == [1, 0, 1]
+        assert step_metrics == [
+            {'epoch': 0, 'loss': 3, 'acc': 0.4},
+            {'epoch': 1, 'acc': 0.6},
+        ]
+        step_metrics.set('epoch', 1, {'loss': 2})
+        assert step_metrics[1] == {'epoch': 1, 'acc': 0.6, 'loss': 2}
+
+    def test_numpy(self):
+        np = pytest.importorskip('numpy')
+        step_metrics = StepMetrics()
+        step_metrics.set_batch('step', np.arange(3), {
+            'loss': np.array([1., 0.5, 0.25], dtype=np.float32),
+        })
+        assert step_metrics == [
+            {'step': 0, 'loss': 1.},
+            {'step': 1, 'loss': 0.5},
+            {'step': 2, 'loss': 0.25},
+        ]
+        assert type(step_metrics[0]['step']) == int
+
+    def test_length_mismatch(self):
+        step_metrics = StepMetrics()
+        with pytest.raises(ValueError):
+            step_metrics.set_batch('step', [0, 1], {'loss': [1.]})
+
+
+class TestMetricSummary:
+
+    def test(self):
+        summary = MetricSummary()
+        assert summary.to_dict()['mean'] is None
+
+        for step, value in enumerate([2, 1, 'a', float('nan'), 3.]):
+            summary.update(value, step)
+        data = summary.to_dict()
+        assert data == {'last': 3., 'min': 1, 'argmin': 1, 'max': 3.,
+                        'argmax': 4, 'mean': 2., 'count': 3}
+
+        summary = MetricSummary.from_dict(data)
+        summary.update_batch([6], [5])
+        assert summary.to_dict()['mean'] == 3.
+        assert summary.to_dict()['argmax'] == 5
+
+    def test_summarize(self):
+        sm = StepMetrics([{'epoch': 0, 'loss': 3},
+                          {'epoch': 1, 'loss': 1},
+                          {'epoch': 2, 'acc': 0.5}])
+        assert sm.summarize('epoch') == {
+            'loss': {'last': 1, 'min': 1, 'argmin': 1, 'max': 3,
+                     'argmax': 0, 'mean': 2., 'count': 2},
+            'acc': {'last': 0.5, 'min': 0.5, 'argmin': 2, 'max': 0.5,
+                    'argmax': 2, 'mean': 0.5, 'count': 1},
+        }
+        assert sm.summarize()['loss']['argmin'] == 1
@@ -0,0 +1,36 @@
+import pytest
+
+from expnote.step_times import decode_times
+from expnote.step_times import encode_times
+from expnote.step_times import steps_per_sec
+from expnote.step_times import throughput_series
+
+
+class TestEncodeTimes:
+
+    def test(self):
+        times = [1700000000.123456, 1700000000.623456, 1700000001.623457]
+        data = encode_times(times)
+        assert data == {'start': times[0], 'deltas': [500000, 1000001]}
+        assert decode_times(data) == pytest.approx(times, abs=1e-6)
+
+    def test_no_drift(self):
+        times = [1700000000. + i / 3 for i in range(1000)]
+        decoded = decode_times(encode_times(times))
+        assert decoded[-1] == pytest.approx(times[-1], abs=1e-6)
+
+    def test_empty(self):
+        assert decode_times(encode_times([])) == []
+
+
+class TestStepsPerSec:
+
+    def test(self):
+        assert steps_per_sec([10., 10.5, 11., 11.5]) == 2.
+        assert steps_per_sec([10.]) is None
+        assert steps_per_sec([10., 10.]) is None
+
+    def test_throughput_series(self):
+        times = [0., 1., 1.5, 2., 4.]
+        assert throughput_series(times, window=2) == [
+            None, 1., 4 / 3, 2., 2 / 2.5]